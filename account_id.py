@@ -0,0 +1,122 @@
+import hashlib
+from functools import lru_cache
+
+import numpy as np
+
+# XRPLのbase58アルファベット（Bitcoinとは並びが違う）
+ALPHABET = "rpshnaf39wBUDNEGHJKLM4PQRST7VWXYZ2bcdeCg65jkm8oFqi1tuvAxyz"
+_INDEX = {char: index for index, char in enumerate(ALPHABET)}
+
+ACCOUNT_ID_SIZE = 20
+_ACCOUNT_VERSION = b'\x00'   # クラシックアドレスの種別バイト（先頭の 'r' になる）
+
+def _checksum(payload: bytes) -> bytes:
+    return hashlib.sha256(hashlib.sha256(payload).digest()).digest()[:4]
+
+@lru_cache(maxsize=1 << 20)
+def decode_account_id(address: str) -> bytes:
+    """20-byte AccountID of a classic address ('rHb9CJ...' -> b'\\xb5\\xf7...'), checksum verified"""
+    number = 0
+    for char in address:
+        index = _INDEX.get(char)
+        if index is None:
+            raise ValueError(f"Invalid character in XRPL address: {address!r}")
+        number = number * 58 + index
+    # 先頭の 'r'（値0）は種別バイト0x00に対応する
+    zeros = len(address) - len(address.lstrip(ALPHABET[0]))
+    body = number.to_bytes((number.bit_length() + 7) // 8, 'big')
+    decoded = b'\x00' * zeros + body
+    if len(decoded) != 1 + ACCOUNT_ID_SIZE + 4 or decoded[:1] != _ACCOUNT_VERSION:
+        raise ValueError(f"Not a classic XRPL address: {address!r}")
+    payload, checksum = decoded[:-4], decoded[-4:]
+    if _checksum(payload) != checksum:
+        raise ValueError(f"Bad checksum in XRPL address: {address!r}")
+    return payload[1:]
+
+@lru_cache(maxsize=1 << 16)
+def encode_account_id(account_id: bytes) -> str:
+    """Classic address of a 20-byte AccountID (inverse of decode_account_id)"""
+    if len(account_id) != ACCOUNT_ID_SIZE:
+        raise ValueError(f"AccountID must be {ACCOUNT_ID_SIZE} bytes, got {len(account_id)}")
+    payload = _ACCOUNT_VERSION + account_id
+    data = payload + _checksum(payload)
+    number = int.from_bytes(data, 'big')
+    chars = []
+    while number:
+        number, remainder = divmod(number, 58)
+        chars.append(ALPHABET[remainder])
+    zeros = len(data) - len(data.lstrip(b'\x00'))
+    return ALPHABET[0] * zeros + ''.join(reversed(chars))
+
+# 文字コード -> base58の桁の値（アルファベット外は255）
+_DIGITS = np.full(128, 255, dtype=np.uint8)
+_DIGITS[[ord(char) for char in ALPHABET]] = np.arange(len(ALPHABET), dtype=np.uint8)
+
+_DECODED_SIZE = 1 + ACCOUNT_ID_SIZE + 4   # 種別 + AccountID + チェックサム
+_LIMBS = 7                                # 25バイトを32ビットのリム7つで持つ（上位3バイトは0）
+_DIGITS_PER_STEP = 5                      # 58**5 * 2**32 < 2**64
+
+def account_id_array(addresses) -> np.ndarray:
+    """Fixed-width S20 array of AccountIDs for a sequence of classic addresses
+
+    Decodes the whole array with numpy (five base58 digits per step on
+    32-bit limbs) instead of one address at a time; only the checksums are
+    hashed per row. Raises ValueError if any address is invalid.
+    """
+    addresses = np.asarray(addresses, dtype=str)
+    count = len(addresses)
+    if count == 0:
+        return np.empty(0, dtype=f'S{ACCOUNT_ID_SIZE}')
+
+    # 短いアドレスは右詰めにし、左側を値0の桁で埋める
+    width = addresses.dtype.itemsize // 4
+    codes = addresses.view(np.uint32).reshape(count, width)
+    lengths = np.count_nonzero(codes, axis=1)
+    columns = np.arange(width) - (width - lengths)[:, None]
+    padded = columns < 0
+    codes = np.take_along_axis(codes, np.maximum(columns, 0), axis=1)
+    digits = np.where(codes < 128, _DIGITS[np.minimum(codes, 127)], 255)
+    digits[padded] = 0
+    invalid = (digits == 255).any(axis=1)
+    digits[digits == 255] = 0
+    # 先頭の 'r'（値0の桁）の数。右詰めの埋め草は数えない
+    leading_zero_digits = (digits != 0).argmax(axis=1) - (width - lengths)
+
+    # 桁を上位から5つずつ取り込み、リムごとに繰り上げる
+    limbs = np.zeros((_LIMBS, count), dtype=np.uint64)
+    extra = (-width) % _DIGITS_PER_STEP
+    digits = np.ascontiguousarray(np.hstack([np.zeros((count, extra), dtype=np.uint8), digits]).T)
+    for start in range(0, len(digits), _DIGITS_PER_STEP):
+        carry = np.zeros(count, dtype=np.uint64)
+        for digit in digits[start:start + _DIGITS_PER_STEP]:
+            carry = carry * np.uint64(58) + digit.astype(np.uint64)
+        for limb in range(_LIMBS - 1, -1, -1):
+            value = limbs[limb] * np.uint64(58 ** _DIGITS_PER_STEP) + carry
+            limbs[limb] = value & np.uint64(0xffffffff)
+            carry = value >> np.uint64(32)
+        invalid |= carry != 0
+
+    decoded = np.ascontiguousarray(limbs.T).astype('>u4').view(np.uint8).reshape(count, _LIMBS * 4)
+    invalid |= decoded[:, :-_DECODED_SIZE].any(axis=1)
+    decoded = np.ascontiguousarray(decoded[:, -_DECODED_SIZE:])
+    # 先頭の 'r' の数と先頭の0バイトの数が一致しない（正規形でない）アドレスも弾く
+    leading_zero_bytes = np.where(decoded.any(axis=1), (decoded != 0).argmax(axis=1), _DECODED_SIZE)
+    invalid |= (leading_zero_digits != leading_zero_bytes) | (decoded[:, 0] != _ACCOUNT_VERSION[0])
+
+    size = _DECODED_SIZE - 4
+    payloads = decoded[:, :size].tobytes()
+    sha256 = hashlib.sha256
+    checksums = b''.join([sha256(sha256(payloads[start:start + size]).digest()).digest()[:4]
+                          for start in range(0, len(payloads), size)])
+    invalid |= (np.frombuffer(checksums, dtype=np.uint8).reshape(count, 4) != decoded[:, size:]).any(axis=1)
+    if invalid.any():
+        raise ValueError(f"Invalid XRPL address: {str(addresses[invalid.argmax()])!r}")
+    return np.ascontiguousarray(decoded[:, 1:1 + ACCOUNT_ID_SIZE]).view(f'S{ACCOUNT_ID_SIZE}').ravel()
+
+def account_id_bytes(account_id) -> bytes:
+    """Full 20 bytes of an S20 element (numpy strips trailing NUL bytes)"""
+    return bytes(account_id).ljust(ACCOUNT_ID_SIZE, b'\x00')
+
+def account_id_hex(account_id) -> str:
+    """PostgREST literal for a bytea column ('\\x' + hex)"""
+    return '\\x' + account_id_bytes(account_id).hex()
@@ -0,0 +1,62 @@
+-- 深さごとのSQL側ベンチマーク（table.sqlとfunction.sqlを適用済みの検証用DBで実行する）
+--   psql "$DATABASE_URL" -v depth=1000000 -f bench_depth.sql
+-- 2時点分のスナップショットを生成し、アップロード後と同じくそれぞれrun_post_ingestとanalyze_rich_list_tablesを実行して、最後にROLLBACKする。
+-- run_post_ingestは自身のstatement_timeoutで動くので、タイムアウトすればここでエラーになる。
+-- 戻り値はステップごとの所要時間（ms）。
+\set ON_ERROR_STOP on
+\timing on
+
+BEGIN;
+
+CREATE TEMP TABLE bench_snapshots (snapshot_date TIMESTAMP WITH TIME ZONE) ON COMMIT DROP;
+INSERT INTO bench_snapshots VALUES (CURRENT_TIMESTAMP - INTERVAL '1 hour'), (CURRENT_TIMESTAMP);
+
+-- 1時間前のスナップショット（ラベルは40種類、2割はgrouped_labelなしで取り込まれた行）
+-- 非推奨のaddressはローダーが送るので、同じ長さの仮の値を入れる（トリガーでの変換はさせない）
+INSERT INTO xrpl_rich_list
+    (rank, account_id, address, label, grouped_label, balance_xrp, escrow_xrp, balance_drops, escrow_drops,
+     percentage, exists, domain, snapshot_date)
+SELECT
+    g,
+    decode(lpad(to_hex(g), 40, '0'), 'hex'),
+    'r' || lpad(to_hex(g), 33, '0'),
+    'Exchange ' || (g % 40) || ' (Hot Wallet)',
+    CASE WHEN g % 5 = 0 THEN NULL ELSE 'Exchange ' || (g % 40) END,
+    (1000000000000 / g) / 1000000.0,
+    0,
+    1000000000000 / g,
+    0,
+    100.0 / g,
+    true,
+    '',
+    (SELECT MIN(snapshot_date) FROM bench_snapshots)
+FROM generate_series(1, :depth) g;
+
+ANALYZE xrpl_rich_list;
+SELECT step, ms FROM jsonb_to_recordset(run_post_ingest((SELECT MIN(snapshot_date) FROM bench_snapshots))) AS t(step text, ms numeric);
+SELECT analyze_rich_list_tables();
+
+-- 現在のスナップショット（残高を少し動かす）
+INSERT INTO xrpl_rich_list
+    (rank, account_id, address, label, grouped_label, balance_xrp, escrow_xrp, balance_drops, escrow_drops,
+     percentage, exists, domain, snapshot_date)
+SELECT
+    g,
+    decode(lpad(to_hex(g), 40, '0'), 'hex'),
+    'r' || lpad(to_hex(g), 33, '0'),
+    'Exchange ' || (g % 40) || ' (Hot Wallet)',
+    CASE WHEN g % 5 = 0 THEN NULL ELSE 'Exchange ' || (g % 40) END,
+    (1000000000000 / g + g) / 1000000.0,
+    0,
+    1000000000000 / g + g,
+    0,
+    100.0 / g,
+    true,
+    '',
+    (SELECT MAX(snapshot_date) FROM bench_snapshots)
+FROM generate_series(1, :depth) g;
+
+SELECT step, ms FROM jsonb_to_recordset(run_post_ingest((SELECT MAX(snapshot_date) FROM bench_snapshots))) AS t(step text, ms numeric);
+SELECT analyze_rich_list_tables();
+
+ROLLBACK;
@@ -0,0 +1,45 @@
+"""Benchmark: parsing a saved rich list page (page_source mode) without a browser
+
+Usage: python bench_scrape_parse.py [page.html ...]   (default: a synthetic 10,000-row page)
+
+Times parse_rich_list_html (lxml) and parse_table_rows (numpy cleanup) on
+HTML saved from the balances page, e.g. from driver.page_source.
+"""
+import hashlib
+import sys
+import time
+
+from account_id import encode_account_id
+from scraper import XRPLRichListScraper, parse_rich_list_html
+
+ROWS = 10_000
+
+def synthetic_page(count: int) -> str:
+    rows = []
+    for rank in range(1, count + 1):
+        address = encode_account_id(hashlib.blake2b(rank.to_bytes(8, 'big'), digest_size=20).digest())
+        label = "Binance (Hot Wallet)" if rank % 7 == 0 else ""
+        rows.append(
+            f"<tr><td>{rank}</td><td><a href='/account/{address}'>{address}</a></td><td></td>"
+            f"<td>{label}</td><td>{(count - rank + 1) * 1_234_567:,}.123456 XRP</td>"
+            f"<td>{'-' if rank % 3 else '5,000 XRP'}</td><td>0.0123%</td></tr>"
+        )
+    return ("<html><body><table><thead><tr><th>Top 10,000 XRP balances</th></tr></thead>"
+            f"<tbody>{''.join(rows)}</tbody></table></body></html>")
+
+def main():
+    pages = [(path, open(path, 'r', encoding='utf-8').read()) for path in sys.argv[1:]]
+    if not pages:
+        pages = [(f"synthetic {ROWS:,} rows", synthetic_page(ROWS))]
+    scraper = XRPLRichListScraper.__new__(XRPLRichListScraper)
+    for name, html in pages:
+        start = time.perf_counter()
+        rows = parse_rich_list_html(html, XRPLRichListScraper.TABLE_HEADER_XPATH)
+        parsed = time.perf_counter()
+        entries = scraper.parse_table_rows(rows, "")
+        cleaned = time.perf_counter()
+        print(f"{name}: {len(entries):,} rows | lxml {1000 * (parsed - start):.1f} ms"
+              f" | cleanup {1000 * (cleaned - parsed):.1f} ms")
+
+if __name__ == "__main__":
+    main()
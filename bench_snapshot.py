@@ -0,0 +1,107 @@
+"""Benchmark: dataclass merge/rank vs. columnar merge/rank
+
+Usage: python bench_snapshot.py [rows ...]   (default: 10000 1000000)
+"""
+import hashlib
+import random
+import sys
+import time
+from dataclasses import dataclass
+from typing import List
+
+from account_id import encode_account_id
+from rich_list_snapshot import AccountColumnsBuilder, join_well_known, rank_accounts
+
+WELL_KNOWN_COUNT = 2500
+
+@dataclass
+class LegacyAccount:
+    account: str
+    balance: float
+    name: str = "Unknown"
+    desc: str = ""
+    domain: str = ""
+    twitter: str = ""
+    verified: bool = False
+    escrow_xrp: float = 0.0
+
+def synthetic_address(number: int) -> str:
+    # 実際のAccountIDと同じく一様に散らばるよう、連番のハッシュをAccountIDにする
+    return encode_account_id(hashlib.blake2b(number.to_bytes(8, 'big'), digest_size=20).digest())
+
+def make_rows(count: int):
+    random.seed(count)
+    rich = [(synthetic_address(i), random.randint(20_000_000_000, 2_000_000_000_000_000)) for i in range(count)]
+    rich.sort(key=lambda row: row[1], reverse=True)
+    well_known = [(synthetic_address(random.randrange(count * 2)), f"Exchange {i % 40}", "Hot Wallet")
+                  for i in range(WELL_KNOWN_COUNT)]
+    return rich, well_known
+
+def legacy_accounts(rich, well_known):
+    rich_list = [LegacyAccount(account=a, balance=b / 1_000_000) for a, b in rich]
+    well_known_list = [LegacyAccount(account=a, balance=0, name=n, desc=d, verified=True)
+                       for a, n, d in well_known]
+    return rich_list, well_known_list
+
+def legacy_merge_and_rank(rich_list, well_known_list):
+    well_known_dict = {acc.account: acc for acc in well_known_list}
+    processed = set()
+    merged: List[LegacyAccount] = []
+    for rich_acc in rich_list:
+        if rich_acc.account in processed:
+            continue
+        if rich_acc.account in well_known_dict:
+            well_known_acc = well_known_dict[rich_acc.account]
+            well_known_acc.balance = rich_acc.balance
+            merged.append(well_known_acc)
+        else:
+            merged.append(rich_acc)
+        processed.add(rich_acc.account)
+    for acc in well_known_list:
+        if acc.account not in processed:
+            merged.append(acc)
+            processed.add(acc.account)
+    merged = sorted(merged, key=lambda x: x.balance, reverse=True)
+
+    total = sum(acc.balance for acc in merged)
+    return [(rank, acc.balance / total * 100) for rank, acc in enumerate(merged, 1)]
+
+def columnar_accounts(rich, well_known):
+    rich_builder = AccountColumnsBuilder()
+    for address, drops in rich:
+        rich_builder.append(address, drops)
+    well_known_builder = AccountColumnsBuilder()
+    for address, name, desc in well_known:
+        well_known_builder.append(address, 0, name, desc, verified=True)
+    return rich_builder.build(), well_known_builder.build()
+
+def columnar_merge_and_rank(rich_list, well_known):
+    return rank_accounts(join_well_known(rich_list, well_known))
+
+def timed(func, *args, repeat: int = 3):
+    """Best of `repeat` runs (the first run also pays numpy's warm-up)"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10_000, 1_000_000]
+    print("rows       | build: dataclass / columnar | merge+rank: dataclass / columnar")
+    for count in sizes:
+        rich, well_known = make_rows(count)
+        legacy_inputs, legacy_build = timed(legacy_accounts, rich, well_known, repeat=1)
+        columnar_inputs, columnar_build = timed(columnar_accounts, rich, well_known, repeat=1)
+        # legacy_merge_and_rankは入力を書き換えるため1回だけ計測する
+        legacy, legacy_merge = timed(legacy_merge_and_rank, *legacy_inputs, repeat=1)
+        columnar, columnar_merge = timed(columnar_merge_and_rank, *columnar_inputs)
+        assert len(legacy) == len(columnar)
+        print(f"{count:>10,} | {legacy_build * 1000:9.1f} ms / {columnar_build * 1000:9.1f} ms | "
+              f"{legacy_merge * 1000:9.1f} ms / {columnar_merge * 1000:9.1f} ms "
+              f"(x{legacy_merge / columnar_merge:.1f})")
+
+if __name__ == "__main__":
+    main()
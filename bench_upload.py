@@ -0,0 +1,137 @@
+"""Benchmark: PostgREST-style 100-row insert batches vs. binary COPY through a staging table
+
+Usage: python bench_upload.py <postgres dsn> [rows ...]   (default: 10000 100000)
+
+Runs against any Postgres (a local one is enough) in a scratch schema
+bench_upload, with xrpl_rich_list as it stands after table.sql. The batch
+path sends the same JSON rows as SupabaseUploader and inserts them the way
+PostgREST does (json_populate_recordset, one transaction per request); HTTP
+is not included, so against Supabase every batch also pays a round trip.
+The COPY path is CopyLoader.load_snapshot.
+
+Measured (local Postgres 16 over a Unix socket, one core):
+
+    rows       | 100-row batches (requests) | COPY + INSERT
+        10,000 |     0.41s (   100) |     0.22s
+       100,000 |     4.50s ( 1,000) |     2.46s
+     1,000,000 |    44.31s (10,000) |    27.30s
+
+COPY itself is 0.04s for 10k rows (4s for 1M); the rest of the COPY path is
+the INSERT ... SELECT maintaining the unique constraint and five indexes,
+which the batch path pays too. Against Supabase the batch path adds 100
+HTTPS round trips for 10k rows (plus a 5s sleep per retried batch), which
+is where its minutes go.
+"""
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import psycopg
+
+from account_id import encode_account_id
+from copy_loader import CopyLoader
+from snapshot_file import iter_snapshot_rows, write_snapshot
+from uploader import UPLOAD_COLUMNS, to_upload_row
+
+SCHEMA = "bench_upload"
+
+TABLE_SQL = f"""
+    DROP SCHEMA IF EXISTS {SCHEMA} CASCADE;
+    CREATE SCHEMA {SCHEMA};
+    CREATE TABLE {SCHEMA}.xrpl_rich_list (
+        id BIGSERIAL PRIMARY KEY,
+        rank INTEGER NOT NULL,
+        label TEXT,
+        balance_xrp DECIMAL(20, 6),
+        escrow_xrp DECIMAL(20, 6),
+        percentage DOUBLE PRECISION,
+        exists BOOLEAN NOT NULL,
+        snapshot_date TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        domain TEXT,
+        grouped_label VARCHAR(255),
+        balance_drops BIGINT,
+        escrow_drops BIGINT,
+        account_id BYTEA NOT NULL CHECK (octet_length(account_id) = 20),
+        domain_verified BOOLEAN NOT NULL DEFAULT false,
+        UNIQUE (account_id, snapshot_date)
+    );
+    CREATE INDEX ON {SCHEMA}.xrpl_rich_list(snapshot_date);
+    CREATE INDEX ON {SCHEMA}.xrpl_rich_list(rank);
+    CREATE INDEX ON {SCHEMA}.xrpl_rich_list(exists);
+    CREATE INDEX ON {SCHEMA}.xrpl_rich_list(domain);
+    CREATE INDEX ON {SCHEMA}.xrpl_rich_list(account_id);
+"""
+
+BATCH_SIZE = 100
+
+def make_snapshot(path: str, count: int, snapshot_date: str) -> int:
+    account_ids = [hashlib.blake2b(i.to_bytes(8, 'big'), digest_size=20).digest() for i in range(count)]
+    balances = np.sort(np.random.default_rng(count).lognormal(mean=20, sigma=3, size=count).astype(np.int64))[::-1]
+    return write_snapshot(path, {
+        'rank': np.arange(1, count + 1, dtype=np.int32),
+        'address': [encode_account_id(account_id) for account_id in account_ids],
+        'account_id': np.array(account_ids, dtype='S20'),
+        'label': [f"Exchange {i % 40}" if i % 10 == 0 else "Unknown" for i in range(count)],
+        'grouped_label': [f"Exchange {i % 40}" if i % 10 == 0 else "Unknown" for i in range(count)],
+        'balance_drops': balances,
+        'escrow_drops': np.zeros(count, dtype=np.int64),
+        'percentage': balances / balances.sum() * 100,
+        'domain': [''] * count,
+        'twitter': [''] * count,
+        'verified': np.zeros(count, dtype=bool),
+        'domain_verified': np.zeros(count, dtype=bool),
+        'snapshot_date': [snapshot_date] * count,
+        'exists': np.ones(count, dtype=bool)
+    })
+
+def insert_batches(dsn: str, path: str) -> int:
+    inserted = 0
+    with psycopg.connect(dsn, autocommit=True) as connection:
+        for batch in iter_snapshot_rows(path, BATCH_SIZE, UPLOAD_COLUMNS):
+            rows = [to_upload_row(row) for row in batch]
+            columns = ", ".join(f'"{name}"' for name in rows[0])
+            # PostgRESTの一括insertと同じ形（リクエストごとに1トランザクション）
+            connection.execute(
+                f"INSERT INTO {SCHEMA}.xrpl_rich_list ({columns}) "
+                f"SELECT {columns} FROM json_populate_recordset(NULL::{SCHEMA}.xrpl_rich_list, %s)",
+                [json.dumps(rows)])
+            inserted += len(rows)
+    return inserted
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+def main():
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    dsn = sys.argv[1]
+    counts = [int(arg) for arg in sys.argv[2:]] or [10_000, 100_000]
+    with psycopg.connect(dsn, autocommit=True) as connection:
+        connection.execute(TABLE_SQL)
+
+    loader = CopyLoader(dsn, table=f"{SCHEMA}.xrpl_rich_list")
+    print("rows       | 100-row batches (requests) | COPY + INSERT")
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            for index, count in enumerate(counts):
+                path = os.path.join(directory, f"bench_{count}.arrow")
+                # 一意制約でぶつからないよう、実行ごとにスナップショット日時を分ける
+                make_snapshot(path, count, f"2024-01-01T{2 * index:02d}:00:00+00:00")
+                batched, batch_time = timed(insert_batches, dsn, path)
+                make_snapshot(path, count, f"2024-01-01T{2 * index + 1:02d}:00:00+00:00")
+                copied, copy_time = timed(loader.load_snapshot, path)
+                assert batched == copied == count
+                print(f"{count:>10,} | {batch_time:8.2f}s ({-(-count // BATCH_SIZE):>6,}) | {copy_time:8.2f}s")
+    finally:
+        with psycopg.connect(dsn, autocommit=True) as connection:
+            connection.execute(f"DROP SCHEMA {SCHEMA} CASCADE")
+
+if __name__ == "__main__":
+    main()
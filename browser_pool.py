@@ -0,0 +1,154 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+CHROME_BINARIES = ["google-chrome", "google-chrome-stable", "chromium", "chromium-browser", "chrome"]
+
+def _process_tree_rss_mb(root_pid: int) -> Optional[float]:
+    """Resident memory of a process and all its children in MB (Linux /proc only)"""
+    if not os.path.isdir("/proc"):
+        return None
+    children: Dict[int, List[int]] = {}
+    for name in os.listdir("/proc"):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f"/proc/{name}/stat", 'r') as f:
+                # "pid (comm) state ppid ..." のcommは空白を含むことがあるので ')' の後ろから読む
+                ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(name))
+
+    total_kb = 0
+    pending = [root_pid]
+    while pending:
+        pid = pending.pop()
+        pending.extend(children.get(pid, []))
+        try:
+            with open(f"/proc/{pid}/status", 'r') as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total_kb += int(line.split()[1])
+                        break
+        except OSError:
+            continue
+    return total_kb / 1024
+
+class BrowserPool:
+    """One warm headless Chrome, reached over remote debugging and reused across scrapes
+
+    Meant for daemon mode (python pipeline.py --daemon), where the browser
+    outlives a single run. Chrome is launched on first use and kept running;
+    each scrape attaches a new WebDriver session to it. Before handing it
+    out, the pool checks that the DevTools endpoint answers and restarts
+    Chrome after max_uses scrapes or when its process tree uses more than
+    max_memory_mb. Scrapes are serialized (one browser, one scrape at a time).
+    """
+
+    def __init__(self, port: int = 9222, max_uses: int = 20, max_memory_mb: int = 1500,
+                 chrome_binary: Optional[str] = None, startup_timeout: int = 20):
+        self.port = port
+        self.max_uses = max_uses
+        self.max_memory_mb = max_memory_mb
+        self.chrome_binary = chrome_binary or os.environ.get("CHROME_BINARY")
+        self.startup_timeout = startup_timeout
+        self.process: Optional[subprocess.Popen] = None
+        self.profile_dir: Optional[str] = None
+        self.uses = 0
+        self._lock = threading.Lock()
+
+    @property
+    def debugger_address(self) -> str:
+        return f"127.0.0.1:{self.port}"
+
+    def find_binary(self) -> str:
+        if self.chrome_binary:
+            return self.chrome_binary
+        for name in CHROME_BINARIES:
+            path = shutil.which(name)
+            if path:
+                return path
+        raise Exception("Chrome binary not found (set CHROME_BINARY)")
+
+    def endpoint_alive(self, timeout: float = 2.0) -> bool:
+        try:
+            with urllib.request.urlopen(f"http://{self.debugger_address}/json/version", timeout=timeout) as response:
+                return response.status == 200
+        except Exception:
+            return False
+
+    def memory_mb(self) -> Optional[float]:
+        if self.process is None:
+            return None
+        return _process_tree_rss_mb(self.process.pid)
+
+    def start(self):
+        print(f"Starting warm Chrome on port {self.port}...")
+        started = time.perf_counter()
+        self.profile_dir = tempfile.mkdtemp(prefix="rich_list_chrome_")
+        self.process = subprocess.Popen([
+            self.find_binary(),
+            '--headless=new',
+            '--no-sandbox',
+            '--disable-gpu',
+            '--blink-settings=imagesEnabled=false',
+            f'--remote-debugging-port={self.port}',
+            f'--user-data-dir={self.profile_dir}',
+            'about:blank'
+        ], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        self.uses = 0
+        deadline = time.monotonic() + self.startup_timeout
+        while time.monotonic() < deadline:
+            if self.endpoint_alive(timeout=1.0):
+                print(f"Chrome ready in {time.perf_counter() - started:.1f}s")
+                return
+            if self.process.poll() is not None:
+                break
+            time.sleep(0.2)
+        self.stop()
+        raise Exception("Chrome did not start with remote debugging")
+
+    def stop(self):
+        if self.process is not None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+            self.process = None
+        if self.profile_dir:
+            shutil.rmtree(self.profile_dir, ignore_errors=True)
+            self.profile_dir = None
+
+    def restart_reason(self) -> Optional[str]:
+        """Why the running browser should not be reused (None if it is fine)"""
+        if self.process is None:
+            return "not running"
+        if self.process.poll() is not None or not self.endpoint_alive():
+            return "unresponsive"
+        if self.uses >= self.max_uses:
+            return f"used {self.uses} times"
+        memory = self.memory_mb()
+        if memory is not None and memory > self.max_memory_mb:
+            return f"using {memory:.0f} MB"
+        return None
+
+    @contextmanager
+    def session(self) -> Iterator[str]:
+        """Debugger address of a healthy warm browser, held for the duration of one scrape"""
+        with self._lock:
+            reason = self.restart_reason()
+            if reason is not None:
+                if self.process is not None:
+                    print(f"Restarting Chrome ({reason})")
+                self.stop()
+                self.start()
+            self.uses += 1
+            yield self.debugger_address
@@ -5,6 +5,8 @@ import json
 import re
 from typing import Optional
 
+from xrpscan_cache import sniff_html
+
 API_URL = "https://api.xrpscan.com/api/v1/balances"
 
 HEADERS = {
@@ -15,18 +17,6 @@ HEADERS = {
     "Accept": "application/json",
 }
 
-def sniff_html(text: str) -> Optional[str]:
-    """HTMLっぽい原因をざっくり推測"""
-    t = text.lower()
-    if "cf-ray" in t or "cloudflare" in t or "attention required" in t:
-        return "Cloudflareブロック/チャレンジの可能性"
-    if "<html" in t or "<!doctype html" in t:
-        # XRPSCANの通常HTMLか、エラーページか、CDNブロックか
-        if "xrpscan" in t:
-            return "XRPSCANのHTMLページを返している（APIではなくWeb側/リダイレクトの可能性）"
-        return "HTMLページを返している（WAF/エラーページ/リダイレクト先の可能性）"
-    return None
-
 async def fetch_once(session: aiohttp.ClientSession, url: str) -> None:
     async with session.get(url, allow_redirects=True) as resp:
         print("=== Request ===")
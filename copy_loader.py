@@ -0,0 +1,137 @@
+import os
+import sys
+import time
+from typing import Optional
+
+import psycopg
+from psycopg import sql
+
+from snapshot_file import read_snapshot
+
+# Supabaseの直接接続（またはセッションモードのプーラー）の接続文字列。PostgRESTではCOPYが使えない
+DB_URL_ENV = "SUPABASE_DB_URL"
+
+# ステージングに送る列と、バイナリCOPYでの型（snapshot_dateは文字列のまま送り、INSERTで変換する）
+STAGING_COLUMNS = [
+    ('rank', 'int4'),
+    ('account_id', 'bytea'),
+    # 非推奨のaddressカラム用（移行期間が終わったら外す）
+    ('address', 'text'),
+    ('label', 'text'),
+    ('grouped_label', 'text'),
+    ('balance_drops', 'int8'),
+    ('escrow_drops', 'int8'),
+    ('percentage', 'float8'),
+    ('snapshot_date', 'text'),
+    ('exists', 'bool'),
+    ('domain', 'text'),
+    ('domain_verified', 'bool'),
+]
+
+STAGING_TABLE = "xrpl_rich_list_staging"
+
+class CopyLoader:
+    """Bulk load a snapshot into xrpl_rich_list with binary COPY over a direct Postgres connection
+
+    The snapshot is streamed with COPY ... FROM STDIN (FORMAT BINARY) into a
+    temporary staging table, then moved with one INSERT ... SELECT that also
+    derives the display columns (balance_xrp/escrow_xrp) from drops. Both
+    happen in one transaction, so a failed load leaves nothing behind and
+    can simply be retried; rows already there (a load that committed but
+    whose reply was lost) are updated in place.
+    """
+
+    def __init__(self, dsn: str, table: str = "xrpl_rich_list", max_retries: int = 3, retry_delay: int = 5,
+                 chunk_size: int = 50_000):
+        self.dsn = dsn
+        self.table = sql.Identifier(*table.split('.'))
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.chunk_size = chunk_size
+
+    @classmethod
+    def from_env(cls) -> Optional["CopyLoader"]:
+        """A loader for SUPABASE_DB_URL, or None when it is not set"""
+        dsn = os.environ.get(DB_URL_ENV, "")
+        return cls(dsn) if dsn else None
+
+    def create_staging(self, cursor: psycopg.Cursor):
+        columns = sql.SQL(", ").join(
+            sql.SQL("{} {}").format(sql.Identifier(name), sql.SQL(type_name)) for name, type_name in STAGING_COLUMNS)
+        cursor.execute(sql.SQL("CREATE TEMP TABLE {} ({}) ON COMMIT DROP").format(
+            sql.Identifier(STAGING_TABLE), columns))
+
+    def copy_rows(self, cursor: psycopg.Cursor, snapshot_path: str) -> int:
+        names = [name for name, _ in STAGING_COLUMNS]
+        table = read_snapshot(snapshot_path).select(names)
+        statement = sql.SQL("COPY {} ({}) FROM STDIN (FORMAT BINARY)").format(
+            sql.Identifier(STAGING_TABLE), sql.SQL(", ").join(map(sql.Identifier, names)))
+        with cursor.copy(statement) as copy:
+            copy.set_types([type_name for _, type_name in STAGING_COLUMNS])
+            # 列単位でPythonの値に変換し、行ごとの辞書は作らない
+            for batch in table.to_batches(max_chunksize=self.chunk_size):
+                for row in zip(*(column.to_pylist() for column in batch.columns)):
+                    copy.write_row(row)
+        return table.num_rows
+
+    def insert_from_staging(self, cursor: psycopg.Cursor) -> int:
+        cursor.execute(sql.SQL("""
+            INSERT INTO {} (rank, account_id, address, label, grouped_label, balance_drops, escrow_drops,
+                            balance_xrp, escrow_xrp, percentage, snapshot_date, exists, domain, domain_verified)
+            SELECT rank, account_id, address, label, grouped_label, balance_drops, escrow_drops,
+                   balance_drops / 1000000.0, escrow_drops / 1000000.0, percentage,
+                   snapshot_date::timestamptz, exists, domain, domain_verified
+            FROM {}
+            ON CONFLICT (account_id, snapshot_date) DO UPDATE SET
+                rank = EXCLUDED.rank, address = EXCLUDED.address, label = EXCLUDED.label, grouped_label = EXCLUDED.grouped_label,
+                balance_drops = EXCLUDED.balance_drops, escrow_drops = EXCLUDED.escrow_drops,
+                balance_xrp = EXCLUDED.balance_xrp, escrow_xrp = EXCLUDED.escrow_xrp,
+                percentage = EXCLUDED.percentage, exists = EXCLUDED.exists,
+                domain = EXCLUDED.domain, domain_verified = EXCLUDED.domain_verified
+        """).format(self.table, sql.Identifier(STAGING_TABLE)))
+        return cursor.rowcount
+
+    def load_once(self, snapshot_path: str) -> int:
+        started = time.perf_counter()
+        with psycopg.connect(self.dsn) as connection:
+            with connection.cursor() as cursor:
+                self.create_staging(cursor)
+                copied = self.copy_rows(cursor, snapshot_path)
+                copy_done = time.perf_counter()
+                inserted = self.insert_from_staging(cursor)
+            print(f"Copied {copied} rows in {copy_done - started:.2f}s, "
+                  f"inserted {inserted} in {time.perf_counter() - copy_done:.2f}s")
+            if inserted != copied:
+                raise Exception(f"Inserted {inserted} rows but copied {copied}")
+            # withを抜けるとコミットされる（例外時はロールバック）
+        return inserted
+
+    def load_snapshot(self, snapshot_path: str) -> int:
+        """Insert every row of the snapshot in one transaction; returns the row count"""
+        retry_delay = self.retry_delay
+        for attempt in range(self.max_retries):
+            try:
+                return self.load_once(snapshot_path)
+            except psycopg.OperationalError as e:
+                # 接続系のエラーだけ再試行する（トランザクションごと取り消されている）
+                print(f"COPY attempt {attempt + 1}/{self.max_retries} failed: {e}")
+                if attempt == self.max_retries - 1:
+                    raise
+                print(f"Retrying in {retry_delay} seconds...")
+                time.sleep(retry_delay)
+                retry_delay *= 2
+
+def main():
+    loader = CopyLoader.from_env()
+    if loader is None:
+        print(f"{DB_URL_ENV} is not set")
+        sys.exit(1)
+    snapshot_path = sys.argv[1] if len(sys.argv) > 1 else "rich_list_temp.arrow"
+    try:
+        print(f"Loaded {loader.load_snapshot(snapshot_path)} rows from {snapshot_path}")
+    except Exception as e:
+        print(f"Fatal error: {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+import asyncio
+import json
+import os
+import re
+import sys
+import time
+import tomllib
+from dataclasses import dataclass, asdict, field
+from typing import Dict, Iterable, List, Optional
+
+import aiohttp
+import numpy as np
+
+from account_id import ACCOUNT_ID_SIZE, account_id_bytes, decode_account_id
+from rich_list_snapshot import AccountColumns
+
+# XRPScan APIキャッシュと同じディレクトリに置き、ワークフローのキャッシュで引き継ぐ
+CACHE_PATH = os.path.join(".xrpscan_cache", "domain_verification.json")
+
+TOML_URL = "https://{domain}/.well-known/xrp-ledger.toml"
+MAX_TOML_SIZE = 1 << 20   # xrp-ledger.tomlは通常数KB
+
+# パース失敗時にアドレスだけ拾うための正規表現
+_ADDRESS_PATTERN = re.compile(r'address\s*=\s*["\'](r[1-9A-HJ-NP-Za-km-z]{24,34})["\']')
+_DOMAIN_PATTERN = re.compile(r'^[a-z0-9]([a-z0-9-]*[a-z0-9])?(\.[a-z0-9]([a-z0-9-]*[a-z0-9])?)+$')
+
+@dataclass
+class DomainResult:
+    domain: str
+    ok: bool                                   # xrp-ledger.tomlを取得・解釈できたか
+    accounts: List[str] = field(default_factory=list)  # [[ACCOUNTS]]に載っているアドレス
+    error: str = ""
+    checked_at: float = 0.0
+
+def normalize_domain(domain: Optional[str]) -> Optional[str]:
+    """Bare lowercase host for a stored domain ('https://Example.com/' -> 'example.com'), None if unusable"""
+    if not domain:
+        return None
+    host = re.sub(r'^[a-z]+://', '', domain.strip().lower()).split('/')[0].split(':')[0].rstrip('.')
+    return host if _DOMAIN_PATTERN.match(host) else None
+
+def parse_toml_accounts(text: str) -> List[str]:
+    """Addresses listed under [[ACCOUNTS]] in an xrp-ledger.toml"""
+    try:
+        accounts = tomllib.loads(text).get('ACCOUNTS', [])
+        return [entry['address'] for entry in accounts if isinstance(entry, dict) and isinstance(entry.get('address'), str)]
+    except tomllib.TOMLDecodeError:
+        # 書式の崩れたtomlも多いので、addressの行だけ拾う
+        return _ADDRESS_PATTERN.findall(text)
+
+class DomainVerifier:
+    """Fetch each distinct domain's xrp-ledger.toml concurrently, with a persistent TTL cache
+
+    A domain is fetched at most once per ttl (failure_ttl after a failed
+    fetch), however many accounts carry it. Fetches share one session whose
+    connector caps connections overall and per host. url_template can point
+    at a local HTTP server for testing.
+    """
+
+    def __init__(self, cache_path: str = CACHE_PATH, ttl: int = 24 * 3600, failure_ttl: int = 3600,
+                 limit: int = 32, limit_per_host: int = 2, timeout: int = 15, url_template: str = TOML_URL):
+        self.cache_path = cache_path
+        self.ttl = ttl
+        self.failure_ttl = failure_ttl
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.timeout = aiohttp.ClientTimeout(total=timeout, connect=min(timeout, 10))
+        self.url_template = url_template
+        self.results: Dict[str, DomainResult] = self.load_cache()
+
+    def load_cache(self) -> Dict[str, DomainResult]:
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        known = DomainResult.__dataclass_fields__
+        return {domain: DomainResult(**{k: v for k, v in entry.items() if k in known})
+                for domain, entry in saved.items()}
+
+    def save_cache(self):
+        os.makedirs(os.path.dirname(self.cache_path) or ".", exist_ok=True)
+        temp_path = f"{self.cache_path}.temp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({domain: asdict(result) for domain, result in self.results.items()}, f, indent=2)
+        os.replace(temp_path, self.cache_path)
+
+    def is_fresh(self, result: DomainResult) -> bool:
+        ttl = self.ttl if result.ok else self.failure_ttl
+        return time.time() - result.checked_at < ttl
+
+    async def fetch_domain(self, session: aiohttp.ClientSession, domain: str) -> DomainResult:
+        url = self.url_template.format(domain=domain)
+        try:
+            async with session.get(url, allow_redirects=True) as response:
+                if response.status != 200:
+                    raise Exception(f"HTTP {response.status}")
+                raw = await response.content.read(MAX_TOML_SIZE + 1)
+                if len(raw) > MAX_TOML_SIZE:
+                    raise Exception("xrp-ledger.toml is too large")
+            accounts = parse_toml_accounts(raw.decode('utf-8', errors='replace'))
+            return DomainResult(domain=domain, ok=True, accounts=accounts, checked_at=time.time())
+        except Exception as e:
+            return DomainResult(domain=domain, ok=False, error=f"{type(e).__name__}: {e}"[:300], checked_at=time.time())
+
+    async def verify(self, domains: Iterable[Optional[str]]) -> Dict[str, DomainResult]:
+        """Results for every usable domain in domains (cached ones are not refetched)"""
+        wanted = {normalized for normalized in map(normalize_domain, domains) if normalized}
+        stale = sorted(domain for domain in wanted
+                       if domain not in self.results or not self.is_fresh(self.results[domain]))
+        if stale:
+            print(f"Fetching xrp-ledger.toml for {len(stale)} domains ({len(wanted) - len(stale)} cached)...")
+            connector = aiohttp.TCPConnector(limit=self.limit, limit_per_host=self.limit_per_host, ttl_dns_cache=300)
+            async with aiohttp.ClientSession(connector=connector, timeout=self.timeout) as session:
+                fetched = await asyncio.gather(*(self.fetch_domain(session, domain) for domain in stale))
+            for result in fetched:
+                self.results[result.domain] = result
+            self.save_cache()
+        return {domain: self.results[domain] for domain in wanted}
+
+def listed_account_ids(result: DomainResult) -> List[bytes]:
+    """AccountIDs of the valid addresses a domain lists"""
+    account_ids = []
+    for address in result.accounts:
+        try:
+            account_ids.append(decode_account_id(address))
+        except ValueError:
+            continue
+    return account_ids
+
+class AccountDomainReader:
+    """Read accounts' own Domain field with account_info (the account side of a toml listing)
+
+    Only used for the few Unknown accounts a verified domain lists, so the
+    requests are capped by a small semaphore on one websocket connection.
+    xrpl-py is imported on use; client can be any object with an async
+    request() for testing.
+    """
+
+    def __init__(self, node_url: str = "wss://s1.ripple.com", concurrency: int = 8, client=None):
+        self.node_url = node_url
+        self.concurrency = concurrency
+        self.client = client
+
+    async def read_domain(self, address: str, semaphore: asyncio.Semaphore) -> Optional[str]:
+        from xrpl.models import AccountInfo
+        async with semaphore:
+            response = (await self.client.request(AccountInfo(account=address, ledger_index="validated"))).to_dict()
+        encoded = response.get('result', {}).get('account_data', {}).get('Domain')
+        if response.get('status') != 'success' or not encoded:
+            return None
+        try:
+            return normalize_domain(bytes.fromhex(encoded).decode('ascii'))
+        except (ValueError, UnicodeDecodeError):
+            return None
+
+    async def read(self, addresses: Iterable[str]) -> Dict[str, Optional[str]]:
+        """Address -> normalized on-ledger domain (None when unset, unreadable or the request failed)"""
+        addresses = sorted(set(addresses))
+        if not addresses:
+            return {}
+        owns_client = self.client is None
+        if owns_client:
+            from xrpl.asyncio.clients import AsyncWebsocketClient
+            self.client = AsyncWebsocketClient(self.node_url)
+            await self.client.open()
+        try:
+            semaphore = asyncio.Semaphore(self.concurrency)
+            domains = await asyncio.gather(*(self.read_domain(address, semaphore) for address in addresses),
+                                           return_exceptions=True)
+        finally:
+            if owns_client:
+                await self.client.close()
+                self.client = None
+        return {address: (None if isinstance(domain, Exception) else domain)
+                for address, domain in zip(addresses, domains)}
+
+def vouched_unknowns(columns: AccountColumns, results: Dict[str, DomainResult]) -> Dict[int, str]:
+    """Row -> domain for Unknown accounts listed by a domain that has a verified, labelled account"""
+    listed = {domain: set(listed_account_ids(result)) for domain, result in results.items() if result.ok}
+    named = set()
+    for index in np.flatnonzero(columns.domain != ""):
+        domain = normalize_domain(columns.domain[index])
+        if (domain in listed and account_id_bytes(columns.account_id[index]) in listed[domain]
+                and columns.name[index] not in ("", "Unknown")):
+            named.add(domain)
+    vouched = {account_id: domain for domain in sorted(named) for account_id in listed[domain]}
+    if not vouched:
+        return {}
+    unknown = (columns.name == "Unknown") | (columns.name == "")
+    vouched_ids = np.array(list(vouched), dtype=f'S{ACCOUNT_ID_SIZE}')
+    return {int(index): vouched[account_id_bytes(columns.account_id[index])]
+            for index in np.flatnonzero(unknown & np.isin(columns.account_id, vouched_ids))}
+
+def apply_domain_verification(columns: AccountColumns, results: Dict[str, DomainResult],
+                              ledger_domains: Optional[Dict[str, Optional[str]]] = None) -> np.ndarray:
+    """Mark accounts whose domain's xrp-ledger.toml lists them, and label Unknown accounts that name it back
+
+    Returns the domain_verified mask (the account names the domain and the
+    domain lists the account back). An Unknown account listed by a domain
+    with a verified, labelled account takes that account's name only when
+    its own Domain (ledger_domains, from AccountDomainReader) is the same
+    domain; it is then verified too. A listing alone changes nothing, so a
+    domain cannot claim accounts that do not point back at it. Updates
+    columns in place.
+    """
+    domain_verified = np.zeros(len(columns), dtype=bool)
+    listed = {domain: set(listed_account_ids(result)) for domain, result in results.items() if result.ok}
+    names: Dict[str, str] = {}
+    # ドメインを持つのはwell-knownのアカウントだけなので、その行だけを見る
+    for index in np.flatnonzero(columns.domain != ""):
+        domain = normalize_domain(columns.domain[index])
+        if domain in listed and account_id_bytes(columns.account_id[index]) in listed[domain]:
+            domain_verified[index] = True
+            if columns.name[index] not in ("", "Unknown"):
+                names.setdefault(domain, columns.name[index])
+
+    # 検証済みドメインが載せているUnknownのうち、台帳上のDomainでもそのドメインを名乗るものにだけラベルを付ける
+    ledger_domains = ledger_domains or {}
+    for index, domain in vouched_unknowns(columns, results).items():
+        address = columns.address[index].decode('ascii')
+        if ledger_domains.get(address) != domain:
+            continue
+        columns.name[index] = names[domain]
+        columns.desc[index] = ""
+        columns.domain[index] = domain
+        domain_verified[index] = True
+    return domain_verified
+
+async def main():
+    if len(sys.argv) < 2:
+        print("Usage: python domain_verifier.py <domain> [domain ...]")
+        sys.exit(1)
+    verifier = DomainVerifier()
+    for domain, result in sorted((await verifier.verify(sys.argv[1:])).items()):
+        status = f"{len(result.accounts)} accounts" if result.ok else f"failed ({result.error})"
+        print(f"{domain}: {status}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
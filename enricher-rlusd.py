@@ -1,10 +1,14 @@
 import aiohttp
 import asyncio
 import csv
+import json
 from datetime import datetime, timezone
 from typing import Dict, List, Set
 from dataclasses import dataclass
 
+from xrpscan_cache import XRPScanCache, CachedResponse, looks_like_html
+from label_groups import LabelGrouper
+
 @dataclass
 class WellKnownAccount:
     account: str
@@ -21,6 +25,8 @@ class RLUSDDataEnricher:
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
             'Accept': 'application/json'
         }
+        self.cache = XRPScanCache()
+        self.label_grouper = LabelGrouper()
 
     def format_label(self, name: str, desc: str) -> str:
         """Format label with name and description"""
@@ -31,31 +37,49 @@ class RLUSDDataEnricher:
             return f"{name} ({desc})"
         return name
 
+    async def fetch_well_known(self, session: aiohttp.ClientSession, headers: Dict[str, str]) -> CachedResponse:
+        url = f"{self.base_url}/names/well-known"
+        async with session.get(url, headers=headers) as response:
+            if response.status == 304:
+                return CachedResponse(status=304)
+            if response.status != 200:
+                raise Exception(f"API request failed with status: {response.status}")
+
+            raw = await response.read()
+            if looks_like_html(raw):
+                raise Exception(f"Unexpected HTML response (Content-Type: {response.headers.get('Content-Type', '')})")
+
+            return CachedResponse(
+                status=200,
+                data=json.loads(raw.decode("utf-8")),
+                etag=response.headers.get('ETag'),
+                last_modified=response.headers.get('Last-Modified')
+            )
+
     async def get_well_known_accounts(self) -> Dict[str, WellKnownAccount]:
         """Fetch well-known accounts from XRPScan API"""
         try:
             async with aiohttp.ClientSession(headers=self.headers) as session:
-                url = f"{self.base_url}/names/well-known"
-                
-                async with session.get(url) as response:
-                    if response.status != 200:
-                        raise Exception(f"API request failed with status: {response.status}")
-                    
-                    data = await response.json()
-                    accounts = {}
-                    
-                    for entry in data:
-                        account = WellKnownAccount(
-                            account=entry['account'],
-                            name=entry.get('name', 'Unknown'),
-                            desc=entry.get('desc', ""),
-                            domain=entry.get('domain', ""),
-                            twitter=entry.get('twitter', ""),
-                            verified=entry.get('verified', False)
-                        )
-                        accounts[account.account] = account
-                    
-                    return accounts
+                data = await self.cache.get(
+                    "names/well-known",
+                    lambda headers: self.fetch_well_known(session, headers)
+                )
+                await self.cache.wait_for_revalidations()
+
+            accounts = {}
+            
+            for entry in data:
+                account = WellKnownAccount(
+                    account=entry['account'],
+                    name=entry.get('name', 'Unknown'),
+                    desc=entry.get('desc', ""),
+                    domain=entry.get('domain', ""),
+                    twitter=entry.get('twitter', ""),
+                    verified=entry.get('verified', False)
+                )
+                accounts[account.account] = account
+            
+            return accounts
         
         except Exception as e:
             print(f"Error fetching well-known accounts: {e}")
@@ -97,11 +121,12 @@ class RLUSDDataEnricher:
                         'verified': False
                     })
                 
+                entry['grouped_label'] = self.label_grouper(entry['label'])
                 entry['snapshot_date'] = snapshot_date
                 enriched_entries.append(entry)
             
             # Write enriched data
-            fieldnames = ['rank', 'address', 'label', 'balance_rlusd', 'trust_limit', 
+            fieldnames = ['rank', 'address', 'label', 'grouped_label', 'balance_rlusd', 'trust_limit', 
                          'percentage', 'domain', 'twitter', 'verified', 
                          'rippling_disabled', 'snapshot_date']
             
@@ -0,0 +1,219 @@
+import json
+import os
+import time
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from account_id import ACCOUNT_ID_SIZE, account_id_bytes
+from domain_verifier import normalize_domain
+from rich_list_snapshot import AccountColumns
+
+# XRPScan APIキャッシュと同じディレクトリに置き、ワークフローのキャッシュで引き継ぐ
+STATE_PATH = os.path.join(".xrpscan_cache", "entities.json")
+
+UNKNOWN_GROUP = "Unknown"
+
+# この期間見かけなかったリンクとラベルは捨て、クラスタを作り直す
+MAX_AGE = 30 * 24 * 3600
+
+class UnionFind:
+    """Disjoint sets over string node ids, with path halving and union by size"""
+
+    def __init__(self, parent: Optional[Dict[str, str]] = None, size: Optional[Dict[str, int]] = None):
+        self.parent: Dict[str, str] = parent or {}
+        self.size: Dict[str, int] = size or {}
+
+    def __contains__(self, node: str) -> bool:
+        return node in self.parent
+
+    def find(self, node: str) -> str:
+        parent = self.parent
+        if node not in parent:
+            parent[node] = node
+            self.size[node] = 1
+            return node
+        while parent[node] != node:
+            parent[node] = parent[parent[node]]
+            node = parent[node]
+        return node
+
+    def union(self, first: str, second: str) -> str:
+        first, second = self.find(first), self.find(second)
+        if first == second:
+            return first
+        if self.size[first] < self.size[second]:
+            first, second = second, first
+        self.parent[second] = first
+        self.size[first] += self.size.pop(second)
+        return first
+
+    def compress(self):
+        """Point every node straight at its root (before saving)"""
+        for node in list(self.parent):
+            self.parent[node] = self.find(node)
+
+def account_node(account_id: bytes) -> str:
+    return f"account:{account_id_bytes(account_id).hex()}"
+
+def account_links(columns: AccountColumns,
+                  domain_verified: Optional[np.ndarray] = None) -> Iterable[Tuple[str, str]]:
+    """Links from account metadata: verified domain, shared twitter handle, verified well-known name
+
+    A domain links an account only when the link is mutual (domain_verified:
+    the account names the domain and its xrp-ledger.toml lists the account),
+    so neither side can pull the other into its cluster alone.
+    """
+    has_metadata = (columns.domain != "") | (columns.twitter != "") | columns.verified
+    for index in np.flatnonzero(has_metadata):
+        node = account_node(columns.account_id[index])
+        domain = normalize_domain(columns.domain[index])
+        if domain and domain_verified is not None and domain_verified[index]:
+            yield node, f"domain:{domain}"
+        handle = columns.twitter[index].strip().lstrip('@').lower()
+        if handle:
+            yield node, f"twitter:{handle}"
+        # 名前は汎用的なものも多いので、XRPScanが確認済みのものだけ使う
+        if columns.verified[index] and columns.name[index] not in ("", "Unknown"):
+            yield node, f"name:{columns.name[index]}"
+
+def escrow_links(pairs: Iterable[Tuple[bytes, bytes]]) -> Iterable[Tuple[str, str]]:
+    """Links from escrows between two accounts (owner -> destination)"""
+    for owner, destination in pairs:
+        if owner != destination:
+            yield account_node(owner), account_node(destination)
+
+class EntityResolver:
+    """Cluster related accounts with a persisted, incremental union-find
+
+    Accounts are linked through shared metadata nodes (a domain verified
+    both ways against its xrp-ledger.toml, twitter handle, verified
+    well-known name) and, when ENTITY_ESCROW_LINKS=1, escrow
+    owner/destination pairs (collected only by the ledger source). A toml
+    listing alone never links an account. Links already applied in an
+    earlier run are skipped, so each snapshot only unions what is new.
+    Links and labels not seen for max_age are evicted and the clusters are
+    rebuilt from the rest. Every cluster is named after the most common
+    grouped_label among its labelled accounts, and Unknown accounts in it
+    take that name.
+    """
+
+    def __init__(self, state_path: str = STATE_PATH, link_escrows: Optional[bool] = None, max_age: int = MAX_AGE):
+        self.state_path = state_path
+        if link_escrows is None:
+            link_escrows = os.environ.get("ENTITY_ESCROW_LINKS", "") == "1"
+        self.link_escrows = link_escrows
+        self.max_age = max_age
+        self.sets = UnionFind()
+        self.links: Dict[str, float] = {}       # "ノード|ノード" -> 最後に見た時刻
+        self.groups: Dict[str, str] = {}        # アカウントノード -> 最後に見たラベル由来のgrouped_label
+        self.group_seen: Dict[str, float] = {}  # アカウントノード -> そのラベルを最後に見た時刻
+        self.load_state()
+
+    def load_state(self):
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return
+        self.sets = UnionFind(saved.get('parent', {}), saved.get('size', {}))
+        links = saved.get('links', {})
+        # 時刻を持たない古い形式（リンクの一覧）は読み込んだ時点で見たものとする
+        self.links = links if isinstance(links, dict) else dict.fromkeys(links, time.time())
+        self.groups = saved.get('groups', {})
+        self.group_seen = saved.get('group_seen', {})
+        for node in self.groups:
+            self.group_seen.setdefault(node, time.time())
+
+    def save_state(self):
+        self.sets.compress()
+        os.makedirs(os.path.dirname(self.state_path) or ".", exist_ok=True)
+        temp_path = f"{self.state_path}.temp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'parent': self.sets.parent,
+                'size': self.sets.size,
+                'links': self.links,
+                'groups': self.groups,
+                'group_seen': self.group_seen
+            }, f)
+        os.replace(temp_path, self.state_path)
+
+    def add_links(self, links: Iterable[Tuple[str, str]], now: float) -> int:
+        """Union the links not applied yet and refresh when every link was last seen"""
+        added = 0
+        for first, second in links:
+            key = f"{first}|{second}"
+            if key not in self.links:
+                self.sets.union(first, second)
+                added += 1
+            self.links[key] = now
+        return added
+
+    def evict(self, now: float) -> int:
+        """Drop links and labels not seen for max_age, rebuilding the clusters if any link went"""
+        cutoff = now - self.max_age
+        for node in [node for node, seen in self.group_seen.items() if seen < cutoff]:
+            del self.group_seen[node]
+            self.groups.pop(node, None)
+        expired = [key for key, seen in self.links.items() if seen < cutoff]
+        if not expired:
+            return 0
+        # union-findは分割できないので、残ったリンクから作り直す
+        for key in expired:
+            del self.links[key]
+        self.sets = UnionFind()
+        for key in self.links:
+            first, second = key.split("|", 1)
+            self.sets.union(first, second)
+        return len(expired)
+
+    def cluster_names(self) -> Dict[str, str]:
+        """Root -> grouped_label held by most of the cluster's labelled accounts"""
+        votes: Dict[str, Counter] = {}
+        for node, group in self.groups.items():
+            if node in self.sets:
+                votes.setdefault(self.sets.find(node), Counter())[group] += 1
+        # 同数の場合は名前順で決める（実行ごとに変わらないように）
+        return {root: min(counter.items(), key=lambda item: (-item[1], item[0]))[0]
+                for root, counter in votes.items()}
+
+    def resolve(self, columns: AccountColumns, grouped_labels: List[str],
+                escrow_pairs: Optional[Iterable[Tuple[bytes, bytes]]] = None,
+                domain_verified: Optional[np.ndarray] = None) -> List[str]:
+        """grouped_labels with Unknown accounts renamed after their cluster (state is saved)
+
+        domain_verified is RankedSnapshot.domain_verified; without it no
+        domain links are made.
+        """
+        now = time.time()
+        grouped_labels = list(grouped_labels)
+        labelled = np.array([group not in (None, UNKNOWN_GROUP) for group in grouped_labels], dtype=bool)
+        for index in np.flatnonzero(labelled):
+            node = account_node(columns.account_id[index])
+            self.groups[node] = grouped_labels[index]
+            self.group_seen[node] = now
+
+        added = self.add_links(account_links(columns, domain_verified), now)
+        if self.link_escrows and escrow_pairs is not None:
+            added += self.add_links(escrow_links(escrow_pairs), now)
+        evicted = self.evict(now)
+
+        # 名前の付いたクラスタに属するアカウントだけを1M行の配列と突き合わせる
+        names = self.cluster_names()
+        named = [(node, names[self.sets.find(node)]) for node in self.sets.parent
+                 if node.startswith("account:") and self.sets.find(node) in names]
+        renamed = 0
+        if named:
+            named_ids = np.array([bytes.fromhex(node[len("account:"):]) for node, _ in named],
+                                 dtype=f'S{ACCOUNT_ID_SIZE}')
+            group_of = {account_id_bytes(account_id): group for account_id, (_, group) in zip(named_ids, named)}
+            for index in np.flatnonzero(~labelled & np.isin(columns.account_id, named_ids)):
+                grouped_labels[index] = group_of[account_id_bytes(columns.account_id[index])]
+                renamed += 1
+
+        self.save_state()
+        print(f"Entity resolution: {added} new links, {evicted} expired, {len(names)} named clusters, "
+              f"{renamed} Unknown accounts grouped")
+        return grouped_labels
@@ -1,3 +1,104 @@
+-- table.sqlの適用後に実行する（何度実行してもよい）
+
+-- label_groups.jsonから生成（python label_groups.py）
+create or replace function group_label(label text)
+returns text
+language sql
+immutable
+as $$
+    SELECT CASE 
+        WHEN label LIKE 'Ripple%' THEN 'Ripple'
+        WHEN label LIKE 'Coinbase%' THEN 'Coinbase'
+        WHEN label LIKE 'Bitrue%' THEN 'Bitrue'
+        WHEN label LIKE 'bithomp%' THEN 'Bithomp'
+        WHEN label LIKE 'Bithomp%' THEN 'Bithomp'
+        WHEN label LIKE 'Bithumb%' THEN 'Bithumb'
+        WHEN label LIKE 'Binance%' THEN 'Binance'
+        WHEN label LIKE 'WhiteBIT%' THEN 'WhiteBIT'
+        WHEN label LIKE 'CoinCola%' THEN 'CoinCola'
+        WHEN label LIKE 'CoinSwitch%' THEN 'CoinSwitch'
+        WHEN label LIKE '%gatehub%' THEN 'gatehub'
+        WHEN label LIKE 'GateHub%' THEN 'gatehub'
+        WHEN label LIKE 'Crypto.com%' THEN 'Crypto.com'
+        WHEN label LIKE 'CROSSMARK%' THEN 'CROSSMARK'
+        WHEN label LIKE 'digifin%' THEN 'Digifin'
+        WHEN label LIKE 'eolas%' THEN 'eolas'
+        WHEN label LIKE 'eToro%' THEN 'eToro'
+        WHEN label LIKE 'Evernode Labs%' THEN 'Evernode Labs Ltd'
+        WHEN label LIKE 'Evernode%' THEN 'Evernode'
+        WHEN label LIKE 'FTX %' THEN 'FTX'
+        WHEN label LIKE 'Hotbit%' THEN 'Hotbit'
+        WHEN label LIKE 'Huobi%' THEN 'Huobi'
+        WHEN label LIKE 'Northern VoIP%' THEN 'Northern VoIP'
+        WHEN label LIKE 'SBI VC%' THEN 'SBI VC Trade'
+        WHEN label LIKE 'Sonar Muse%' THEN 'Sonar Muse'
+        WHEN label LIKE 'tequ%' THEN 'tequ'
+        WHEN label LIKE 'Vagabond%' THEN 'Vagabond'
+        WHEN label LIKE 'XUMM%' THEN 'XUMM'
+        ELSE REGEXP_REPLACE(
+            REGEXP_REPLACE(label, '^~', ''),
+            '\s*\([^)]*\)$', ''
+        )
+    END;
+$$;
+
+-- grouped_labelは取り込み時にPython側で付ける。付いていない行（古いローダーなど）はここで付ける
+CREATE OR REPLACE FUNCTION set_grouped_label()
+RETURNS TRIGGER AS $$
+BEGIN
+    NEW.grouped_label := group_label(NEW.label);
+    RETURN NEW;
+END;
+$$ language 'plpgsql';
+
+DROP TRIGGER IF EXISTS rich_list_set_grouped_label ON xrpl_rich_list;
+CREATE TRIGGER rich_list_set_grouped_label
+    BEFORE INSERT ON xrpl_rich_list
+    FOR EACH ROW
+    WHEN (NEW.grouped_label IS NULL)
+    EXECUTE FUNCTION set_grouped_label();
+
+UPDATE xrpl_rich_list SET grouped_label = group_label(label) WHERE grouped_label IS NULL;
+
+-- addressは非推奨（table.sql参照）。送られてこなかった行はaccount_idから埋めて、古い読み取り側にも見えるようにする
+CREATE OR REPLACE FUNCTION set_rich_list_address()
+RETURNS TRIGGER AS $$
+BEGIN
+    NEW.address := xrpl_address(NEW.account_id);
+    RETURN NEW;
+END;
+$$ language 'plpgsql';
+
+DROP TRIGGER IF EXISTS rich_list_set_address ON xrpl_rich_list;
+CREATE TRIGGER rich_list_set_address
+    BEFORE INSERT ON xrpl_rich_list
+    FOR EACH ROW
+    WHEN (NEW.address IS NULL)
+    EXECUTE FUNCTION set_rich_list_address();
+
+-- 1スナップショット分のサマリーを作る
+-- grouped_labelは取り込み時に付与済みなので単純なGROUP BYで済む。カテゴリ・国はグループ単位で付ける
+create or replace function insert_rich_list_summary(p_snapshot_ts timestamp with time zone)
+returns void
+language sql
+as $$
+    INSERT INTO xrpl_rich_list_summary (grouped_label, category, country, count, total_balance, total_escrow, total_xrp, created_at)
+    SELECT r.grouped_label, c.category, c.country, r.count, r.total_balance, r.total_escrow, r.total_xrp, p_snapshot_ts
+    FROM (
+        SELECT
+            grouped_label,
+            COUNT(*) as count,
+            -- dropsの整数で合計し、XRPへの変換はグループごとに1回だけ行う
+            SUM(balance_drops) / 1000000.0 as total_balance,
+            SUM(escrow_drops) / 1000000.0 as total_escrow,
+            SUM(balance_drops + escrow_drops) / 1000000.0 as total_xrp
+        FROM xrpl_rich_list
+        WHERE snapshot_date = p_snapshot_ts
+        GROUP BY grouped_label
+    ) r
+    LEFT JOIN xrpl_rich_list_categories c ON c.grouped_label = r.grouped_label;
+$$;
+
 -- サマリーテーブル更新用の関数
 create or replace function update_rich_list_summary()
 returns void
@@ -6,403 +107,143 @@ security definer
 SET statement_timeout = '60s'
 as $$
 begin
-    INSERT INTO xrpl_rich_list_summary (grouped_label, count, total_balance, total_escrow, total_xrp, created_at)
-    WITH latest_snapshot AS (
-        SELECT snapshot_date 
-        FROM xrpl_rich_list 
-        ORDER BY snapshot_date DESC 
-        LIMIT 1
-    )
-    SELECT 
-        CASE 
-            WHEN label LIKE 'Ripple%' THEN 'Ripple'
-            WHEN label LIKE 'Coinbase%' THEN 'Coinbase'
-            WHEN label LIKE 'Bitrue%' THEN 'Bitrue'
-            WHEN label LIKE 'bithomp%' THEN 'Bithomp'
-            WHEN label LIKE 'Bithomp%' THEN 'Bithomp'
-            WHEN label LIKE 'Bithumb%' THEN 'Bithumb'
-            WHEN label LIKE 'Binance%' THEN 'Binance'
-            WHEN label LIKE 'WhiteBIT%' THEN 'WhiteBIT'
-            WHEN label LIKE 'CoinCola%' THEN 'CoinCola'
-            WHEN label LIKE 'CoinSwitch%' THEN 'CoinSwitch'
-            WHEN label LIKE '%gatehub%' THEN 'gatehub'
-            WHEN label LIKE 'GateHub%' THEN 'gatehub'
-            WHEN label LIKE 'Crypto.com%' THEN 'Crypto.com'
-            WHEN label LIKE 'CROSSMARK%' THEN 'CROSSMARK'
-            WHEN label LIKE 'digifin%' THEN 'Digifin'
-            WHEN label LIKE 'eolas%' THEN 'eolas'
-            WHEN label LIKE 'eToro%' THEN 'eToro'
-            WHEN label LIKE 'Evernode Labs%' THEN 'Evernode Labs Ltd'
-            WHEN label LIKE 'Evernode%' THEN 'Evernode'
-            WHEN label LIKE 'FTX %' THEN 'FTX'
-            WHEN label LIKE 'Hotbit%' THEN 'Hotbit'
-            WHEN label LIKE 'Huobi%' THEN 'Huobi'
-            WHEN label LIKE 'Northern VoIP%' THEN 'Northern VoIP'
-            WHEN label LIKE 'SBI VC%' THEN 'SBI VC Trade'
-            WHEN label LIKE 'Sonar Muse%' THEN 'Sonar Muse'
-            WHEN label LIKE 'tequ%' THEN 'tequ'
-            WHEN label LIKE 'Vagabond%' THEN 'Vagabond'
-            WHEN label LIKE 'XUMM%' THEN 'XUMM'
-            ELSE REGEXP_REPLACE(
-                REGEXP_REPLACE(label, '^~', ''),
-                '\s*\([^)]*\)$', ''
-            )
-        END AS grouped_label,
-        COUNT(*) as count,
-        SUM(balance_xrp) as total_balance,
-        SUM(escrow_xrp) as total_escrow,
-        SUM(balance_xrp + escrow_xrp) as total_xrp,
-        (SELECT snapshot_date FROM latest_snapshot) as created_at
-    FROM xrpl_rich_list
-    WHERE snapshot_date = (SELECT snapshot_date FROM latest_snapshot)
-    GROUP BY 
-        CASE 
-            WHEN label LIKE 'Ripple%' THEN 'Ripple'
-            WHEN label LIKE 'Coinbase%' THEN 'Coinbase'
-            WHEN label LIKE 'Bitrue%' THEN 'Bitrue'
-            WHEN label LIKE 'bithomp%' THEN 'Bithomp'
-            WHEN label LIKE 'Bithomp%' THEN 'Bithomp'
-            WHEN label LIKE 'Bithumb%' THEN 'Bithumb'
-            WHEN label LIKE 'Binance%' THEN 'Binance'
-            WHEN label LIKE 'WhiteBIT%' THEN 'WhiteBIT'
-            WHEN label LIKE 'CoinCola%' THEN 'CoinCola'
-            WHEN label LIKE 'CoinSwitch%' THEN 'CoinSwitch'
-            WHEN label LIKE '%gatehub%' THEN 'gatehub'
-            WHEN label LIKE 'GateHub%' THEN 'gatehub'
-            WHEN label LIKE 'Crypto.com%' THEN 'Crypto.com'
-            WHEN label LIKE 'CROSSMARK%' THEN 'CROSSMARK'
-            WHEN label LIKE 'digifin%' THEN 'Digifin'
-            WHEN label LIKE 'eolas%' THEN 'eolas'
-            WHEN label LIKE 'eToro%' THEN 'eToro'
-            WHEN label LIKE 'Evernode Labs%' THEN 'Evernode Labs Ltd'
-            WHEN label LIKE 'Evernode%' THEN 'Evernode'
-            WHEN label LIKE 'FTX %' THEN 'FTX'
-            WHEN label LIKE 'Hotbit%' THEN 'Hotbit'
-            WHEN label LIKE 'Huobi%' THEN 'Huobi'
-            WHEN label LIKE 'Northern VoIP%' THEN 'Northern VoIP'
-            WHEN label LIKE 'SBI VC%' THEN 'SBI VC Trade'
-            WHEN label LIKE 'Sonar Muse%' THEN 'Sonar Muse'
-            WHEN label LIKE 'tequ%' THEN 'tequ'
-            WHEN label LIKE 'Vagabond%' THEN 'Vagabond'
-            WHEN label LIKE 'XUMM%' THEN 'XUMM'
-            ELSE REGEXP_REPLACE(
-                REGEXP_REPLACE(label, '^~', ''),
-                '\s*\([^)]*\)$', ''
-            )
-        END;
+    -- 途中までしか入っていないスナップショットは使わない（記録のない古い取り込みは最新の日時）
+    PERFORM insert_rich_list_summary(COALESCE(
+        (SELECT MAX(snapshot_date) FROM xrpl_rich_list_uploads WHERE completed_at IS NOT NULL),
+        (SELECT MAX(snapshot_date) FROM xrpl_rich_list)
+    ));
 end;
 $$;
 
--- 残高変更更新用の関数
-CREATE OR REPLACE FUNCTION update_balance_changes()
-RETURNS VOID
-LANGUAGE plpgsql
-SECURITY DEFINER
+-- アップロードの開始を記録する（同じrun_idの再実行では何もしない）
+create or replace function begin_rich_list_upload(p_run_id text, p_snapshot_date timestamp with time zone, p_expected_rows integer)
+returns void
+language plpgsql
+security definer
+as $$
+begin
+    INSERT INTO xrpl_rich_list_uploads (run_id, snapshot_date, expected_rows)
+    VALUES (p_run_id, p_snapshot_date, p_expected_rows)
+    ON CONFLICT (run_id) DO NOTHING;
+end;
+$$;
+
+-- スナップショットの全行がそろっていれば完了にしてtrueを返す（何度呼んでもよい）
+create or replace function complete_rich_list_upload(p_run_id text)
+returns boolean
+language plpgsql
+security definer
 SET statement_timeout = '60s'
-AS $$
-BEGIN    
-    -- 既存のデータを削除
-    DELETE FROM xrpl_rich_list_changes WHERE TRUE;
-    
-    -- 新しいデータを挿入
-    WITH current_totals AS (
-        SELECT 
-            grouped_label,
-            total_xrp,
-            created_at
-        FROM xrpl_rich_list_summary
-        WHERE created_at = (
-            SELECT created_at 
-            FROM xrpl_rich_list_summary 
-            ORDER BY created_at DESC 
-            LIMIT 1
+as $$
+declare
+    v_upload xrpl_rich_list_uploads%ROWTYPE;
+    v_rows integer;
+begin
+    SELECT * INTO v_upload FROM xrpl_rich_list_uploads WHERE run_id = p_run_id;
+    IF NOT FOUND THEN
+        RAISE EXCEPTION 'Unknown upload run %', p_run_id;
+    END IF;
+
+    SELECT COUNT(*) INTO v_rows FROM xrpl_rich_list WHERE snapshot_date = v_upload.snapshot_date;
+    UPDATE xrpl_rich_list_uploads SET uploaded_rows = v_rows WHERE run_id = p_run_id;
+    IF v_rows < v_upload.expected_rows THEN
+        RETURN false;
+    END IF;
+
+    UPDATE xrpl_rich_list_uploads
+    SET completed_at = COALESCE(completed_at, CURRENT_TIMESTAMP)
+    WHERE run_id = p_run_id;
+    RETURN true;
+end;
+$$;
+
+-- 途中で止まったアップロードの行を消し、古いアップロードの記録を整理する
+-- 開始から6時間たっても完了せず、同じ日時に完了した記録もないものは放棄されたとみなす（ジョブは1時間で打ち切られる）
+-- 完了した記録は7日分と最新の1件を残す（update_rich_list_summaryが最新の完了を使うため）
+create or replace function cleanup_rich_list_uploads()
+returns void
+language plpgsql
+security definer
+SET statement_timeout = '120s'
+as $$
+begin
+    WITH abandoned AS (
+        DELETE FROM xrpl_rich_list_uploads u
+        WHERE u.completed_at IS NULL
+        AND u.started_at < CURRENT_TIMESTAMP - INTERVAL '6 hours'
+        AND NOT EXISTS (
+            SELECT 1 FROM xrpl_rich_list_uploads c
+            WHERE c.snapshot_date = u.snapshot_date AND c.completed_at IS NOT NULL
         )
-    ),
-    period_changes AS (
-        SELECT 
-            c.grouped_label,
-            -- 1時間の変化
-            c.total_xrp - COALESCE(h1.total_xrp, c.total_xrp) as hour_1_change,
-            CASE 
-                WHEN COALESCE(h1.total_xrp, c.total_xrp) = 0 THEN 0
-                ELSE ((c.total_xrp - COALESCE(h1.total_xrp, c.total_xrp)) / COALESCE(h1.total_xrp, c.total_xrp) * 100)
-            END as hour_1_percentage,
-            -- 3時間の変化
-            c.total_xrp - COALESCE(h3.total_xrp, c.total_xrp) as hour_3_change,
-            CASE 
-                WHEN COALESCE(h3.total_xrp, c.total_xrp) = 0 THEN 0
-                ELSE ((c.total_xrp - COALESCE(h3.total_xrp, c.total_xrp)) / COALESCE(h3.total_xrp, c.total_xrp) * 100)
-            END as hour_3_percentage,
-            -- 24時間の変化
-            c.total_xrp - COALESCE(h24.total_xrp, c.total_xrp) as hour_24_change,
-            CASE 
-                WHEN COALESCE(h24.total_xrp, c.total_xrp) = 0 THEN 0
-                ELSE ((c.total_xrp - COALESCE(h24.total_xrp, c.total_xrp)) / COALESCE(h24.total_xrp, c.total_xrp) * 100)
-            END as hour_24_percentage,
-            -- 168時間（7日）の変化
-            c.total_xrp - COALESCE(h168.total_xrp, c.total_xrp) as hour_168_change,
-            CASE 
-                WHEN COALESCE(h168.total_xrp, c.total_xrp) = 0 THEN 0
-                ELSE ((c.total_xrp - COALESCE(h168.total_xrp, c.total_xrp)) / COALESCE(h168.total_xrp, c.total_xrp) * 100)
-            END as hour_168_percentage,
-            -- 720時間（30日）の変化
-            c.total_xrp - COALESCE(h720.total_xrp, c.total_xrp) as hour_720_change,
-            CASE 
-                WHEN COALESCE(h720.total_xrp, c.total_xrp) = 0 THEN 0
-                ELSE ((c.total_xrp - COALESCE(h720.total_xrp, c.total_xrp)) / COALESCE(h720.total_xrp, c.total_xrp) * 100)
-            END as hour_720_percentage
-        FROM current_totals c
-        -- 1時間前のデータ
-        LEFT JOIN xrpl_rich_list_summary h1 ON 
-            c.grouped_label = h1.grouped_label AND 
-            h1.created_at = (
-                SELECT created_at 
-                FROM xrpl_rich_list_summary 
-                WHERE created_at > c.created_at - INTERVAL '70 minutes'
-                AND created_at <= c.created_at - INTERVAL '45 minutes'
-                ORDER BY created_at DESC 
-                LIMIT 1
-            )
-        -- 3時間前のデータ
-        LEFT JOIN xrpl_rich_list_summary h3 ON 
-            c.grouped_label = h3.grouped_label AND 
-            h3.created_at = (
-                SELECT created_at 
-                FROM xrpl_rich_list_summary 
-                WHERE created_at <= c.created_at - INTERVAL '3 hours'
-                ORDER BY created_at DESC 
-                LIMIT 1
-            )
-        -- 24時間前のデータ
-        LEFT JOIN xrpl_rich_list_summary h24 ON 
-            c.grouped_label = h24.grouped_label AND 
-            h24.created_at = (
-                SELECT created_at 
-                FROM xrpl_rich_list_summary 
-                WHERE created_at <= c.created_at - INTERVAL '24 hours'
-                ORDER BY created_at DESC 
-                LIMIT 1
-            )
-        -- 168時間（7日）前のデータ
-        LEFT JOIN xrpl_rich_list_summary h168 ON 
-            c.grouped_label = h168.grouped_label AND 
-            h168.created_at = (
-                SELECT created_at 
-                FROM xrpl_rich_list_summary 
-                WHERE created_at <= c.created_at - INTERVAL '168 hours'
-                ORDER BY created_at DESC 
-                LIMIT 1
-            )
-        -- 720時間（30日）前のデータ
-        LEFT JOIN xrpl_rich_list_summary h720 ON 
-            c.grouped_label = h720.grouped_label AND 
-            h720.created_at = (
-                SELECT created_at 
-                FROM xrpl_rich_list_summary 
-                WHERE created_at <= c.created_at - INTERVAL '720 hours'
-                ORDER BY created_at DESC 
-                LIMIT 1
-            )
+        RETURNING u.snapshot_date
     )
-    INSERT INTO xrpl_rich_list_changes 
-        (grouped_label, hours, balance_change, percentage_change, calculated_at)
-    SELECT 
-        grouped_label,
-        1,
-        hour_1_change,
-        hour_1_percentage,
-        CURRENT_TIMESTAMP
-    FROM period_changes
-    UNION ALL
-    SELECT 
-        grouped_label,
-        3,
-        hour_3_change,
-        hour_3_percentage,
-        CURRENT_TIMESTAMP
-    FROM period_changes
-    UNION ALL
-    SELECT 
-        grouped_label,
-        24,
-        hour_24_change,
-        hour_24_percentage,
-        CURRENT_TIMESTAMP
-    FROM period_changes
-    UNION ALL
-    SELECT 
-        grouped_label,
-        168,
-        hour_168_change,
-        hour_168_percentage,
-        CURRENT_TIMESTAMP
-    FROM period_changes
-    UNION ALL
-    SELECT 
-        grouped_label,
-        720,
-        hour_720_change,
-        hour_720_percentage,
-        CURRENT_TIMESTAMP
-    FROM period_changes;
-END;
-$$;
+    DELETE FROM xrpl_rich_list r
+    USING (SELECT DISTINCT snapshot_date FROM abandoned) a
+    WHERE r.snapshot_date = a.snapshot_date;
 
+    DELETE FROM xrpl_rich_list_uploads
+    WHERE completed_at IS NOT NULL
+    AND snapshot_date < CURRENT_TIMESTAMP - INTERVAL '7 days'
+    AND snapshot_date < (SELECT MAX(snapshot_date) FROM xrpl_rich_list_uploads WHERE completed_at IS NOT NULL);
+end;
+$$;
 
-CREATE OR REPLACE FUNCTION update_available_changes()
-RETURNS VOID
-LANGUAGE plpgsql
-SECURITY DEFINER
+-- 内容が前回と同じスナップショット用：最新のサマリーを新しい日時で複製する
+create or replace function carry_forward_rich_list_summary(p_created_at timestamp with time zone)
+returns void
+language plpgsql
+security definer
 SET statement_timeout = '60s'
-AS $$
-BEGIN
-    -- 既存のデータを削除
-    DELETE FROM xrpl_rich_list_available_changes WHERE TRUE;
-    
-    -- 新しいデータを挿入
-    WITH current_totals AS (
-        SELECT 
-            grouped_label,
-            total_balance,
-            created_at
-        FROM xrpl_rich_list_summary
-        WHERE created_at = (
-            SELECT created_at 
-            FROM xrpl_rich_list_summary 
-            ORDER BY created_at DESC 
-            LIMIT 1
-        )
-    ),
-    period_changes AS (
-        SELECT 
-            c.grouped_label,
-            -- 1時間の変化
-            c.total_balance - COALESCE(h1.total_balance, c.total_balance) as hour_1_change,
-            CASE 
-                WHEN COALESCE(h1.total_balance, c.total_balance) = 0 THEN 0
-                ELSE ((c.total_balance - COALESCE(h1.total_balance, c.total_balance)) / COALESCE(h1.total_balance, c.total_balance) * 100)
-            END as hour_1_percentage,
-            -- 3時間の変化
-            c.total_balance - COALESCE(h3.total_balance, c.total_balance) as hour_3_change,
-            CASE 
-                WHEN COALESCE(h3.total_balance, c.total_balance) = 0 THEN 0
-                ELSE ((c.total_balance - COALESCE(h3.total_balance, c.total_balance)) / COALESCE(h3.total_balance, c.total_balance) * 100)
-            END as hour_3_percentage,
-            -- 24時間の変化
-            c.total_balance - COALESCE(h24.total_balance, c.total_balance) as hour_24_change,
-            CASE 
-                WHEN COALESCE(h24.total_balance, c.total_balance) = 0 THEN 0
-                ELSE ((c.total_balance - COALESCE(h24.total_balance, c.total_balance)) / COALESCE(h24.total_balance, c.total_balance) * 100)
-            END as hour_24_percentage,
-            -- 168時間（7日）の変化
-            c.total_balance - COALESCE(h168.total_balance, c.total_balance) as hour_168_change,
-            CASE 
-                WHEN COALESCE(h168.total_balance, c.total_balance) = 0 THEN 0
-                ELSE ((c.total_balance - COALESCE(h168.total_balance, c.total_balance)) / COALESCE(h168.total_balance, c.total_balance) * 100)
-            END as hour_168_percentage,
-            -- 720時間（30日）の変化
-            c.total_balance - COALESCE(h720.total_balance, c.total_balance) as hour_720_change,
-            CASE 
-                WHEN COALESCE(h720.total_balance, c.total_balance) = 0 THEN 0
-                ELSE ((c.total_balance - COALESCE(h720.total_balance, c.total_balance)) / COALESCE(h720.total_balance, c.total_balance) * 100)
-            END as hour_720_percentage
-        FROM current_totals c
-        -- 1時間前のデータ
-        LEFT JOIN xrpl_rich_list_summary h1 ON 
-            c.grouped_label = h1.grouped_label AND 
-            h1.created_at = (
-                SELECT created_at 
-                FROM xrpl_rich_list_summary 
-                WHERE created_at > c.created_at - INTERVAL '70 minutes'
-                AND created_at <= c.created_at - INTERVAL '45 minutes'
-                ORDER BY created_at DESC 
-                LIMIT 1
-            )
-        -- 3時間前のデータ
-        LEFT JOIN xrpl_rich_list_summary h3 ON 
-            c.grouped_label = h3.grouped_label AND 
-            h3.created_at = (
-                SELECT created_at 
-                FROM xrpl_rich_list_summary 
-                WHERE created_at <= c.created_at - INTERVAL '3 hours'
-                ORDER BY created_at DESC 
-                LIMIT 1
-            )
-        -- 24時間前のデータ
-        LEFT JOIN xrpl_rich_list_summary h24 ON 
-            c.grouped_label = h24.grouped_label AND 
-            h24.created_at = (
-                SELECT created_at 
-                FROM xrpl_rich_list_summary 
-                WHERE created_at <= c.created_at - INTERVAL '24 hours'
-                ORDER BY created_at DESC 
-                LIMIT 1
-            )
-        -- 168時間（7日）前のデータ
-        LEFT JOIN xrpl_rich_list_summary h168 ON 
-            c.grouped_label = h168.grouped_label AND 
-            h168.created_at = (
-                SELECT created_at 
-                FROM xrpl_rich_list_summary 
-                WHERE created_at <= c.created_at - INTERVAL '168 hours'
-                ORDER BY created_at DESC 
-                LIMIT 1
-            )
-        -- 720時間（30日）前のデータ
-        LEFT JOIN xrpl_rich_list_summary h720 ON 
-            c.grouped_label = h720.grouped_label AND 
-            h720.created_at = (
-                SELECT created_at 
-                FROM xrpl_rich_list_summary 
-                WHERE created_at <= c.created_at - INTERVAL '720 hours'
-                ORDER BY created_at DESC 
-                LIMIT 1
-            )
+as $$
+begin
+    INSERT INTO xrpl_rich_list_summary (grouped_label, category, country, count, total_balance, total_escrow, total_xrp, created_at)
+    SELECT grouped_label, category, country, count, total_balance, total_escrow, total_xrp, p_created_at
+    FROM xrpl_rich_list_summary
+    WHERE created_at = (SELECT MAX(created_at) FROM xrpl_rich_list_summary)
+    AND created_at < p_created_at;
+end;
+$$;
+
+-- 変化量の基準時刻（hours = 0 が最新、該当するスナップショットがない期間はNULL）
+-- xrpl_rich_list_snapshot_timesの主キーを後ろから1件ずつ引くだけなので、サマリーの行数によらない
+create or replace function rich_list_change_periods()
+returns table (hours integer, created_at timestamp with time zone)
+language sql
+stable
+as $$
+    WITH latest AS (
+        SELECT MAX(t.created_at) AS created_at FROM xrpl_rich_list_snapshot_times t
     )
-    INSERT INTO xrpl_rich_list_available_changes 
-        (grouped_label, hours, balance_change, percentage_change, calculated_at)
-    SELECT 
-        grouped_label,
-        1,
-        hour_1_change,
-        hour_1_percentage,
-        CURRENT_TIMESTAMP
-    FROM period_changes
-    UNION ALL
-    SELECT 
-        grouped_label,
-        3,
-        hour_3_change,
-        hour_3_percentage,
-        CURRENT_TIMESTAMP
-    FROM period_changes
-    UNION ALL
-    SELECT 
-        grouped_label,
-        24,
-        hour_24_change,
-        hour_24_percentage,
-        CURRENT_TIMESTAMP
-    FROM period_changes
-    UNION ALL
-    SELECT 
-        grouped_label,
-        168,
-        hour_168_change,
-        hour_168_percentage,
-        CURRENT_TIMESTAMP
-    FROM period_changes
-    UNION ALL
-    SELECT 
-        grouped_label,
-        720,
-        hour_720_change,
-        hour_720_percentage,
-        CURRENT_TIMESTAMP
-    FROM period_changes;
-END;
+    SELECT
+        p.hours,
+        (SELECT t.created_at
+         FROM xrpl_rich_list_snapshot_times t
+         WHERE t.created_at <= latest.created_at - p.back
+         -- 1時間前は45〜70分前の範囲にあるものだけ
+         AND (p.not_before IS NULL OR t.created_at > latest.created_at - p.not_before)
+         ORDER BY t.created_at DESC
+         LIMIT 1)
+    FROM latest
+    CROSS JOIN (VALUES
+        (0, INTERVAL '0', NULL::INTERVAL),
+        (1, INTERVAL '45 minutes', INTERVAL '70 minutes'),
+        (3, INTERVAL '3 hours', NULL),
+        (24, INTERVAL '24 hours', NULL),
+        (168, INTERVAL '168 hours', NULL),
+        (720, INTERVAL '720 hours', NULL)
+    ) AS p(hours, back, not_before)
+    WHERE latest.created_at IS NOT NULL;
 $$;
 
+-- 変化量と時系列統計はrun_post_ingestが作るので、以前の個別の関数は消す
+DROP FUNCTION IF EXISTS update_balance_changes();
+DROP FUNCTION IF EXISTS update_available_changes();
+DROP FUNCTION IF EXISTS update_category_changes();
+DROP FUNCTION IF EXISTS update_country_changes();
+DROP FUNCTION IF EXISTS update_hourly_statistics();
+DROP FUNCTION IF EXISTS update_category_statistics();
+DROP FUNCTION IF EXISTS update_country_statistics();
+DROP FUNCTION IF EXISTS update_available_statistics();
 
 -- データクリーンアップ用の関数
 create or replace function cleanup_old_rich_list_data()
@@ -418,533 +259,9 @@ begin
     
     DELETE FROM xrpl_rich_list_summary
     WHERE created_at < CURRENT_TIMESTAMP - INTERVAL '730 days';
-end;
-$$;
-
--- カテゴリ別の残高変更を更新する関数
-CREATE OR REPLACE FUNCTION update_category_changes()
-RETURNS VOID
-LANGUAGE plpgsql
-SECURITY DEFINER
-SET statement_timeout = '60s'
-AS $$
-BEGIN
-    -- 既存のデータを削除
-    DELETE FROM xrpl_rich_list_category_changes WHERE TRUE;
-    
-    -- 新しいデータを挿入
-    WITH current_totals AS (
-        SELECT 
-            c.category,
-            SUM(count) as count,
-            SUM(s.total_balance) as total_balance,
-            SUM(s.total_escrow) as total_escrow,
-            SUM(s.total_xrp) as total_xrp,
-            s.created_at
-        FROM xrpl_rich_list_summary s
-        JOIN xrpl_rich_list_categories c ON s.grouped_label = c.grouped_label
-        WHERE s.created_at = (
-            SELECT created_at 
-            FROM xrpl_rich_list_summary 
-            ORDER BY created_at DESC 
-            LIMIT 1
-        )
-        GROUP BY c.category, s.created_at
-    ),
-    period_changes AS (
-        SELECT 
-            c.category,
-            c.count,
-            c.total_balance,
-            c.total_escrow,
-            c.total_xrp,
-            -- 1時間の変化
-            c.total_xrp - COALESCE(h1.total_xrp, c.total_xrp) as hour_1_change,
-            CASE 
-                WHEN COALESCE(h1.total_xrp, c.total_xrp) = 0 THEN 0
-                ELSE ((c.total_xrp - COALESCE(h1.total_xrp, c.total_xrp)) / COALESCE(h1.total_xrp, c.total_xrp) * 100)
-            END as hour_1_percentage,
-            -- 3時間の変化
-            c.total_xrp - COALESCE(h3.total_xrp, c.total_xrp) as hour_3_change,
-            CASE 
-                WHEN COALESCE(h3.total_xrp, c.total_xrp) = 0 THEN 0
-                ELSE ((c.total_xrp - COALESCE(h3.total_xrp, c.total_xrp)) / COALESCE(h3.total_xrp, c.total_xrp) * 100)
-            END as hour_3_percentage,
-            -- 24時間の変化
-            c.total_xrp - COALESCE(h24.total_xrp, c.total_xrp) as hour_24_change,
-            CASE 
-                WHEN COALESCE(h24.total_xrp, c.total_xrp) = 0 THEN 0
-                ELSE ((c.total_xrp - COALESCE(h24.total_xrp, c.total_xrp)) / COALESCE(h24.total_xrp, c.total_xrp) * 100)
-            END as hour_24_percentage,
-            -- 168時間（7日）の変化
-            c.total_xrp - COALESCE(h168.total_xrp, c.total_xrp) as hour_168_change,
-            CASE 
-                WHEN COALESCE(h168.total_xrp, c.total_xrp) = 0 THEN 0
-                ELSE ((c.total_xrp - COALESCE(h168.total_xrp, c.total_xrp)) / COALESCE(h168.total_xrp, c.total_xrp) * 100)
-            END as hour_168_percentage,
-            -- 720時間（30日）の変化
-            c.total_xrp - COALESCE(h720.total_xrp, c.total_xrp) as hour_720_change,
-            CASE 
-                WHEN COALESCE(h720.total_xrp, c.total_xrp) = 0 THEN 0
-                ELSE ((c.total_xrp - COALESCE(h720.total_xrp, c.total_xrp)) / COALESCE(h720.total_xrp, c.total_xrp) * 100)
-            END as hour_720_percentage
-        FROM current_totals c
-        -- 1時間前のデータ
-        LEFT JOIN (
-            SELECT 
-                c.category,
-                SUM(s.total_xrp) as total_xrp
-            FROM xrpl_rich_list_summary s
-            JOIN xrpl_rich_list_categories c ON s.grouped_label = c.grouped_label
-            WHERE s.created_at = (
-                SELECT created_at 
-                FROM xrpl_rich_list_summary 
-                WHERE created_at > (SELECT created_at FROM current_totals LIMIT 1) - INTERVAL '70 minutes'
-                AND created_at <= (SELECT created_at FROM current_totals LIMIT 1) - INTERVAL '45 minutes'
-                ORDER BY created_at DESC 
-                LIMIT 1
-            )
-            GROUP BY c.category
-        ) h1 ON c.category = h1.category
-        -- 3時間前のデータ
-        LEFT JOIN (
-            SELECT 
-                c.category,
-                SUM(s.total_xrp) as total_xrp
-            FROM xrpl_rich_list_summary s
-            JOIN xrpl_rich_list_categories c ON s.grouped_label = c.grouped_label
-            WHERE s.created_at = (
-                SELECT created_at 
-                FROM xrpl_rich_list_summary 
-                WHERE created_at <= (SELECT created_at FROM current_totals LIMIT 1) - INTERVAL '3 hours'
-                ORDER BY created_at DESC 
-                LIMIT 1
-            )
-            GROUP BY c.category
-        ) h3 ON c.category = h3.category
-        -- 24時間前のデータ
-        LEFT JOIN (
-            SELECT 
-                c.category,
-                SUM(s.total_xrp) as total_xrp
-            FROM xrpl_rich_list_summary s
-            JOIN xrpl_rich_list_categories c ON s.grouped_label = c.grouped_label
-            WHERE s.created_at = (
-                SELECT created_at 
-                FROM xrpl_rich_list_summary 
-                WHERE created_at <= (SELECT created_at FROM current_totals LIMIT 1) - INTERVAL '24 hours'
-                ORDER BY created_at DESC 
-                LIMIT 1
-            )
-            GROUP BY c.category
-        ) h24 ON c.category = h24.category
-        -- 168時間前のデータ
-        LEFT JOIN (
-            SELECT 
-                c.category,
-                SUM(s.total_xrp) as total_xrp
-            FROM xrpl_rich_list_summary s
-            JOIN xrpl_rich_list_categories c ON s.grouped_label = c.grouped_label
-            WHERE s.created_at = (
-                SELECT created_at 
-                FROM xrpl_rich_list_summary 
-                WHERE created_at <= (SELECT created_at FROM current_totals LIMIT 1) - INTERVAL '168 hours'
-                ORDER BY created_at DESC 
-                LIMIT 1
-            )
-            GROUP BY c.category
-        ) h168 ON c.category = h168.category
-        -- 720時間前のデータ
-        LEFT JOIN (
-            SELECT 
-                c.category,
-                SUM(s.total_xrp) as total_xrp
-            FROM xrpl_rich_list_summary s
-            JOIN xrpl_rich_list_categories c ON s.grouped_label = c.grouped_label
-            WHERE s.created_at = (
-                SELECT created_at 
-                FROM xrpl_rich_list_summary 
-                WHERE created_at <= (SELECT created_at FROM current_totals LIMIT 1) - INTERVAL '720 hours'
-                ORDER BY created_at DESC 
-                LIMIT 1
-            )
-            GROUP BY c.category
-        ) h720 ON c.category = h720.category
-    )
-    INSERT INTO xrpl_rich_list_category_changes 
-        (category, hours, count, total_balance, total_escrow, total_xrp, balance_change, percentage_change, calculated_at)
-    SELECT 
-        category,
-        1,
-        count,
-        total_balance,
-        total_escrow,
-        total_xrp,
-        hour_1_change,
-        hour_1_percentage,
-        CURRENT_TIMESTAMP
-    FROM period_changes
-    UNION ALL
-    SELECT 
-        category,
-        3,
-        count,
-        total_balance,
-        total_escrow,
-        total_xrp,
-        hour_3_change,
-        hour_3_percentage,
-        CURRENT_TIMESTAMP
-    FROM period_changes
-    UNION ALL
-    SELECT 
-        category,
-        24,
-        count,
-        total_balance,
-        total_escrow,
-        total_xrp,
-        hour_24_change,
-        hour_24_percentage,
-        CURRENT_TIMESTAMP
-    FROM period_changes
-    UNION ALL
-    SELECT 
-        category,
-        168,
-        count,
-        total_balance,
-        total_escrow,
-        total_xrp,
-        hour_168_change,
-        hour_168_percentage,
-        CURRENT_TIMESTAMP
-    FROM period_changes
-    UNION ALL
-    SELECT 
-        category,
-        720,
-        count,
-        total_balance,
-        total_escrow,
-        total_xrp,
-        hour_720_change,
-        hour_720_percentage,
-        CURRENT_TIMESTAMP
-    FROM period_changes;
-END;
-$$;
 
--- 国別の残高変更を更新する関数
-CREATE OR REPLACE FUNCTION update_country_changes()
-RETURNS VOID
-LANGUAGE plpgsql
-SECURITY DEFINER
-SET statement_timeout = '60s'
-AS $$
-BEGIN
-    -- 既存のデータを削除
-    DELETE FROM xrpl_rich_list_country_changes WHERE TRUE;
-    
-    -- 新しいデータを挿入
-    WITH current_totals AS (
-        SELECT 
-            c.country,
-            SUM(count) as count,
-            SUM(s.total_balance) as total_balance,
-            SUM(s.total_escrow) as total_escrow,
-            SUM(s.total_xrp) as total_xrp,
-            s.created_at
-        FROM xrpl_rich_list_summary s
-        JOIN xrpl_rich_list_categories c ON s.grouped_label = c.grouped_label
-        WHERE s.created_at = (
-            SELECT created_at 
-            FROM xrpl_rich_list_summary 
-            ORDER BY created_at DESC 
-            LIMIT 1
-        )
-        GROUP BY c.country, s.created_at
-    ),
-    period_changes AS (
-        SELECT 
-            c.country,
-            c.count,
-            c.total_balance,
-            c.total_escrow,
-            c.total_xrp,
-            -- 1時間の変化
-            c.total_xrp - COALESCE(h1.total_xrp, c.total_xrp) as hour_1_change,
-            CASE 
-                WHEN COALESCE(h1.total_xrp, c.total_xrp) = 0 THEN 0
-                ELSE ((c.total_xrp - COALESCE(h1.total_xrp, c.total_xrp)) / COALESCE(h1.total_xrp, c.total_xrp) * 100)
-            END as hour_1_percentage,
-            -- 3時間の変化
-            c.total_xrp - COALESCE(h3.total_xrp, c.total_xrp) as hour_3_change,
-            CASE 
-                WHEN COALESCE(h3.total_xrp, c.total_xrp) = 0 THEN 0
-                ELSE ((c.total_xrp - COALESCE(h3.total_xrp, c.total_xrp)) / COALESCE(h3.total_xrp, c.total_xrp) * 100)
-            END as hour_3_percentage,
-            -- 24時間の変化
-            c.total_xrp - COALESCE(h24.total_xrp, c.total_xrp) as hour_24_change,
-            CASE 
-                WHEN COALESCE(h24.total_xrp, c.total_xrp) = 0 THEN 0
-                ELSE ((c.total_xrp - COALESCE(h24.total_xrp, c.total_xrp)) / COALESCE(h24.total_xrp, c.total_xrp) * 100)
-            END as hour_24_percentage,
-            -- 168時間（7日）の変化
-            c.total_xrp - COALESCE(h168.total_xrp, c.total_xrp) as hour_168_change,
-            CASE 
-                WHEN COALESCE(h168.total_xrp, c.total_xrp) = 0 THEN 0
-                ELSE ((c.total_xrp - COALESCE(h168.total_xrp, c.total_xrp)) / COALESCE(h168.total_xrp, c.total_xrp) * 100)
-            END as hour_168_percentage,
-            -- 720時間（30日）の変化
-            c.total_xrp - COALESCE(h720.total_xrp, c.total_xrp) as hour_720_change,
-            CASE 
-                WHEN COALESCE(h720.total_xrp, c.total_xrp) = 0 THEN 0
-                ELSE ((c.total_xrp - COALESCE(h720.total_xrp, c.total_xrp)) / COALESCE(h720.total_xrp, c.total_xrp) * 100)
-            END as hour_720_percentage
-        FROM current_totals c
-        -- 1時間前のデータ
-        LEFT JOIN (
-            SELECT 
-                c.country,
-                SUM(s.total_xrp) as total_xrp,
-                s.created_at
-            FROM xrpl_rich_list_summary s
-            JOIN xrpl_rich_list_categories c ON s.grouped_label = c.grouped_label
-            WHERE s.created_at = (
-                SELECT created_at 
-                FROM xrpl_rich_list_summary 
-                WHERE created_at > (SELECT created_at FROM current_totals LIMIT 1) - INTERVAL '70 minutes'
-                AND created_at <= (SELECT created_at FROM current_totals LIMIT 1) - INTERVAL '45 minutes'
-                ORDER BY created_at DESC 
-                LIMIT 1
-            )
-            GROUP BY c.country, s.created_at
-        ) h1 ON c.country = h1.country
-        -- 3時間前のデータ
-        LEFT JOIN (
-            SELECT 
-                c.country,
-                SUM(s.total_xrp) as total_xrp,
-                s.created_at
-            FROM xrpl_rich_list_summary s
-            JOIN xrpl_rich_list_categories c ON s.grouped_label = c.grouped_label
-            WHERE s.created_at = (
-                SELECT created_at 
-                FROM xrpl_rich_list_summary 
-                WHERE created_at <= (SELECT created_at FROM current_totals LIMIT 1) - INTERVAL '3 hours'
-                ORDER BY created_at DESC 
-                LIMIT 1
-            )
-            GROUP BY c.country, s.created_at
-        ) h3 ON c.country = h3.country
-        -- 24時間前のデータ
-        LEFT JOIN (
-            SELECT 
-                c.country,
-                SUM(s.total_xrp) as total_xrp,
-                s.created_at
-            FROM xrpl_rich_list_summary s
-            JOIN xrpl_rich_list_categories c ON s.grouped_label = c.grouped_label
-            WHERE s.created_at = (
-                SELECT created_at 
-                FROM xrpl_rich_list_summary 
-                WHERE created_at <= (SELECT created_at FROM current_totals LIMIT 1) - INTERVAL '24 hours'
-                ORDER BY created_at DESC 
-                LIMIT 1
-            )
-            GROUP BY c.country, s.created_at
-        ) h24 ON c.country = h24.country
-        -- 168時間前のデータ
-        LEFT JOIN (
-            SELECT 
-                c.country,
-                SUM(s.total_xrp) as total_xrp,
-                s.created_at
-            FROM xrpl_rich_list_summary s
-            JOIN xrpl_rich_list_categories c ON s.grouped_label = c.grouped_label
-            WHERE s.created_at = (
-                SELECT created_at 
-                FROM xrpl_rich_list_summary 
-                WHERE created_at <= (SELECT created_at FROM current_totals LIMIT 1) - INTERVAL '168 hours'
-                ORDER BY created_at DESC 
-                LIMIT 1
-            )
-            GROUP BY c.country, s.created_at
-        ) h168 ON c.country = h168.country
-        -- 720時間前のデータ
-        LEFT JOIN (
-            SELECT 
-                c.country,
-                SUM(s.total_xrp) as total_xrp,
-                s.created_at
-            FROM xrpl_rich_list_summary s
-            JOIN xrpl_rich_list_categories c ON s.grouped_label = c.grouped_label
-            WHERE s.created_at = (
-                SELECT created_at 
-                FROM xrpl_rich_list_summary 
-                WHERE created_at <= (SELECT created_at FROM current_totals LIMIT 1) - INTERVAL '720 hours'
-                ORDER BY created_at DESC 
-                LIMIT 1
-            )
-            GROUP BY c.country, s.created_at
-        ) h720 ON c.country = h720.country
-    )
-    INSERT INTO xrpl_rich_list_country_changes 
-        (country, hours, count, total_balance, total_escrow, total_xrp, balance_change, percentage_change, calculated_at)
-    SELECT 
-        country,
-        1,
-        count,
-        total_balance,
-        total_escrow,
-        total_xrp,
-        hour_1_change,
-        hour_1_percentage,
-        CURRENT_TIMESTAMP
-    FROM period_changes
-    UNION ALL
-    SELECT 
-        country,
-        3,
-        count,
-        total_balance,
-        total_escrow,
-        total_xrp,
-        hour_3_change,
-        hour_3_percentage,
-        CURRENT_TIMESTAMP
-    FROM period_changes
-    UNION ALL
-    SELECT 
-        country,
-        24,
-        count,
-        total_balance,
-        total_escrow,
-        total_xrp,
-        hour_24_change,
-        hour_24_percentage,
-        CURRENT_TIMESTAMP
-    FROM period_changes
-    UNION ALL
-    SELECT 
-        country,
-        168,
-        count,
-        total_balance,
-        total_escrow,
-        total_xrp,
-        hour_168_change,
-        hour_168_percentage,
-        CURRENT_TIMESTAMP
-    FROM period_changes
-    UNION ALL
-    SELECT 
-        country,
-        720,
-        count,
-        total_balance,
-        total_escrow,
-        total_xrp,
-        hour_720_change,
-        hour_720_percentage,
-        CURRENT_TIMESTAMP
-    FROM period_changes;
-END;
-$$;
-
--- 更新用の関数を修正
-CREATE OR REPLACE FUNCTION update_hourly_statistics()
-RETURNS VOID
-LANGUAGE plpgsql
-SECURITY DEFINER
-AS $$
-BEGIN
-    -- 古いデータの削除（3日以上前のデータを削除）
-    DELETE FROM xrpl_rich_list_category_hourly 
-    WHERE created_at < CURRENT_TIMESTAMP AT TIME ZONE 'UTC' - INTERVAL '3 days';
-    
-    DELETE FROM xrpl_rich_list_country_hourly 
-    WHERE created_at < CURRENT_TIMESTAMP AT TIME ZONE 'UTC' - INTERVAL '3 days';
-    
-    DELETE FROM xrpl_rich_list_available_hourly 
-    WHERE created_at < CURRENT_TIMESTAMP AT TIME ZONE 'UTC' - INTERVAL '3 days';
-    
-    -- カテゴリごとの最新データを挿入
-    INSERT INTO xrpl_rich_list_category_hourly 
-        (grouped_label, count, total_balance, total_escrow, total_xrp, created_at)
-    WITH latest_summary AS (
-        SELECT *
-        FROM xrpl_rich_list_summary s
-        WHERE s.created_at >= CURRENT_TIMESTAMP AT TIME ZONE 'UTC' - INTERVAL '3 days'
-    )
-    SELECT 
-        c.category as grouped_label,
-        SUM(s.count) as count,
-        SUM(s.total_balance) as total_balance,
-        SUM(s.total_escrow) as total_escrow,
-        SUM(s.total_xrp) as total_xrp,
-        date_trunc('hour', s.created_at AT TIME ZONE 'UTC') as created_at
-    FROM latest_summary s
-    JOIN xrpl_rich_list_categories c ON s.grouped_label = c.grouped_label
-    GROUP BY c.category, date_trunc('hour', s.created_at AT TIME ZONE 'UTC')
-    ON CONFLICT (grouped_label, created_at) 
-    DO UPDATE SET
-        count = EXCLUDED.count,
-        total_balance = EXCLUDED.total_balance,
-        total_escrow = EXCLUDED.total_escrow,
-        total_xrp = EXCLUDED.total_xrp;
-    
-    -- 国ごとの最新データを挿入
-    INSERT INTO xrpl_rich_list_country_hourly 
-        (grouped_label, count, total_balance, total_escrow, total_xrp, created_at)
-    WITH latest_summary AS (
-        SELECT *
-        FROM xrpl_rich_list_summary s
-        WHERE s.created_at >= CURRENT_TIMESTAMP AT TIME ZONE 'UTC' - INTERVAL '3 days'
-    )
-    SELECT 
-        c.country as grouped_label,
-        SUM(s.count) as count,
-        SUM(s.total_balance) as total_balance,
-        SUM(s.total_escrow) as total_escrow,
-        SUM(s.total_xrp) as total_xrp,
-        date_trunc('hour', s.created_at AT TIME ZONE 'UTC') as created_at
-    FROM latest_summary s
-    JOIN xrpl_rich_list_categories c ON s.grouped_label = c.grouped_label
-    GROUP BY c.country, date_trunc('hour', s.created_at AT TIME ZONE 'UTC')
-    ON CONFLICT (grouped_label, created_at) 
-    DO UPDATE SET
-        count = EXCLUDED.count,
-        total_balance = EXCLUDED.total_balance,
-        total_escrow = EXCLUDED.total_escrow,
-        total_xrp = EXCLUDED.total_xrp;
-
-    -- エスクロー抜きの最新データを挿入
-    INSERT INTO xrpl_rich_list_available_hourly 
-        (grouped_label, count, total_balance, total_escrow, total_xrp, created_at)
-    WITH latest_summary AS (
-        SELECT *
-        FROM xrpl_rich_list_summary s
-        WHERE s.created_at >= CURRENT_TIMESTAMP AT TIME ZONE 'UTC' - INTERVAL '3 days'
-    )
-    SELECT 
-        s.grouped_label,
-        s.count,
-        s.total_balance,
-        s.total_escrow,
-        s.total_balance as total_xrp,
-        date_trunc('hour', s.created_at AT TIME ZONE 'UTC') as created_at
-    FROM latest_summary s
-    GROUP BY s.grouped_label, s.count, s.total_balance, s.total_escrow, date_trunc('hour', s.created_at AT TIME ZONE 'UTC')
-    ON CONFLICT (grouped_label, created_at) 
-    DO UPDATE SET
-        count = EXCLUDED.count,
-        total_balance = EXCLUDED.total_balance,
-        total_escrow = EXCLUDED.total_escrow,
-        total_xrp = EXCLUDED.total_xrp;
-END;
+    PERFORM cleanup_rich_list_uploads();
+end;
 $$;
 
 -- 古いデータ削除用の関数
@@ -965,101 +282,6 @@ BEGIN
 END;
 $$;
 
--- カテゴリ統計更新用の関数
-CREATE OR REPLACE FUNCTION update_category_statistics()
-RETURNS VOID
-LANGUAGE plpgsql
-SECURITY DEFINER
-AS $$
-BEGIN
-    INSERT INTO xrpl_rich_list_category_hourly 
-        (grouped_label, count, total_balance, total_escrow, total_xrp, created_at)
-    WITH latest_summary AS (
-        SELECT *
-        FROM xrpl_rich_list_summary s
-        WHERE s.created_at >= CURRENT_TIMESTAMP AT TIME ZONE 'UTC' - INTERVAL '3 days'
-    )
-    SELECT 
-        c.category as grouped_label,
-        SUM(s.count) as count,
-        SUM(s.total_balance) as total_balance,
-        SUM(s.total_escrow) as total_escrow,
-        SUM(s.total_xrp) as total_xrp,
-        date_trunc('hour', s.created_at AT TIME ZONE 'UTC') as created_at
-    FROM latest_summary s
-    JOIN xrpl_rich_list_categories c ON s.grouped_label = c.grouped_label
-    GROUP BY c.category, date_trunc('hour', s.created_at AT TIME ZONE 'UTC')
-    ON CONFLICT (grouped_label, created_at) 
-    DO UPDATE SET
-        count = EXCLUDED.count,
-        total_balance = EXCLUDED.total_balance,
-        total_escrow = EXCLUDED.total_escrow,
-        total_xrp = EXCLUDED.total_xrp;
-END;
-$$;
-
--- 国別統計更新用の関数
-CREATE OR REPLACE FUNCTION update_country_statistics()
-RETURNS VOID
-LANGUAGE plpgsql
-SECURITY DEFINER
-AS $$
-BEGIN
-    INSERT INTO xrpl_rich_list_country_hourly 
-        (grouped_label, count, total_balance, total_escrow, total_xrp, created_at)
-    WITH latest_summary AS (
-        SELECT *
-        FROM xrpl_rich_list_summary s
-        WHERE s.created_at >= CURRENT_TIMESTAMP AT TIME ZONE 'UTC' - INTERVAL '3 days'
-    )
-    SELECT 
-        c.country as grouped_label,
-        SUM(s.count) as count,
-        SUM(s.total_balance) as total_balance,
-        SUM(s.total_escrow) as total_escrow,
-        SUM(s.total_xrp) as total_xrp,
-        date_trunc('hour', s.created_at AT TIME ZONE 'UTC') as created_at
-    FROM latest_summary s
-    JOIN xrpl_rich_list_categories c ON s.grouped_label = c.grouped_label
-    GROUP BY c.country, date_trunc('hour', s.created_at AT TIME ZONE 'UTC')
-    ON CONFLICT (grouped_label, created_at) 
-    DO UPDATE SET
-        count = EXCLUDED.count,
-        total_balance = EXCLUDED.total_balance,
-        total_escrow = EXCLUDED.total_escrow,
-        total_xrp = EXCLUDED.total_xrp;
-END;
-$$;
-
--- 利用可能額統計更新用の関数
-CREATE OR REPLACE FUNCTION update_available_statistics()
-RETURNS VOID
-LANGUAGE plpgsql
-SECURITY DEFINER
-SET statement_timeout = '60s'
-AS $$
-BEGIN
-    INSERT INTO xrpl_rich_list_available_hourly 
-        (grouped_label, count, total_balance, total_escrow, total_xrp, created_at)
-    SELECT 
-        s.grouped_label,
-        s.count,
-        s.total_balance,
-        s.total_escrow,
-        s.total_balance as total_xrp,
-        date_trunc('hour', s.created_at AT TIME ZONE 'UTC') as created_at
-    FROM xrpl_rich_list_summary s
-    WHERE s.created_at >= CURRENT_TIMESTAMP AT TIME ZONE 'UTC' - INTERVAL '3 days'
-    GROUP BY s.grouped_label, s.count, s.total_balance, s.total_escrow, date_trunc('hour', s.created_at AT TIME ZONE 'UTC')
-    ON CONFLICT (grouped_label, created_at) 
-    DO UPDATE SET
-        count = EXCLUDED.count,
-        total_balance = EXCLUDED.total_balance,
-        total_escrow = EXCLUDED.total_escrow,
-        total_xrp = EXCLUDED.total_xrp;
-END;
-$$;
-
 -- ANALYZE実行用の関数
 CREATE OR REPLACE FUNCTION analyze_rich_list_tables()
 RETURNS VOID
@@ -1081,6 +303,216 @@ BEGIN
 END;
 $$;
 
+-- ステップの経過時間（ミリ秒）
+CREATE OR REPLACE FUNCTION post_ingest_elapsed_ms(p_started TIMESTAMP WITH TIME ZONE)
+RETURNS NUMERIC
+LANGUAGE sql
+VOLATILE
+AS $$
+    SELECT ROUND(EXTRACT(EPOCH FROM clock_timestamp() - p_started) * 1000, 1);
+$$;
+
+-- アップロード後の集計（サマリー・変化量・時系列統計）を1トランザクションで行う
+-- ダッシュボードからは全部更新される前か後のどちらかしか見えない。戻り値はステップごとの所要時間
+-- 古いデータの削除とANALYZEは失敗しても集計を巻き戻さないよう、呼び出し側が別に実行する
+-- （cleanup_old_rich_list_data / analyze_rich_list_tables）
+-- p_snapshot_tsがNULLなら既存のサマリーから変化量と統計だけを作り直す（updater.py用）
+CREATE OR REPLACE FUNCTION run_post_ingest(p_snapshot_ts TIMESTAMP WITH TIME ZONE DEFAULT NULL)
+RETURNS JSONB
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET statement_timeout = '300s'
+AS $$
+DECLARE
+    v_timings JSONB := '[]'::JSONB;
+    v_started TIMESTAMP WITH TIME ZONE := clock_timestamp();
+    v_current TIMESTAMP WITH TIME ZONE;
+BEGIN
+    IF p_snapshot_ts IS NOT NULL THEN
+        -- 同じスナップショットで再実行しても二重にならないよう、先に消してから作る
+        DELETE FROM xrpl_rich_list_summary WHERE created_at = p_snapshot_ts;
+        PERFORM insert_rich_list_summary(p_snapshot_ts);
+        v_timings := v_timings || jsonb_build_object('step', 'summary', 'ms', post_ingest_elapsed_ms(v_started));
+        v_started := clock_timestamp();
+    END IF;
+
+    -- 比較する過去の時刻は4つの変化量で共通なので1回だけ求める（hours = 0 が現在）
+    DROP TABLE IF EXISTS post_ingest_periods;
+    CREATE TEMP TABLE post_ingest_periods ON COMMIT DROP AS
+    SELECT * FROM rich_list_change_periods();
+    SELECT created_at INTO v_current FROM post_ingest_periods WHERE hours = 0;
+    IF v_current IS NULL THEN
+        RETURN v_timings;
+    END IF;
+
+    -- 現在と比較時刻のサマリー行を1回だけ読む
+    DROP TABLE IF EXISTS post_ingest_rows;
+    CREATE TEMP TABLE post_ingest_rows ON COMMIT DROP AS
+    SELECT p.hours, s.grouped_label, s.count, s.total_balance, s.total_escrow, s.total_xrp, s.category, s.country
+    FROM post_ingest_periods p
+    JOIN xrpl_rich_list_summary s ON s.created_at = p.created_at;
+    v_timings := v_timings || jsonb_build_object('step', 'periods', 'ms', post_ingest_elapsed_ms(v_started));
+    v_started := clock_timestamp();
+
+    DELETE FROM xrpl_rich_list_changes WHERE TRUE;
+    INSERT INTO xrpl_rich_list_changes
+        (grouped_label, hours, balance_change, percentage_change, calculated_at)
+    SELECT
+        c.grouped_label,
+        p.hours,
+        c.total_xrp - COALESCE(h.total_xrp, c.total_xrp),
+        CASE
+            WHEN COALESCE(h.total_xrp, c.total_xrp) = 0 THEN 0
+            ELSE ((c.total_xrp - COALESCE(h.total_xrp, c.total_xrp)) / COALESCE(h.total_xrp, c.total_xrp) * 100)
+        END,
+        CURRENT_TIMESTAMP
+    FROM post_ingest_rows c
+    CROSS JOIN post_ingest_periods p
+    LEFT JOIN post_ingest_rows h ON h.hours = p.hours AND h.grouped_label = c.grouped_label
+    WHERE c.hours = 0 AND p.hours > 0;
+    v_timings := v_timings || jsonb_build_object('step', 'balance_changes', 'ms', post_ingest_elapsed_ms(v_started));
+    v_started := clock_timestamp();
+
+    -- エスクロー抜き（total_balance）の変化
+    DELETE FROM xrpl_rich_list_available_changes WHERE TRUE;
+    INSERT INTO xrpl_rich_list_available_changes
+        (grouped_label, hours, balance_change, percentage_change, calculated_at)
+    SELECT
+        c.grouped_label,
+        p.hours,
+        c.total_balance - COALESCE(h.total_balance, c.total_balance),
+        CASE
+            WHEN COALESCE(h.total_balance, c.total_balance) = 0 THEN 0
+            ELSE ((c.total_balance - COALESCE(h.total_balance, c.total_balance)) / COALESCE(h.total_balance, c.total_balance) * 100)
+        END,
+        CURRENT_TIMESTAMP
+    FROM post_ingest_rows c
+    CROSS JOIN post_ingest_periods p
+    LEFT JOIN post_ingest_rows h ON h.hours = p.hours AND h.grouped_label = c.grouped_label
+    WHERE c.hours = 0 AND p.hours > 0;
+    v_timings := v_timings || jsonb_build_object('step', 'available_changes', 'ms', post_ingest_elapsed_ms(v_started));
+    v_started := clock_timestamp();
+
+    DELETE FROM xrpl_rich_list_category_changes WHERE TRUE;
+    WITH totals AS (
+        SELECT hours, category, SUM(count) as count, SUM(total_balance) as total_balance,
+               SUM(total_escrow) as total_escrow, SUM(total_xrp) as total_xrp
+        FROM post_ingest_rows
+        WHERE category IS NOT NULL
+        GROUP BY hours, category
+    )
+    INSERT INTO xrpl_rich_list_category_changes
+        (category, hours, count, total_balance, total_escrow, total_xrp, balance_change, percentage_change, calculated_at)
+    SELECT
+        c.category,
+        p.hours,
+        c.count,
+        c.total_balance,
+        c.total_escrow,
+        c.total_xrp,
+        c.total_xrp - COALESCE(h.total_xrp, c.total_xrp),
+        CASE
+            WHEN COALESCE(h.total_xrp, c.total_xrp) = 0 THEN 0
+            ELSE ((c.total_xrp - COALESCE(h.total_xrp, c.total_xrp)) / COALESCE(h.total_xrp, c.total_xrp) * 100)
+        END,
+        CURRENT_TIMESTAMP
+    FROM totals c
+    CROSS JOIN post_ingest_periods p
+    LEFT JOIN totals h ON h.hours = p.hours AND h.category = c.category
+    WHERE c.hours = 0 AND p.hours > 0;
+    v_timings := v_timings || jsonb_build_object('step', 'category_changes', 'ms', post_ingest_elapsed_ms(v_started));
+    v_started := clock_timestamp();
+
+    DELETE FROM xrpl_rich_list_country_changes WHERE TRUE;
+    WITH totals AS (
+        SELECT hours, country, SUM(count) as count, SUM(total_balance) as total_balance,
+               SUM(total_escrow) as total_escrow, SUM(total_xrp) as total_xrp
+        FROM post_ingest_rows
+        WHERE country IS NOT NULL
+        GROUP BY hours, country
+    )
+    INSERT INTO xrpl_rich_list_country_changes
+        (country, hours, count, total_balance, total_escrow, total_xrp, balance_change, percentage_change, calculated_at)
+    SELECT
+        c.country,
+        p.hours,
+        c.count,
+        c.total_balance,
+        c.total_escrow,
+        c.total_xrp,
+        c.total_xrp - COALESCE(h.total_xrp, c.total_xrp),
+        CASE
+            WHEN COALESCE(h.total_xrp, c.total_xrp) = 0 THEN 0
+            ELSE ((c.total_xrp - COALESCE(h.total_xrp, c.total_xrp)) / COALESCE(h.total_xrp, c.total_xrp) * 100)
+        END,
+        CURRENT_TIMESTAMP
+    FROM totals c
+    CROSS JOIN post_ingest_periods p
+    LEFT JOIN totals h ON h.hours = p.hours AND h.country = c.country
+    WHERE c.hours = 0 AND p.hours > 0;
+    v_timings := v_timings || jsonb_build_object('step', 'country_changes', 'ms', post_ingest_elapsed_ms(v_started));
+    v_started := clock_timestamp();
+
+    -- 時系列統計は次回の実行でも作り直せるので、タイムアウトしても変化量はコミットする
+    BEGIN
+        PERFORM delete_old_statistics();
+
+        -- 直近3日のサマリー行を1回だけ読む
+        DROP TABLE IF EXISTS post_ingest_recent;
+        CREATE TEMP TABLE post_ingest_recent ON COMMIT DROP AS
+        SELECT s.grouped_label, s.count, s.total_balance, s.total_escrow, s.total_xrp, s.created_at,
+               date_trunc('hour', s.created_at AT TIME ZONE 'UTC') as hour, s.category, s.country
+        FROM xrpl_rich_list_summary s
+        WHERE s.created_at >= CURRENT_TIMESTAMP AT TIME ZONE 'UTC' - INTERVAL '3 days';
+
+        INSERT INTO xrpl_rich_list_category_hourly
+            (grouped_label, count, total_balance, total_escrow, total_xrp, created_at)
+        SELECT category, SUM(count), SUM(total_balance), SUM(total_escrow), SUM(total_xrp), hour
+        FROM post_ingest_recent
+        WHERE category IS NOT NULL
+        GROUP BY category, hour
+        ON CONFLICT (grouped_label, created_at)
+        DO UPDATE SET
+            count = EXCLUDED.count,
+            total_balance = EXCLUDED.total_balance,
+            total_escrow = EXCLUDED.total_escrow,
+            total_xrp = EXCLUDED.total_xrp;
+
+        INSERT INTO xrpl_rich_list_country_hourly
+            (grouped_label, count, total_balance, total_escrow, total_xrp, created_at)
+        SELECT country, SUM(count), SUM(total_balance), SUM(total_escrow), SUM(total_xrp), hour
+        FROM post_ingest_recent
+        WHERE country IS NOT NULL
+        GROUP BY country, hour
+        ON CONFLICT (grouped_label, created_at)
+        DO UPDATE SET
+            count = EXCLUDED.count,
+            total_balance = EXCLUDED.total_balance,
+            total_escrow = EXCLUDED.total_escrow,
+            total_xrp = EXCLUDED.total_xrp;
+
+        INSERT INTO xrpl_rich_list_available_hourly
+            (grouped_label, count, total_balance, total_escrow, total_xrp, created_at)
+        -- 1時間に複数のスナップショットがあれば最後のものを使う（同じ行を2回更新するとエラーになる）
+        SELECT DISTINCT ON (grouped_label, hour) grouped_label, count, total_balance, total_escrow, total_balance, hour
+        FROM post_ingest_recent
+        ORDER BY grouped_label, hour, created_at DESC
+        ON CONFLICT (grouped_label, created_at)
+        DO UPDATE SET
+            count = EXCLUDED.count,
+            total_balance = EXCLUDED.total_balance,
+            total_escrow = EXCLUDED.total_escrow,
+            total_xrp = EXCLUDED.total_xrp;
+        v_timings := v_timings || jsonb_build_object('step', 'statistics', 'ms', post_ingest_elapsed_ms(v_started));
+    EXCEPTION WHEN query_canceled THEN
+        RAISE WARNING 'run_post_ingest: statistics timed out, keeping the previous hourly rows';
+        v_timings := v_timings || jsonb_build_object('step', 'statistics', 'ms', post_ingest_elapsed_ms(v_started), 'timed_out', true);
+    END;
+
+    RETURN v_timings;
+END;
+$$;
+
 CREATE OR REPLACE FUNCTION get_significant_changes(
     percentage_threshold FLOAT,
     amount_threshold FLOAT
@@ -0,0 +1,97 @@
+import json
+import os
+import re
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+RULES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "label_groups.json")
+
+@dataclass(frozen=True)
+class GroupingRule:
+    match: str    # 'prefix' または 'contains'（SQLの 'xxx%' / '%xxx%' に相当）
+    pattern: str
+    group: str
+
+def load_rules(path: str = RULES_PATH) -> List[GroupingRule]:
+    with open(path, 'r', encoding='utf-8') as f:
+        return [GroupingRule(**rule) for rule in json.load(f)]
+
+class LabelGrouper:
+    """Map account labels to grouped_label using the shared rule set
+
+    Rules are checked in order and the first match wins. All rules are
+    compiled into one alternation regex, and results are memoized per
+    label (a snapshot has far fewer distinct labels than rows). Labels
+    that match no rule lose a leading '~' and a trailing ' (...)'.
+    """
+
+    _STRIP_PREFIX = re.compile(r'^~')
+    _STRIP_SUFFIX = re.compile(r'\s*\([^)]*\)\Z')
+
+    def __init__(self, rules: Optional[List[GroupingRule]] = None):
+        self.rules = load_rules() if rules is None else rules
+        alternatives = []
+        for rule in self.rules:
+            if rule.match == 'prefix':
+                alternatives.append(f"({re.escape(rule.pattern)})")
+            elif rule.match == 'contains':
+                alternatives.append(f"(.*?{re.escape(rule.pattern)})")
+            else:
+                raise ValueError(f"Unknown match type: {rule.match}")
+        # 各ルールを1つのキャプチャグループにし、lastindexでどのルールか判定する
+        self._matcher = re.compile('|'.join(alternatives), re.DOTALL) if alternatives else None
+        self._groups = [rule.group for rule in self.rules]
+        self._memo: Dict[str, str] = {}
+
+    def __call__(self, label: Optional[str]) -> Optional[str]:
+        if label is None:
+            return None
+        grouped = self._memo.get(label)
+        if grouped is None:
+            grouped = self._memo[label] = self._group(label)
+        return grouped
+
+    def _group(self, label: str) -> str:
+        if self._matcher is not None:
+            match = self._matcher.match(label)
+            if match:
+                return self._groups[match.lastindex - 1]
+        return self._STRIP_SUFFIX.sub('', self._STRIP_PREFIX.sub('', label, count=1), count=1)
+
+    def to_sql(self) -> str:
+        """SQL group_label() equivalent, for rows that were uploaded without grouped_label"""
+        def literal(value: str) -> str:
+            return "'" + value.replace("'", "''") + "'"
+
+        def like(value: str) -> str:
+            return re.sub(r'([\\%_])', r'\\\1', value)
+
+        lines = [
+            "-- label_groups.jsonから生成（python label_groups.py）",
+            "create or replace function group_label(label text)",
+            "returns text",
+            "language sql",
+            "immutable",
+            "as $$",
+            "    SELECT CASE "
+        ]
+        for rule in self.rules:
+            pattern = like(rule.pattern) + '%'
+            if rule.match == 'contains':
+                pattern = '%' + pattern
+            lines.append(f"        WHEN label LIKE {literal(pattern)} THEN {literal(rule.group)}")
+        lines += [
+            "        ELSE REGEXP_REPLACE(",
+            "            REGEXP_REPLACE(label, '^~', ''),",
+            "            '\\s*\\([^)]*\\)$', ''",
+            "        )",
+            "    END;",
+            "$$;"
+        ]
+        return '\n'.join(lines)
+
+def main():
+    print(LabelGrouper().to_sql())
+
+if __name__ == "__main__":
+    main()
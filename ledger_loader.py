@@ -0,0 +1,132 @@
+import asyncio
+import time
+from typing import AsyncIterator, Dict, List, Tuple
+
+from xrpl.asyncio.clients import AsyncWebsocketClient
+from xrpl.models.requests import LedgerData, LedgerEntryType
+
+from account_id import decode_account_id
+from rich_list_snapshot import AccountColumns, TopBalances
+
+class LedgerRichListLoader:
+    """Build a rich list of any depth by paging through the ledger's AccountRoot objects
+
+    XRPScan only serves the top 10,000 accounts, so deeper lists are read
+    straight from a validated ledger with ledger_data. Every page goes
+    through TopBalances, which keeps memory at O(depth) for the whole walk.
+    All pages come from one pinned ledger index so the markers stay valid.
+    A full walk is about 25,000 requests, so requests are spaced to at most
+    `requests_per_second` (shared by the account and escrow walks) and the
+    source is only used when enabled (see rich_list_sources).
+    """
+
+    def __init__(self, node_url="wss://s1.ripple.com", page_size=256, max_retries=3, retry_delay=2,
+                 requests_per_second: float = 10.0):
+        self.node_url = node_url
+        self.page_size = page_size    # JSON形式のledger_dataは1ページ最大256件
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        # 公開ノードに負荷をかけすぎないよう、リクエストの間隔を空ける
+        self.min_interval = 1.0 / requests_per_second
+        self._next_request = 0.0
+        self._throttle = asyncio.Lock()
+        self.client = None
+        self.escrow_pairs: List[Tuple[bytes, bytes]] = []   # (所有者, 宛先) のAccountID、エンティティ解決用
+
+    async def setup_client(self):
+        print("Connecting to XRPL node...")
+        self.client = AsyncWebsocketClient(self.node_url)
+        await self.client.open()
+        print("Connected successfully")
+
+    async def cleanup_client(self):
+        if self.client:
+            await self.client.close()
+            self.client = None
+
+    async def wait_turn(self):
+        """Sleep until the next request slot (at most one request per min_interval)"""
+        async with self._throttle:
+            delay = self._next_request - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._next_request = time.monotonic() + self.min_interval
+
+    async def request_page(self, ledger_index, entry_type: LedgerEntryType, marker=None) -> Dict:
+        for attempt in range(self.max_retries + 1):
+            await self.wait_turn()
+            try:
+                response = await self.client.request(LedgerData(
+                    ledger_index=ledger_index,
+                    type=entry_type,
+                    limit=self.page_size,
+                    marker=marker
+                ))
+                if not response.is_successful():
+                    raise Exception(f"ledger_data failed: {response.result}")
+                return response.result
+
+            except Exception as e:
+                if attempt < self.max_retries:
+                    print(f"Retry {attempt + 1}/{self.max_retries} for ledger_data page: {e}")
+                    await asyncio.sleep(self.retry_delay * (attempt + 1))
+                    continue
+                raise
+
+    async def iter_pages(self, ledger_index, entry_type: LedgerEntryType) -> AsyncIterator[List[Dict]]:
+        marker = None
+        while True:
+            result = await self.request_page(ledger_index, entry_type, marker)
+            yield result.get('state', [])
+            marker = result.get('marker')
+            if marker is None:
+                return
+
+    async def pin_ledger(self) -> int:
+        """Index of the current validated ledger, used for every page of the walk"""
+        result = await self.request_page("validated", LedgerEntryType.ACCOUNT)
+        return int(result['ledger_index'])
+
+    async def load_escrows(self, ledger_index: int) -> Dict[bytes, int]:
+        """Total escrowed drops per owner AccountID (owner/destination pairs go to escrow_pairs)"""
+        escrows: Dict[bytes, int] = {}
+        self.escrow_pairs = []
+        async for page in self.iter_pages(ledger_index, LedgerEntryType.ESCROW):
+            for entry in page:
+                amount = entry.get('Amount')
+                # XRP以外（IOU）のエスクローは対象外
+                if isinstance(amount, str):
+                    owner = decode_account_id(entry['Account'])
+                    escrows[owner] = escrows.get(owner, 0) + int(amount)
+                    if entry.get('Destination'):
+                        self.escrow_pairs.append((owner, decode_account_id(entry['Destination'])))
+        return escrows
+
+    async def load_top_accounts(self, ledger_index: int, depth: int) -> TopBalances:
+        top = TopBalances(depth)
+        pages = 0
+        async for page in self.iter_pages(ledger_index, LedgerEntryType.ACCOUNT):
+            top.extend(
+                [entry['Account'] for entry in page],
+                [int(entry['Balance']) for entry in page]
+            )
+            pages += 1
+            if pages % 1000 == 0:
+                print(f"Scanned {top.seen} accounts ({pages} pages)...")
+        print(f"Scanned {top.seen} accounts in ledger {ledger_index}")
+        return top
+
+    async def load_rich_list_columns(self, depth: int) -> AccountColumns:
+        """Top `depth` accounts by balance from one validated ledger, with escrows filled in"""
+        await self.setup_client()
+        try:
+            ledger_index = await self.pin_ledger()
+            print(f"Walking ledger {ledger_index} for the top {depth} accounts...")
+            # アカウントとエスクローは別々のマーカーで辿れるので同じ接続上で並行に読む
+            top, escrows = await asyncio.gather(
+                self.load_top_accounts(ledger_index, depth),
+                self.load_escrows(ledger_index)
+            )
+            return top.build(escrows)
+        finally:
+            await self.cleanup_client()
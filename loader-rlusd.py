@@ -1,56 +1,119 @@
 import aiohttp
 import asyncio
-import csv
 from datetime import datetime, timezone
-from typing import List, Dict, Set
+from typing import AsyncIterator, List, Dict, Optional
 from dataclasses import dataclass
 
-@dataclass
+import numpy as np
+import pyarrow as pa
+
+from xrpscan_cache import XRPScanCache, CachedResponse
+from xrpscan_stream import iter_json_array
+from rich_list_snapshot import (
+    AccountColumns, AccountColumnsBuilder, RankedSnapshot,
+    join_well_known, rank_accounts
+)
+from label_groups import LabelGrouper
+from snapshot_file import RLUSD_SNAPSHOT_SCHEMA, write_snapshot
+
+@dataclass(slots=True)
 class XRPAccount:
     account: str
-    balance: float
+    balance_drops: int
     name: str = "Unknown"
     desc: str = ""
     domain: str = ""
     twitter: str = ""
     verified: bool = False
-    escrow_xrp: float = 0.0
+    escrow_drops: int = 0
 
 class XRPDataFetcher:
     def __init__(self):
         self.base_url = "https://api.xrpscan.com/api/v1"
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36',
-            'Accept': 'application/json'
+            'Accept': 'application/json',
+            'Accept-Encoding': 'gzip, deflate'
         }
+        # 接続・読み込みごとのタイムアウト（全体は/balancesの巨大レスポンスを考慮して長め）
+        self.timeout = aiohttp.ClientTimeout(total=180, connect=15, sock_connect=15, sock_read=60)
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.cache = XRPScanCache()
+        self.label_grouper = LabelGrouper()
+
+    async def __aenter__(self):
+        await self.open_session()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close_session()
+
+    async def open_session(self) -> aiohttp.ClientSession:
+        """Create the shared keep-alive session on first use"""
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=8,
+                limit_per_host=4,
+                keepalive_timeout=60,
+                ttl_dns_cache=300
+            )
+            self.session = aiohttp.ClientSession(
+                headers=self.headers,
+                timeout=self.timeout,
+                connector=connector,
+                auto_decompress=True
+            )
+        return self.session
+
+    async def close_session(self):
+        await self.cache.wait_for_revalidations()
+        if self.session and not self.session.closed:
+            await self.session.close()
+        self.session = None
         
+    async def fetch_response(self, endpoint: str, headers: Optional[Dict[str, str]] = None) -> CachedResponse:
+        session = await self.open_session()
+        for attempt in range(3):  # 3回までリトライ
+            try:
+                async with session.get(f"{self.base_url}/{endpoint}", headers=headers) as response:
+                    # 条件付きリクエストで変更がなければ本文なしで返る
+                    if response.status == 304:
+                        return CachedResponse(status=304)
+                    if response.status != 200:
+                        raise Exception(f"API request failed with status: {response.status}")
+                    
+                    content_type = response.headers.get('Content-Type', '')
+                    if 'application/json' not in content_type and 'text/json' not in content_type:
+                        if attempt < 2:
+                            print(f"Unexpected content type: {content_type}, retrying... (attempt {attempt + 1}/3)")
+                            await asyncio.sleep(5 * (attempt + 1)) 
+                            continue
+                        raise Exception(f"Unexpected content type: {content_type}")
+                    
+                    return CachedResponse(
+                        status=200,
+                        data=await response.json(),
+                        etag=response.headers.get('ETag'),
+                        last_modified=response.headers.get('Last-Modified')
+                    )
+                    
+            except Exception as e:
+                if attempt < 2:
+                    print(f"Error during API request: {e}, retrying... (attempt {attempt + 1}/3)")
+                    await asyncio.sleep(5 * (attempt + 1))
+                    continue
+                raise Exception(f"API request failed after 3 attempts: {e}")
+
     async def fetch_data(self, endpoint: str) -> List[Dict]:
-        async with aiohttp.ClientSession(headers=self.headers) as session:
-            for attempt in range(3):  # 3回までリトライ
-                try:
-                    async with session.get(f"{self.base_url}/{endpoint}") as response:
-                        if response.status != 200:
-                            raise Exception(f"API request failed with status: {response.status}")
-                        
-                        content_type = response.headers.get('Content-Type', '')
-                        if 'application/json' not in content_type and 'text/json' not in content_type:
-                            if attempt < 2:
-                                print(f"Unexpected content type: {content_type}, retrying... (attempt {attempt + 1}/3)")
-                                await asyncio.sleep(5 * (attempt + 1)) 
-                                continue
-                            raise Exception(f"Unexpected content type: {content_type}")
-                        
-                        return await response.json()
-                        
-                except Exception as e:
-                    if attempt < 2:
-                        print(f"Error during API request: {e}, retrying... (attempt {attempt + 1}/3)")
-                        await asyncio.sleep(5 * (attempt + 1))
-                        continue
-                    raise Exception(f"API request failed after 3 attempts: {e}")
-
-    def convert_balance_to_xrp(self, drops: int) -> float:
-        return drops / 1_000_000
+        response = await self.fetch_response(endpoint)
+        return response.data
+
+    async def fetch_cached_data(self, endpoint: str) -> List[Dict]:
+        """Fetch a rarely changing endpoint through the on-disk conditional-request cache"""
+        return await self.cache.get(
+            endpoint,
+            lambda headers: self.fetch_response(endpoint, headers)
+        )
 
     def format_label(self, name: str, desc: str) -> str:
         """Format label with name and description"""
@@ -61,39 +124,76 @@ class XRPDataFetcher:
             return f"{name} ({desc})"
         return name
 
-    async def get_rich_list(self) -> List[XRPAccount]:
-        data = await self.fetch_data("balances")
-        accounts = []
+    def parse_rich_list_entry(self, entry: Dict) -> XRPAccount:
+        # Safely handle the name field which might be None
+        name_info = entry.get('name') or {}
         
-        for entry in data:
-            # Safely handle the name field which might be None
-            name_info = entry.get('name') or {}
-            
-            # name.nameがある場合はそれを使用し、ない場合はusernameを試す
-            name = (name_info.get('name') or 
-                   (name_info.get('username') if isinstance(name_info, dict) else None) or 
-                   'Unknown')
-            
-            account = XRPAccount(
-                account=entry['account'],
-                balance=self.convert_balance_to_xrp(entry['balance']),
-                name=name,
-                desc=name_info.get('desc', ''),
-                domain=name_info.get('domain', ''),
-                twitter=name_info.get('twitter', '')
-            )
-            accounts.append(account)
-            
-        return accounts
+        # name.nameがある場合はそれを使用し、ない場合はusernameを試す
+        name = (name_info.get('name') or 
+               (name_info.get('username') if isinstance(name_info, dict) else None) or 
+               'Unknown')
+        
+        return XRPAccount(
+            account=entry['account'],
+            balance_drops=int(entry['balance']),
+            name=name,
+            desc=name_info.get('desc', ''),
+            domain=name_info.get('domain', ''),
+            twitter=name_info.get('twitter', '')
+        )
+
+    async def stream_balance_entries(self) -> AsyncIterator[Dict]:
+        """Yield raw /balances entries while the body is still downloading"""
+        session = await self.open_session()
+        for attempt in range(3):  # 3回までリトライ
+            yielded = 0
+            try:
+                async with session.get(f"{self.base_url}/balances") as response:
+                    if response.status != 200:
+                        raise Exception(f"API request failed with status: {response.status}")
+                    
+                    # JSON配列でなければ（HTMLなど）最初のチャンクで例外になる
+                    async for entry in iter_json_array(response.content):
+                        yield entry
+                        yielded += 1
+                    return
+                    
+            except Exception as e:
+                # 一部を返した後はやり直せないので、そのまま失敗させる
+                if attempt < 2 and yielded == 0:
+                    print(f"Error during API request: {e}, retrying... (attempt {attempt + 1}/3)")
+                    await asyncio.sleep(5 * (attempt + 1))
+                    continue
+                raise Exception(f"API request failed after {attempt + 1} attempts: {e}")
+
+    async def stream_rich_list(self) -> AsyncIterator[XRPAccount]:
+        async for entry in self.stream_balance_entries():
+            yield self.parse_rich_list_entry(entry)
+
+    async def get_rich_list(self) -> List[XRPAccount]:
+        return [account async for account in self.stream_rich_list()]
+
+    async def load_rich_list_columns(self) -> AccountColumns:
+        """Collect /balances into compact columns (balances in drops) as it downloads
+
+        Parsing overlaps the download and only the columns are kept in memory,
+        but the columns are returned only once the whole body has arrived.
+        """
+        builder = AccountColumnsBuilder()
+        async for entry in self.stream_balance_entries():
+            account = self.parse_rich_list_entry(entry)
+            builder.append(account.account, account.balance_drops, account.name,
+                           account.desc, account.domain, account.twitter)
+        return builder.build()
 
     async def get_well_known_accounts(self) -> List[XRPAccount]:
-        data = await self.fetch_data("names/well-known")
+        data = await self.fetch_cached_data("names/well-known")
         accounts = []
         
         for entry in data:
             account = XRPAccount(
                 account=entry['account'],
-                balance=0,
+                balance_drops=0,
                 name=entry.get('name', 'Unknown'),
                 desc=entry.get('desc', ""),
                 domain=entry.get('domain', ""),
@@ -104,87 +204,70 @@ class XRPDataFetcher:
             
         return accounts
 
-    def merge_accounts(self, rich_list: List[XRPAccount], well_known: List[XRPAccount]) -> List[XRPAccount]:
-        well_known_dict = {acc.account: acc for acc in well_known}
-        processed_accounts: Set[str] = set()
-        merged_accounts = []
-        
-        # Process rich list first
-        for rich_acc in rich_list:
-            if rich_acc.account in processed_accounts:
-                continue
-                
-            if rich_acc.account in well_known_dict:
-                well_known_acc = well_known_dict[rich_acc.account]
-                well_known_acc.balance = rich_acc.balance
-                merged_accounts.append(well_known_acc)
-            else:
-                merged_accounts.append(rich_acc)
-                
-            processed_accounts.add(rich_acc.account)
-        
-        # Add remaining well-known accounts
-        for well_known_acc in well_known:
-            if well_known_acc.account not in processed_accounts:
-                merged_accounts.append(well_known_acc)
-                processed_accounts.add(well_known_acc.account)
-        
-        return sorted(merged_accounts, key=lambda x: x.balance, reverse=True)
+    async def load_well_known_columns(self) -> AccountColumns:
+        builder = AccountColumnsBuilder()
+        for account in await self.get_well_known_accounts():
+            builder.append(account.account, 0, account.name, account.desc,
+                           account.domain, account.twitter, account.verified)
+        return builder.build()
 
-    async def save_to_csv(self, output_path: str):
+    def merge_accounts(self, rich_list: AccountColumns, well_known: AccountColumns) -> RankedSnapshot:
+        """Join well-known metadata by address, then rank by balance"""
+        return rank_accounts(join_well_known(rich_list, well_known))
+
+    async def save_snapshot(self, output_path: str):
         try:
-            print("Fetching rich list data...")
-            rich_list = await self.get_rich_list()
+            # /balancesはダウンロードしながら列に詰め、well-knownは並行取得
+            # 順位付けには全件の残高が要るので、スナップショットの行を書き出すのはダウンロードの完了後になる
+            print("Fetching rich list data and well-known accounts...")
+            rich_list, well_known = await asyncio.gather(
+                self.load_rich_list_columns(),
+                self.load_well_known_columns()
+            )
             print(f"Found {len(rich_list)} accounts in rich list")
-            
-            print("Fetching well-known accounts...")
-            well_known = await self.get_well_known_accounts()
             print(f"Found {len(well_known)} well-known accounts")
             
             print("Merging account data...")
-            merged_accounts = self.merge_accounts(rich_list, well_known)
+            snapshot = self.merge_accounts(rich_list, well_known)
+            columns = snapshot.columns
             
             snapshot_date = datetime.now(timezone.utc).isoformat()
             
             print(f"Saving data to {output_path}...")
-            with open(output_path, 'w', newline='', encoding='utf-8') as csvfile:
-                fieldnames = ['rank', 'address', 'label', 'balance_xrp', 'escrow_xrp', 'percentage', 
-                            'balance_rlusd', 'domain', 'twitter', 'verified', 'snapshot_date']
-                writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-                writer.writeheader()
-                
-                total_xrp = sum(acc.balance for acc in merged_accounts)
-                
-                for rank, account in enumerate(merged_accounts, 1):
-                    percentage = (account.balance / total_xrp * 100) if total_xrp > 0 else 0
-                    
-                    writer.writerow({
-                        'rank': rank,
-                        'address': account.account,
-                        'label': self.format_label(account.name, account.desc),
-                        'balance_xrp': account.balance,
-                        'escrow_xrp': account.escrow_xrp,
-                        'percentage': round(percentage, 6),
-                        'balance_rlusd': 0,
-                        'domain': account.domain,
-                        'twitter': account.twitter,
-                        'verified': account.verified,
-                        'snapshot_date': snapshot_date
-                    })
+            labels = [self.format_label(name, desc) for name, desc in zip(columns.name, columns.desc)]
+
+            # 列をそのままArrowの列として書き出す（テキスト変換なし）
+            write_snapshot(output_path, {
+                'rank': np.arange(1, len(snapshot) + 1, dtype=np.int32),
+                'address': np.char.decode(columns.address, 'ascii'),
+                'account_id': columns.account_id,
+                'label': labels,
+                'grouped_label': [self.label_grouper(label) for label in labels],
+                'balance_drops': columns.balance,
+                'escrow_drops': columns.escrow,
+                'percentage': np.round(snapshot.percentage, 6),
+                'balance_rlusd': np.zeros(len(snapshot)),
+                'domain': columns.domain,
+                'twitter': columns.twitter,
+                'verified': columns.verified,
+                'domain_verified': np.zeros(len(snapshot), dtype=bool),
+                'snapshot_date': pa.repeat(snapshot_date, len(snapshot)),
+                'exists': np.ones(len(snapshot), dtype=bool)
+            }, RLUSD_SNAPSHOT_SCHEMA)
             
-            print(f"Successfully saved {len(merged_accounts)} entries to CSV")
+            print(f"Successfully saved {len(snapshot)} entries to snapshot")
             return True
             
         except Exception as e:
-            print(f"Error creating CSV: {e}")
+            print(f"Error creating snapshot: {e}")
             return False
 
 async def main():
     retries = 3
     for attempt in range(retries):
         try:
-            fetcher = XRPDataFetcher()
-            await fetcher.save_to_csv("rlusd_rich_list_temp.csv")
+            async with XRPDataFetcher() as fetcher:
+                await fetcher.save_snapshot("rlusd_rich_list_temp.arrow")
             break
         except Exception as e:
             if attempt < retries - 1:
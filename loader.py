@@ -1,57 +1,138 @@
 import aiohttp
 import asyncio
-import csv
 from datetime import datetime, timezone
-from typing import List, Dict, Set
+from typing import AsyncIterator, List, Dict, Optional, Tuple
 from dataclasses import dataclass
 import json
 
-@dataclass
+import numpy as np
+import pyarrow as pa
+
+from xrpscan_cache import XRPScanCache, CachedResponse, XRPScanResponseError
+from xrpscan_stream import iter_json_array
+from rich_list_snapshot import (
+    AccountColumns, AccountColumnsBuilder, RankedSnapshot,
+    join_well_known, rank_accounts
+)
+from domain_verifier import (
+    AccountDomainReader, DomainResult, DomainVerifier, apply_domain_verification, vouched_unknowns
+)
+from entity_resolution import STATE_PATH as ENTITY_STATE_PATH, EntityResolver
+from label_groups import LabelGrouper
+from snapshot_file import SNAPSHOT_SCHEMA, write_snapshot
+
+@dataclass(slots=True)
 class XRPAccount:
     account: str
-    balance: float
+    balance_drops: int
     name: str = "Unknown"
     desc: str = ""
     domain: str = ""
     twitter: str = ""
     verified: bool = False
-    escrow_xrp: float = 0.0
+    escrow_drops: int = 0
 
 class XRPDataFetcher:
     def __init__(self):
         self.base_url = "https://api.xrpscan.com/api/v1"
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36',
-            'Accept': 'application/json'
+            'Accept': 'application/json',
+            'Accept-Encoding': 'gzip, deflate'
         }
+        # 接続・読み込みごとのタイムアウト（全体は/balancesの巨大レスポンスを考慮して長め）
+        self.timeout = aiohttp.ClientTimeout(total=180, connect=15, sock_connect=15, sock_read=60)
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.cache = XRPScanCache()
+        # ソースマネージャーが障害中と判断した場合は1回だけ試す
+        self.max_attempts = 3
+        self.label_grouper = LabelGrouper()
+        self.entity_state_path = ENTITY_STATE_PATH
 
-    async def fetch_data(self, endpoint: str) -> List[Dict]:
-        async with aiohttp.ClientSession(headers=self.headers) as session:
-            for attempt in range(3):  # 3回までリトライ
-                try:
-                    async with session.get(f"{self.base_url}/{endpoint}") as response:
-                        if response.status != 200:
-                            raise Exception(f"API request failed with status: {response.status}")
-                        
-                        content_type = response.headers.get('Content-Type', '')
-                        if 'application/json' not in content_type and 'text/json' not in content_type:
-                            raw = await response.read()
-                            if raw.lstrip().startswith((b"{", b"[")):
-                                return json.loads(raw.decode("utf-8", errors="strict"))
-                            if attempt < 2:
-                                print(f"Unexpected content type: {content_type}, retrying... (attempt {attempt + 1}/3)")
+    async def __aenter__(self):
+        await self.open_session()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close_session()
+
+    async def open_session(self) -> aiohttp.ClientSession:
+        """Create the shared keep-alive session on first use"""
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=8,
+                limit_per_host=4,
+                keepalive_timeout=60,
+                ttl_dns_cache=300
+            )
+            self.session = aiohttp.ClientSession(
+                headers=self.headers,
+                timeout=self.timeout,
+                connector=connector,
+                auto_decompress=True
+            )
+        return self.session
+
+    async def close_session(self):
+        await self.cache.wait_for_revalidations()
+        if self.session and not self.session.closed:
+            await self.session.close()
+        self.session = None
+
+    async def fetch_response(self, endpoint: str, headers: Optional[Dict[str, str]] = None) -> CachedResponse:
+        session = await self.open_session()
+        for attempt in range(self.max_attempts):
+            try:
+                async with session.get(f"{self.base_url}/{endpoint}", headers=headers) as response:
+                    # 条件付きリクエストで変更がなければ本文なしで返る
+                    if response.status == 304:
+                        return CachedResponse(status=304)
+                    if response.status != 200:
+                        raise await XRPScanResponseError.from_response(response)
+                    
+                    content_type = response.headers.get('Content-Type', '')
+                    if 'application/json' not in content_type and 'text/json' not in content_type:
+                        raw = await response.read()
+                        if raw.lstrip().startswith((b"{", b"[")):
+                            data = json.loads(raw.decode("utf-8", errors="strict"))
+                        else:
+                            if attempt < self.max_attempts - 1:
+                                print(f"Unexpected content type: {content_type}, retrying... (attempt {attempt + 1}/{self.max_attempts})")
                                 await asyncio.sleep(5 * (attempt + 1)) 
                                 continue
-                            raise Exception(f"Unexpected content type: {content_type}")
-                        
-                        return await response.json()
-                        
-                except Exception as e:
-                    if attempt < 2:
-                        print(f"Error during API request: {e}, retrying... (attempt {attempt + 1}/3)")
-                        await asyncio.sleep(5 * (attempt + 1))
-                        continue
-                    raise Exception(f"API request failed after 3 attempts: {e}")
+                            raise XRPScanResponseError(
+                                f"Unexpected content type: {content_type}",
+                                status=response.status,
+                                content_type=content_type,
+                                preview=raw[:2048].decode("utf-8", errors="replace")
+                            )
+                    else:
+                        data = await response.json()
+
+                    return CachedResponse(
+                        status=200,
+                        data=data,
+                        etag=response.headers.get('ETag'),
+                        last_modified=response.headers.get('Last-Modified')
+                    )
+                    
+            except Exception as e:
+                if attempt < self.max_attempts - 1:
+                    print(f"Error during API request: {e}, retrying... (attempt {attempt + 1}/{self.max_attempts})")
+                    await asyncio.sleep(5 * (attempt + 1))
+                    continue
+                raise Exception(f"API request failed after {self.max_attempts} attempts: {e}") from e
+
+    async def fetch_data(self, endpoint: str) -> List[Dict]:
+        response = await self.fetch_response(endpoint)
+        return response.data
+
+    async def fetch_cached_data(self, endpoint: str) -> List[Dict]:
+        """Fetch a rarely changing endpoint through the on-disk conditional-request cache"""
+        return await self.cache.get(
+            endpoint,
+            lambda headers: self.fetch_response(endpoint, headers)
+        )
 
     '''
     async def fetch_data(self, endpoint: str) -> List[Dict]:
@@ -80,9 +161,6 @@ class XRPDataFetcher:
                     raise Exception(f"API request failed after 3 attempts: {e}")
         '''
 
-    def convert_balance_to_xrp(self, drops: int) -> float:
-        return drops / 1_000_000
-
     def format_label(self, name: str, desc: str) -> str:
         """Format label with name and description"""
         if not name or name == "Unknown":
@@ -92,39 +170,86 @@ class XRPDataFetcher:
             return f"{name} ({desc})"
         return name
 
-    async def get_rich_list(self) -> List[XRPAccount]:
-        data = await self.fetch_data("balances")
-        accounts = []
+    def parse_rich_list_entry(self, entry: Dict) -> XRPAccount:
+        # Safely handle the name field which might be None
+        name_info = entry.get('name') or {}
         
-        for entry in data:
-            # Safely handle the name field which might be None
-            name_info = entry.get('name') or {}
-            
-            # name.nameがある場合はそれを使用し、ない場合はusernameを試す
-            name = (name_info.get('name') or 
-                   (name_info.get('username') if isinstance(name_info, dict) else None) or 
-                   'Unknown')
-            
-            account = XRPAccount(
-                account=entry['account'],
-                balance=self.convert_balance_to_xrp(entry['balance']),
-                name=name,
-                desc=name_info.get('desc', ''),
-                domain=name_info.get('domain', ''),
-                twitter=name_info.get('twitter', '')
-            )
-            accounts.append(account)
-            
-        return accounts
+        # name.nameがある場合はそれを使用し、ない場合はusernameを試す
+        name = (name_info.get('name') or 
+               (name_info.get('username') if isinstance(name_info, dict) else None) or 
+               'Unknown')
+        
+        return XRPAccount(
+            account=entry['account'],
+            balance_drops=int(entry['balance']),
+            name=name,
+            desc=name_info.get('desc', ''),
+            domain=name_info.get('domain', ''),
+            twitter=name_info.get('twitter', '')
+        )
+
+    async def stream_balance_entries(self) -> AsyncIterator[Dict]:
+        """Yield raw /balances entries while the body is still downloading"""
+        session = await self.open_session()
+        for attempt in range(self.max_attempts):
+            yielded = 0
+            try:
+                async with session.get(f"{self.base_url}/balances") as response:
+                    if response.status != 200:
+                        raise await XRPScanResponseError.from_response(response)
+                    
+                    # JSON配列でなければ（HTMLなど）最初のチャンクで例外になる
+                    try:
+                        async for entry in iter_json_array(response.content):
+                            yield entry
+                            yielded += 1
+                    except ValueError as e:
+                        if yielded:
+                            raise
+                        raise XRPScanResponseError(
+                            str(e),
+                            status=response.status,
+                            content_type=response.headers.get('Content-Type', ''),
+                            preview=str(e)
+                        ) from e
+                    return
+                    
+            except Exception as e:
+                # 一部を返した後はやり直せないので、そのまま失敗させる
+                if attempt < self.max_attempts - 1 and yielded == 0:
+                    print(f"Error during API request: {e}, retrying... (attempt {attempt + 1}/{self.max_attempts})")
+                    await asyncio.sleep(5 * (attempt + 1))
+                    continue
+                raise Exception(f"API request failed after {attempt + 1} attempts: {e}") from e
+
+    async def stream_rich_list(self) -> AsyncIterator[XRPAccount]:
+        async for entry in self.stream_balance_entries():
+            yield self.parse_rich_list_entry(entry)
+
+    async def get_rich_list(self) -> List[XRPAccount]:
+        return [account async for account in self.stream_rich_list()]
+
+    async def load_rich_list_columns(self) -> AccountColumns:
+        """Collect /balances into compact columns (balances in drops) as it downloads
+
+        Parsing overlaps the download and only the columns are kept in memory,
+        but the columns are returned only once the whole body has arrived.
+        """
+        builder = AccountColumnsBuilder()
+        async for entry in self.stream_balance_entries():
+            account = self.parse_rich_list_entry(entry)
+            builder.append(account.account, account.balance_drops, account.name,
+                           account.desc, account.domain, account.twitter)
+        return builder.build()
 
     async def get_well_known_accounts(self) -> List[XRPAccount]:
-        data = await self.fetch_data("names/well-known")
+        data = await self.fetch_cached_data("names/well-known")
         accounts = []
         
         for entry in data:
             account = XRPAccount(
                 account=entry['account'],
-                balance=0,
+                balance_drops=0,
                 name=entry.get('name', 'Unknown'),
                 desc=entry.get('desc', ""),
                 domain=entry.get('domain', ""),
@@ -135,86 +260,122 @@ class XRPDataFetcher:
             
         return accounts
 
-    def merge_accounts(self, rich_list: List[XRPAccount], well_known: List[XRPAccount]) -> List[XRPAccount]:
-        well_known_dict = {acc.account: acc for acc in well_known}
-        processed_accounts: Set[str] = set()
-        merged_accounts = []
+    async def load_well_known_columns(self) -> AccountColumns:
+        builder = AccountColumnsBuilder()
+        for account in await self.get_well_known_accounts():
+            builder.append(account.account, 0, account.name, account.desc,
+                           account.domain, account.twitter, account.verified)
+        return builder.build()
+
+    def merge_accounts(self, rich_list: AccountColumns, well_known: AccountColumns) -> RankedSnapshot:
+        """Join well-known metadata by address, then rank by balance"""
+        return rank_accounts(join_well_known(rich_list, well_known))
+
+    async def verify_domains(self, snapshot: RankedSnapshot):
+        """Check the snapshot's domains against their xrp-ledger.toml (failures leave it unverified)"""
+        try:
+            results = await DomainVerifier().verify(snapshot.columns.domain[snapshot.columns.domain != ""])
+            snapshot.domain_verified = apply_domain_verification(
+                snapshot.columns, results, await self.read_ledger_domains(snapshot, results))
+            print(f"Domain verified: {int(snapshot.domain_verified.sum())} accounts "
+                  f"({sum(result.ok for result in results.values())}/{len(results)} domains reachable)")
+        except Exception as e:
+            print(f"Domain verification skipped: {e}")
+
+    async def read_ledger_domains(self, snapshot: RankedSnapshot,
+                                  results: Dict[str, DomainResult]) -> Dict[str, Optional[str]]:
+        """On-ledger Domain of the Unknown accounts a verified domain lists (empty if the node is unreachable)"""
+        vouched = vouched_unknowns(snapshot.columns, results)
+        if not vouched:
+            return {}
+        try:
+            return await AccountDomainReader().read(
+                snapshot.columns.address[index].decode('ascii') for index in vouched)
+        except Exception as e:
+            # 台帳のDomainを確かめられなければ、掲載されているだけのアカウントはUnknownのままにする
+            print(f"Could not read account domains, {len(vouched)} listed accounts stay Unknown: {e}")
+            return {}
+
+    async def write_rich_list_snapshot(self, output_path: str, depth: Optional[int] = None) -> int:
+        """Fetch, merge and rank the rich list and write it as a snapshot file (raises on failure)"""
+        # /balancesはダウンロードしながら列に詰め、well-knownは並行取得
+        # 順位付けには全件の残高が要るので、スナップショットの行を書き出すのはダウンロードの完了後になる
+        print("Fetching rich list data and well-known accounts...")
+        rich_list, well_known = await asyncio.gather(
+            self.load_rich_list_columns(),
+            self.load_well_known_columns()
+        )
+        print(f"Found {len(rich_list)} accounts in rich list")
+        print(f"Found {len(well_known)} well-known accounts")
+
+        if depth is not None and len(rich_list) > depth:
+            rich_list = rich_list.take(np.argsort(-rich_list.balance, kind='stable')[:depth])
+            print(f"Keeping the top {depth} accounts")
         
-        # Process rich list first
-        for rich_acc in rich_list:
-            if rich_acc.account in processed_accounts:
-                continue
-                
-            if rich_acc.account in well_known_dict:
-                well_known_acc = well_known_dict[rich_acc.account]
-                well_known_acc.balance = rich_acc.balance
-                merged_accounts.append(well_known_acc)
-            else:
-                merged_accounts.append(rich_acc)
-                
-            processed_accounts.add(rich_acc.account)
+        print("Merging account data...")
+        snapshot = self.merge_accounts(rich_list, well_known)
+        await self.verify_domains(snapshot)
+        return self.write_ranked_snapshot(output_path, snapshot)
+
+    def group_labels(self, snapshot: RankedSnapshot, labels: List[str],
+                     escrow_pairs: Optional[List[Tuple[bytes, bytes]]] = None) -> List[str]:
+        """Rule-based grouped labels, with Unknown accounts grouped by entity resolution"""
+        grouped_labels = [self.label_grouper(label) for label in labels]
+        try:
+            return EntityResolver(self.entity_state_path).resolve(
+                snapshot.columns, grouped_labels, escrow_pairs, snapshot.domain_verified)
+        except Exception as e:
+            print(f"Entity resolution skipped: {e}")
+            return grouped_labels
+
+    def write_ranked_snapshot(self, output_path: str, snapshot: RankedSnapshot,
+                              escrow_pairs: Optional[List[Tuple[bytes, bytes]]] = None) -> int:
+        """Write a merged, ranked snapshot with labels and grouped labels"""
+        columns = snapshot.columns
+        
+        snapshot_date = datetime.now(timezone.utc).isoformat()
         
-        # Add remaining well-known accounts
-        for well_known_acc in well_known:
-            if well_known_acc.account not in processed_accounts:
-                merged_accounts.append(well_known_acc)
-                processed_accounts.add(well_known_acc.account)
+        print(f"Saving data to {output_path}...")
+        labels = [self.format_label(name, desc) for name, desc in zip(columns.name, columns.desc)]
+
+        # 列をそのままArrowの列として書き出す（テキスト変換なし）
+        write_snapshot(output_path, {
+            'rank': np.arange(1, len(snapshot) + 1, dtype=np.int32),
+            'address': np.char.decode(columns.address, 'ascii'),
+            'account_id': columns.account_id,
+            'label': labels,
+            'grouped_label': self.group_labels(snapshot, labels, escrow_pairs),
+            'balance_drops': columns.balance,
+            'escrow_drops': columns.escrow,
+            # 深い順位では割合が極小になるため丸めずに保持する
+            'percentage': snapshot.percentage,
+            'domain': columns.domain,
+            'twitter': columns.twitter,
+            'verified': columns.verified,
+            'domain_verified': (snapshot.domain_verified if snapshot.domain_verified is not None
+                                else np.zeros(len(snapshot), dtype=bool)),
+            'snapshot_date': pa.repeat(snapshot_date, len(snapshot)),
+            'exists': np.ones(len(snapshot), dtype=bool)
+        }, SNAPSHOT_SCHEMA)
         
-        return sorted(merged_accounts, key=lambda x: x.balance, reverse=True)
+        print(f"Successfully saved {len(snapshot)} entries to snapshot")
+        return len(snapshot)
 
-    async def save_to_csv(self, output_path: str):
+    async def save_snapshot(self, output_path: str):
         try:
-            print("Fetching rich list data...")
-            rich_list = await self.get_rich_list()
-            print(f"Found {len(rich_list)} accounts in rich list")
-            
-            print("Fetching well-known accounts...")
-            well_known = await self.get_well_known_accounts()
-            print(f"Found {len(well_known)} well-known accounts")
-            
-            print("Merging account data...")
-            merged_accounts = self.merge_accounts(rich_list, well_known)
-            
-            snapshot_date = datetime.now(timezone.utc).isoformat()
-            
-            print(f"Saving data to {output_path}...")
-            with open(output_path, 'w', newline='', encoding='utf-8') as csvfile:
-                fieldnames = ['rank', 'address', 'label', 'balance_xrp', 'escrow_xrp', 'percentage', 
-                            'domain', 'twitter', 'verified', 'snapshot_date']
-                writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-                writer.writeheader()
-                
-                total_xrp = sum(acc.balance for acc in merged_accounts)
-                
-                for rank, account in enumerate(merged_accounts, 1):
-                    percentage = (account.balance / total_xrp * 100) if total_xrp > 0 else 0
-                    
-                    writer.writerow({
-                        'rank': rank,
-                        'address': account.account,
-                        'label': self.format_label(account.name, account.desc),
-                        'balance_xrp': account.balance,
-                        'escrow_xrp': account.escrow_xrp,
-                        'percentage': round(percentage, 6),
-                        'domain': account.domain,
-                        'twitter': account.twitter,
-                        'verified': account.verified,
-                        'snapshot_date': snapshot_date
-                    })
-            
-            print(f"Successfully saved {len(merged_accounts)} entries to CSV")
+            await self.write_rich_list_snapshot(output_path)
             return True
             
         except Exception as e:
-            print(f"Error creating CSV: {e}")
+            print(f"Error creating snapshot: {e}")
             return False
 
 async def main():
     retries = 3
     for attempt in range(retries):
         try:
-            fetcher = XRPDataFetcher()
-            await fetcher.save_to_csv("rich_list_temp.csv")
+            async with XRPDataFetcher() as fetcher:
+                await fetcher.save_snapshot("rich_list_temp.arrow")
             break
         except Exception as e:
             if attempt < retries - 1:
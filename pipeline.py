@@ -0,0 +1,212 @@
+import asyncio
+import os
+import sys
+import time
+from typing import Optional
+
+from rich_list_sources import SourceManager, default_sources, rich_list_depth
+from validator import XRPLBalanceValidator, batch_size_for
+from uploader import SupabaseUploader, RichListUploadProcessor, UPLOAD_COLUMNS, upload_batch_size_for, to_upload_row
+from snapshot_file import SnapshotUpdater, read_snapshot, snapshot_row_count
+from snapshot_state import UploadProgressTracker, snapshot_date_of
+
+_DONE = None  # キューの終端マーカー
+
+class RichListPipeline:
+    """Run loader → validator → uploader in one process as concurrent stages
+
+    The loader still has to finish first (ranking needs every balance), but
+    after that validation and upload overlap: validated batches flow through
+    bounded queues and are uploaded while later rows are still being checked.
+    The snapshot file is updated in place as well, so it matches what was
+    uploaded. Batch sizes default to values scaled from the snapshot's row
+    count, and snapshots read from a validated ledger skip validation.
+    """
+
+    def __init__(self, snapshot_path: str = "rich_list_temp.arrow", depth: Optional[int] = None,
+                 validate_batch_size: Optional[int] = None, upload_batch_size: Optional[int] = None,
+                 queue_size: int = 8, browser_pool=None):
+        self.snapshot_path = snapshot_path
+        self.depth = depth or rich_list_depth()
+        self.validate_batch_size = validate_batch_size
+        self.upload_batch_size = upload_batch_size
+        self.queue_size = queue_size
+        self.browser_pool = browser_pool
+        self.needs_validation = True
+        self.validator = XRPLBalanceValidator()
+        self.processor = RichListUploadProcessor()
+
+    async def load(self):
+        # 障害中のソースは飛ばし、使えるうちで一番安いソースからスナップショットを作る
+        source = await SourceManager(default_sources(self.browser_pool), depth=self.depth).fetch_snapshot(self.snapshot_path)
+        self.needs_validation = not source.validated
+        print(f"Rich list loaded from '{source.name}'")
+
+    async def connect_uploader(self):
+        # supabaseクライアントは同期APIなのでスレッドで接続テストする
+        self.processor.uploader = await asyncio.to_thread(SupabaseUploader)
+
+    async def produce(self, queue: asyncio.Queue, batch_size: int, start: int = 0):
+        table = read_snapshot(self.snapshot_path).select(UPLOAD_COLUMNS)
+        for offset in range(start, table.num_rows, batch_size):
+            rows = table.slice(offset, batch_size).to_pylist()
+            await queue.put((offset, rows))
+        await queue.put(_DONE)
+
+    async def validate(self, validate_queue: asyncio.Queue, upload_queue: asyncio.Queue,
+                       snapshot: SnapshotUpdater):
+        total = len(snapshot)
+        processed = 0
+        verified_count = 0
+
+        await self.validator.setup_client()
+        try:
+            while (item := await validate_queue.get()) is not _DONE:
+                offset, rows = item
+                results = await asyncio.gather(
+                    *(self.validator.check_account(row['address']) for row in rows),
+                    return_exceptions=True
+                )
+
+                for index, (row, result) in enumerate(zip(rows, results), offset):
+                    if isinstance(result, Exception):
+                        print(f"Error processing {row['address']}: {result}")
+                        continue  # Keep original data
+
+                    values = result.snapshot_values()
+                    snapshot.update(index, **values)
+                    row.update(values)
+                    if result.exists:
+                        verified_count += 1
+
+                await upload_queue.put(item)
+
+                processed += len(rows)
+                if processed % 100 == 0:
+                    print(f"Validated {processed}/{total} entries ({(processed/total)*100:.1f}%)")
+                    print(f"Successfully verified: {verified_count} addresses")
+
+                if processed < total:
+                    await asyncio.sleep(1)  # Rate limiting
+        finally:
+            await self.validator.cleanup_client()
+
+        await upload_queue.put(_DONE)
+        print(f"Validation completed: {verified_count}/{total} verified")
+
+    async def upload(self, upload_queue: asyncio.Queue, batch_size: int, progress: UploadProgressTracker):
+        uploader = self.processor.uploader
+        if uploader.copy_loader is not None:
+            # COPYは検証後のスナップショットをまとめて送るので、ここではキューを空けるだけ
+            while await upload_queue.get() is not _DONE:
+                pass
+            return
+
+        async def batches():
+            while (item := await upload_queue.get()) is not _DONE:
+                yield [to_upload_row(row) for row in item[1]]
+
+        # 検証の済んだ行から、複数のリクエストを並行に送る（バッチサイズは応答時間に合わせて変わる）
+        try:
+            uploaded = await uploader.rest_uploader().upload(batches(), batch_size, on_uploaded=progress.mark_rows)
+        finally:
+            progress.save()
+        print(f"Successfully uploaded {uploaded} entries to Supabase")
+
+    async def run(self):
+        started = time.perf_counter()
+
+        print("Loading rich list and connecting to Supabase...")
+        async with asyncio.TaskGroup() as group:
+            group.create_task(self.load())
+            group.create_task(self.connect_uploader())
+        print(f"Snapshot ready after {time.perf_counter() - started:.1f}s")
+
+        if self.processor.change_detector.is_unchanged(self.snapshot_path):
+            # 前回と同じ内容なら検証もアップロードもせず、サマリーの日時だけ進める
+            await asyncio.to_thread(self.processor.carry_forward, self.snapshot_path)
+            self.processor.remove_snapshot(self.snapshot_path)
+            print(f"Pipeline completed in {time.perf_counter() - started:.1f}s (carried forward)")
+            return
+
+        total = snapshot_row_count(self.snapshot_path)
+        validate_batch_size = self.validate_batch_size or batch_size_for(total)
+        upload_batch_size = self.upload_batch_size or upload_batch_size_for(total)
+        print(f"{total} rows: validating {validate_batch_size} and uploading {upload_batch_size} per batch")
+
+        # 同じスナップショットの再実行なら、前回DBに入った順位の続きから送る
+        uploader = self.processor.uploader
+        progress = UploadProgressTracker(self.snapshot_path)
+        if not await asyncio.to_thread(uploader.begin_upload, progress):
+            raise Exception("Upload registration failed")
+        start = progress.high_water
+        if start:
+            print(f"Resuming upload {progress.run_id} after rank {start}")
+
+        validate_queue = asyncio.Queue(maxsize=self.queue_size)
+        upload_queue = asyncio.Queue(maxsize=self.queue_size)
+        copy_loader = uploader.copy_loader
+        with SnapshotUpdater(self.snapshot_path) as snapshot:
+            # どれかのステージが失敗すると残りはキャンセルされる
+            async with asyncio.TaskGroup() as group:
+                if self.needs_validation:
+                    group.create_task(self.produce(validate_queue, validate_batch_size, start))
+                    group.create_task(self.validate(validate_queue, upload_queue, snapshot))
+                else:
+                    # 検証済み台帳から読んだ残高は再検証せずにそのままアップロードする
+                    print("Snapshot comes from a validated ledger, skipping validation")
+                    if copy_loader is None:
+                        group.create_task(self.produce(upload_queue, upload_batch_size, start))
+                    else:
+                        await upload_queue.put(_DONE)
+                group.create_task(self.upload(upload_queue, upload_batch_size, progress))
+
+        if copy_loader is not None:
+            # 検証結果が書き戻されたスナップショットを1回のCOPYで投入する
+            copied = await asyncio.to_thread(copy_loader.load_snapshot, self.snapshot_path)
+            progress.mark_all()
+            print(f"Successfully copied {copied} entries to Supabase")
+        print(f"Validation and upload finished after {time.perf_counter() - started:.1f}s")
+
+        # 全行がDBにそろったことを確認できるまでサマリーは更新しない
+        if not await asyncio.to_thread(uploader.complete_upload, progress):
+            raise Exception("Snapshot upload is incomplete")
+
+        await asyncio.to_thread(self.processor.run_post_upload, snapshot_date_of(self.snapshot_path))
+        self.processor.record_upload(self.snapshot_path)
+        self.processor.remove_snapshot(self.snapshot_path)
+        print(f"Pipeline completed in {time.perf_counter() - started:.1f}s")
+
+async def run_daemon(interval: int):
+    """Run the pipeline every `interval` seconds in one long-lived process, reusing a warm browser"""
+    # デーモンモードでのみ、Chromeを起動したままにして次回のスクレイプで使い回す
+    from browser_pool import BrowserPool
+
+    browser_pool = BrowserPool()
+    try:
+        while True:
+            started = time.monotonic()
+            try:
+                await RichListPipeline(browser_pool=browser_pool).run()
+            except Exception as e:
+                print(f"Pipeline run failed: {e}")
+            delay = max(0.0, interval - (time.monotonic() - started))
+            print(f"Next run in {delay:.0f}s")
+            await asyncio.sleep(delay)
+    finally:
+        browser_pool.stop()
+
+async def main():
+    if "--daemon" in sys.argv[1:]:
+        await run_daemon(int(os.environ.get("PIPELINE_INTERVAL", 3600)))
+        return
+
+    pipeline = RichListPipeline()
+    try:
+        await pipeline.run()
+    except Exception as e:
+        print(f"Fatal error: {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,224 @@
+import asyncio
+import json
+import os
+import random
+import time
+from collections import deque
+from typing import AsyncIterable, Callable, Deque, Dict, List, Optional, Tuple
+
+import httpx
+
+from snapshot_file import read_snapshot
+
+# 再試行する応答（タイムアウト・レート制限・一時的なサーバーエラー）
+RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+PAYLOAD_TOO_LARGE = 413
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+class UploadError(Exception):
+    """A batch failed with a response that retrying will not fix"""
+
+class AsyncRestUploader:
+    """Insert rows through PostgREST with several batches in flight and an adaptive batch size
+
+    Rows arrive as an async stream of lists and are cut into batches of the
+    current batch size, which grows by min_batch_size while requests finish
+    within target_latency and halves when they are slow, time out or hit a
+    server error. It is also capped so one request body stays under
+    max_payload bytes; a 413 splits the batch and requeues the halves. Only
+    failed batches are retried, after a full-jitter backoff. At most
+    `concurrency` requests share one pooled (HTTP/2 when available) client,
+    which is what bounds the load on the database. With on_conflict the
+    inserts are upserts on those columns, so resending a batch that already
+    landed is harmless. transport replaces the network (e.g. an
+    httpx.MockTransport in tests).
+    """
+
+    def __init__(self, url: str, key: str, table: str = "xrpl_rich_list", concurrency: int = 4,
+                 min_batch_size: int = 100, max_batch_size: int = 2000, target_latency: float = 2.0,
+                 max_payload: int = 2 * 1024 * 1024, max_attempts: int = 5, backoff: float = 1.0,
+                 max_backoff: float = 30.0, timeout: float = 60.0, on_conflict: Optional[str] = None,
+                 transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.endpoint = f"{url.rstrip('/')}/rest/v1/{table}"
+        self.headers = {
+            'apikey': key,
+            'Authorization': f"Bearer {key}",
+            'Content-Type': 'application/json',
+            'Prefer': 'return=minimal'
+        }
+        if on_conflict:
+            self.endpoint += f"?on_conflict={on_conflict}"
+            self.headers['Prefer'] = 'return=minimal,resolution=merge-duplicates'
+        self.concurrency = concurrency
+        self.min_batch_size = min_batch_size
+        self.max_batch_size = max_batch_size
+        self.target_latency = target_latency
+        self.max_payload = max_payload
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.transport = transport
+
+        self.batch_size = min_batch_size
+        self.row_bytes: Optional[float] = None   # 1行あたりのJSONサイズ（移動平均）
+        self.rows: Deque[Dict] = deque()
+        self.requeued: Deque[Tuple[List[Dict], int]] = deque()   # (行, 試行回数)
+        self.in_flight = 0
+        self.finished_input = False
+        self.uploaded = 0
+        self.retries = 0
+        self._changed: Optional[asyncio.Condition] = None
+        self._on_uploaded: Optional[Callable[[List[Dict]], None]] = None
+
+    @classmethod
+    def from_env(cls, **kwargs) -> "AsyncRestUploader":
+        return cls(os.environ["SUPABASE_URL"], os.environ["SUPABASE_KEY"], **kwargs)
+
+    def payload_cap(self) -> int:
+        if self.row_bytes is None:
+            return self.max_batch_size
+        return max(1, int(self.max_payload * 0.8 / self.row_bytes))
+
+    def adapt(self, latency: float, rows: int, payload_bytes: int):
+        """AIMD on the batch size: add min_batch_size while fast, halve when slow"""
+        per_row = payload_bytes / rows
+        self.row_bytes = per_row if self.row_bytes is None else 0.8 * self.row_bytes + 0.2 * per_row
+        if latency <= self.target_latency:
+            size = self.batch_size + self.min_batch_size
+        else:
+            size = self.batch_size // 2
+        self.batch_size = max(self.min_batch_size, min(size, self.max_batch_size, self.payload_cap()))
+
+    def shrink(self):
+        self.batch_size = max(self.min_batch_size, self.batch_size // 2)
+
+    def backoff_delay(self, attempt: int, response: Optional[httpx.Response] = None) -> float:
+        if response is not None and response.headers.get('Retry-After', '').isdigit():
+            return float(response.headers['Retry-After'])
+        # full jitter: 同時に失敗したバッチが同じタイミングで再送しないようにする
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    async def feed(self, batches: AsyncIterable[List[Dict]]):
+        # 送信待ちの行は最大バッチ数本分までに抑える（スナップショット全体を溜めない）
+        limit = self.max_batch_size * self.concurrency * 2
+        async for batch in batches:
+            async with self._changed:
+                await self._changed.wait_for(lambda: len(self.rows) < limit)
+                self.rows.extend(batch)
+                self._changed.notify_all()
+        async with self._changed:
+            self.finished_input = True
+            self._changed.notify_all()
+
+    async def next_batch(self) -> Optional[Tuple[List[Dict], int]]:
+        """Requeued batches first, then up to batch_size new rows; None once everything is sent"""
+        def ready() -> bool:
+            if self.requeued or len(self.rows) >= self.batch_size:
+                return True
+            # 入力が終わっていれば端数も送る。送信中のバッチがあれば分割で戻ってくるかもしれないので待つ
+            return self.finished_input and (bool(self.rows) or self.in_flight == 0)
+
+        async with self._changed:
+            await self._changed.wait_for(ready)
+            if self.requeued:
+                job = self.requeued.popleft()
+            elif self.rows:
+                count = min(self.batch_size, len(self.rows))
+                job = ([self.rows.popleft() for _ in range(count)], 0)
+            else:
+                return None
+            self.in_flight += 1
+            self._changed.notify_all()
+            return job
+
+    async def send(self, client: httpx.AsyncClient, rows: List[Dict], attempt: int) -> int:
+        """Send one batch; retries it on transient errors and requeues halves on 413 (returns rows inserted)"""
+        payload = json.dumps(rows).encode('utf-8')
+        while True:
+            started = time.perf_counter()
+            response = None
+            try:
+                response = await client.post(self.endpoint, content=payload, headers=self.headers)
+                if response.status_code < 300:
+                    self.adapt(time.perf_counter() - started, len(rows), len(payload))
+                    return len(rows)
+                if response.status_code == PAYLOAD_TOO_LARGE and len(rows) > 1:
+                    self.max_batch_size = max(1, len(rows) // 2)
+                    self.min_batch_size = min(self.min_batch_size, self.max_batch_size)
+                    self.batch_size = min(self.batch_size, self.max_batch_size)
+                    middle = len(rows) // 2
+                    async with self._changed:
+                        self.requeued.extend([(rows[:middle], attempt), (rows[middle:], attempt)])
+                    print(f"Batch of {len(rows)} rows too large, split in two")
+                    return 0
+                if response.status_code not in RETRY_STATUSES:
+                    raise UploadError(f"PostgREST returned {response.status_code}: {response.text[:300]}")
+                error = f"HTTP {response.status_code}: {response.text[:200]}"
+            except httpx.TransportError as e:
+                error = f"{type(e).__name__}: {e}"
+
+            attempt += 1
+            self.retries += 1
+            self.shrink()
+            if attempt >= self.max_attempts:
+                raise UploadError(f"Batch of {len(rows)} rows failed after {attempt} attempts: {error}")
+            delay = self.backoff_delay(attempt, response)
+            print(f"Batch of {len(rows)} rows failed (attempt {attempt}/{self.max_attempts}): {error}; "
+                  f"retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+    async def worker(self, client: httpx.AsyncClient, report_every: int):
+        while (job := await self.next_batch()) is not None:
+            rows, attempt = job
+            try:
+                inserted = await self.send(client, rows, attempt)
+            finally:
+                async with self._changed:
+                    self.in_flight -= 1
+                    self._changed.notify_all()
+            if inserted and self._on_uploaded is not None:
+                self._on_uploaded(rows)
+            before = self.uploaded
+            self.uploaded += inserted
+            if self.uploaded // report_every != before // report_every:
+                print(f"Uploaded {self.uploaded} entries (batch size {self.batch_size})...")
+
+    async def upload(self, batches: AsyncIterable[List[Dict]], batch_size: Optional[int] = None,
+                     report_every: int = 1000, on_uploaded: Optional[Callable[[List[Dict]], None]] = None) -> int:
+        """Upload every row from batches; returns the number of rows inserted
+
+        on_uploaded is called with each batch once the server has accepted it.
+        """
+        self._on_uploaded = on_uploaded
+        if batch_size is not None:
+            self.batch_size = max(self.min_batch_size, min(batch_size, self.max_batch_size))
+        self._changed = asyncio.Condition()
+        started = time.perf_counter()
+        limits = httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency)
+        async with httpx.AsyncClient(http2=_http2_available(), limits=limits, timeout=self.timeout,
+                                     transport=self.transport) as client:
+            try:
+                async with asyncio.TaskGroup() as group:
+                    group.create_task(self.feed(batches))
+                    for _ in range(self.concurrency):
+                        group.create_task(self.worker(client, report_every))
+            except ExceptionGroup as errors:
+                # 呼び出し側には最初の失敗（UploadErrorなど）をそのまま返す
+                raise errors.exceptions[0]
+        print(f"Uploaded {self.uploaded} entries in {time.perf_counter() - started:.1f}s "
+              f"({self.retries} retries, final batch size {self.batch_size})")
+        return self.uploaded
+
+async def snapshot_batches(snapshot_path: str, columns: List[str], convert, chunk_size: int = 1000, start: int = 0):
+    """Snapshot rows from offset `start` as upload rows, in chunks (the uploader re-batches them)"""
+    table = read_snapshot(snapshot_path).select(columns).slice(start)
+    for batch in table.to_batches(max_chunksize=chunk_size):
+        yield [convert(row) for row in batch.to_pylist()]
+        await asyncio.sleep(0)
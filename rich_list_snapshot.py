@@ -0,0 +1,273 @@
+import sys
+from array import array
+from decimal import Decimal
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from account_id import ACCOUNT_ID_SIZE, account_id_array, account_id_bytes
+
+DROPS_PER_XRP = 1_000_000
+
+STRING_COLUMNS = ('name', 'desc', 'domain', 'twitter')
+
+def format_xrp(drops: int) -> str:
+    """Exact XRP amount as a decimal string for display (1234567 -> '1.234567')"""
+    sign = '-' if drops < 0 else ''
+    whole, fraction = divmod(abs(int(drops)), DROPS_PER_XRP)
+    return f"{sign}{whole}.{fraction:06d}"
+
+def xrp_to_drops(amount) -> int:
+    """Exact drops for an XRP amount given as text or float ('1.234567' -> 1234567)"""
+    return int((Decimal(str(amount)) * DROPS_PER_XRP).to_integral_value())
+
+@dataclass
+class AccountColumns:
+    """Column-oriented set of accounts (one numpy array per field)"""
+    address: np.ndarray   # 固定長bytes（XRPLアドレスはASCII、表示用）
+    account_id: np.ndarray  # S20（20バイトのAccountID、結合・重複判定のキー）
+    balance: np.ndarray   # int64 drops
+    escrow: np.ndarray    # int64 drops
+    name: np.ndarray      # object（インターン済み文字列）
+    desc: np.ndarray
+    domain: np.ndarray
+    twitter: np.ndarray
+    verified: np.ndarray  # bool
+
+    def __len__(self) -> int:
+        return len(self.address)
+
+    def take(self, indices: np.ndarray) -> 'AccountColumns':
+        return AccountColumns(
+            address=self.address[indices],
+            account_id=self.account_id[indices],
+            balance=self.balance[indices],
+            escrow=self.escrow[indices],
+            name=self.name[indices],
+            desc=self.desc[indices],
+            domain=self.domain[indices],
+            twitter=self.twitter[indices],
+            verified=self.verified[indices]
+        )
+
+    @staticmethod
+    def concat(first: 'AccountColumns', second: 'AccountColumns') -> 'AccountColumns':
+        return AccountColumns(
+            address=np.concatenate([first.address, second.address]),
+            account_id=np.concatenate([first.account_id, second.account_id]),
+            balance=np.concatenate([first.balance, second.balance]),
+            escrow=np.concatenate([first.escrow, second.escrow]),
+            name=np.concatenate([first.name, second.name]),
+            desc=np.concatenate([first.desc, second.desc]),
+            domain=np.concatenate([first.domain, second.domain]),
+            twitter=np.concatenate([first.twitter, second.twitter]),
+            verified=np.concatenate([first.verified, second.verified])
+        )
+
+class AccountColumnsBuilder:
+    """Append rows one at a time into compact arrays, then freeze into AccountColumns"""
+
+    def __init__(self):
+        self.addresses: List[str] = []
+        self.balances = array('q')
+        self.escrows = array('q')
+        self.names: List[str] = []
+        self.descs: List[str] = []
+        self.domains: List[str] = []
+        self.twitters: List[str] = []
+        self.verified = array('b')
+
+    def __len__(self) -> int:
+        return len(self.addresses)
+
+    def append(self, address: str, balance_drops: int, name: str = "Unknown", desc: str = "",
+               domain: str = "", twitter: str = "", verified: bool = False, escrow_drops: int = 0):
+        # ラベル類は同じ値が多いので intern して1つのオブジェクトを共有する
+        self.addresses.append(address)
+        self.balances.append(int(balance_drops))
+        self.escrows.append(int(escrow_drops))
+        self.names.append(sys.intern(name or ""))
+        self.descs.append(sys.intern(desc or ""))
+        self.domains.append(sys.intern(domain or ""))
+        self.twitters.append(sys.intern(twitter or ""))
+        self.verified.append(1 if verified else 0)
+
+    def build(self) -> AccountColumns:
+        def strings(values: List[str]) -> np.ndarray:
+            column = np.empty(len(values), dtype=object)
+            column[:] = values
+            return column
+
+        return AccountColumns(
+            address=np.array(self.addresses, dtype=np.bytes_),
+            account_id=account_id_array(self.addresses),   # まとめてデコード（不正なアドレスはValueError）
+            balance=np.frombuffer(self.balances, dtype=np.int64).copy(),
+            escrow=np.frombuffer(self.escrows, dtype=np.int64).copy(),
+            name=strings(self.names),
+            desc=strings(self.descs),
+            domain=strings(self.domains),
+            twitter=strings(self.twitters),
+            verified=np.frombuffer(self.verified, dtype=np.int8).astype(bool)
+        )
+
+class TopBalances:
+    """Keep only the `depth` largest balances from a stream of (address, drops) pages
+
+    Pages are buffered and periodically cut back to the top `depth` with
+    argpartition, so memory stays O(depth) however many accounts stream past.
+    """
+
+    def __init__(self, depth: int, compact_every: int = 1 << 16):
+        self.depth = depth
+        self.compact_every = max(depth, compact_every)
+        self.seen = 0
+        self._addresses = np.empty(0, dtype='S35')
+        self._balances = np.empty(0, dtype=np.int64)
+        self._pending_addresses: List[str] = []
+        self._pending_balances = array('q')
+
+    def extend(self, addresses: List[str], balances: List[int]):
+        self._pending_addresses.extend(addresses)
+        self._pending_balances.extend(balances)
+        self.seen += len(addresses)
+        if len(self._pending_addresses) >= self.compact_every:
+            self._compact()
+
+    def _compact(self):
+        if self._pending_addresses:
+            self._addresses = np.concatenate([self._addresses, np.array(self._pending_addresses, dtype='S35')])
+            self._balances = np.concatenate([self._balances, np.frombuffer(self._pending_balances, dtype=np.int64)])
+            self._pending_addresses = []
+            self._pending_balances = array('q')
+        if len(self._balances) > self.depth:
+            keep = np.argpartition(-self._balances, self.depth - 1)[:self.depth]
+            self._addresses = self._addresses[keep]
+            self._balances = self._balances[keep]
+
+    def build(self, escrows: Optional[Dict[bytes, int]] = None) -> AccountColumns:
+        """Top accounts as AccountColumns, largest balance first (escrows keyed by AccountID)"""
+        self._compact()
+        order = np.argsort(-self._balances, kind='stable')
+        addresses = self._addresses[order]
+        account_ids = account_id_array(addresses.astype(str))
+        count = len(addresses)
+        escrow = np.zeros(count, dtype=np.int64)
+        if escrows:
+            for index, account_id in enumerate(account_ids):
+                escrow[index] = escrows.get(account_id_bytes(account_id), 0)
+
+        def strings(value: str) -> np.ndarray:
+            column = np.empty(count, dtype=object)
+            column[:] = value
+            return column
+
+        return AccountColumns(
+            address=addresses,
+            account_id=account_ids,
+            balance=self._balances[order],
+            escrow=escrow,
+            name=strings("Unknown"),
+            desc=strings(""),
+            domain=strings(""),
+            twitter=strings(""),
+            verified=np.zeros(count, dtype=bool)
+        )
+
+@dataclass
+class RankedSnapshot:
+    columns: AccountColumns   # 順位順に並んだアカウント
+    percentage: np.ndarray    # float64（全体に対する保有割合%）
+    total_drops: int
+    domain_verified: Optional[np.ndarray] = None   # xrp-ledger.tomlで相互に確認できたアカウント
+
+    def __len__(self) -> int:
+        return len(self.columns)
+
+def account_keys(account_ids: np.ndarray) -> np.ndarray:
+    """64-bit keys for S20 AccountIDs: their first 8 bytes
+
+    An AccountID is already a hash (RIPEMD-160 of SHA-256), so its leading
+    bytes are uniformly distributed and need no further mixing.
+    """
+    words = np.ascontiguousarray(account_ids.astype(f'S{ACCOUNT_ID_SIZE}')).view(np.uint8)
+    return np.ascontiguousarray(words.reshape(len(account_ids), ACCOUNT_ID_SIZE)[:, :8]).view('<u8').ravel()
+
+def first_occurrences(account_ids: np.ndarray, keys: Optional[np.ndarray] = None) -> np.ndarray:
+    """Indices of the first occurrence of each distinct AccountID, in original order"""
+    if keys is None:
+        keys = account_keys(account_ids)
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+    duplicate = np.zeros(len(keys), dtype=bool)
+    duplicate[1:] = sorted_keys[1:] == sorted_keys[:-1]
+    if not duplicate.any():
+        return np.arange(len(account_ids))
+
+    # 安定ソートなので各グループの先頭が最初の出現位置になる
+    group_start = np.maximum.accumulate(np.where(duplicate, 0, np.arange(len(keys))))
+    later = order[duplicate]
+    first = order[group_start[duplicate]]
+    same = account_ids[later] == account_ids[first]
+    if not same.all():
+        # キー衝突（別アカウントが同じキー）があれば、AccountID全体で比べ直す（return_indexは安定ソート）
+        _, first_index = np.unique(account_ids, return_index=True)
+        return np.sort(first_index)
+    drop = np.zeros(len(account_ids), dtype=bool)
+    drop[later] = True
+    return np.flatnonzero(~drop)
+
+def join_well_known(rich_list: AccountColumns, well_known: AccountColumns) -> AccountColumns:
+    """Join well-known metadata onto the rich list by AccountID
+
+    Rich list accounts keep their balance but take name/desc/domain/twitter/verified
+    from the matching well-known entry; well-known accounts that are not in the
+    rich list are appended with a zero balance.
+    """
+    rich_keys = account_keys(rich_list.account_id)
+    keep = first_occurrences(rich_list.account_id, rich_keys)
+    rich_list = rich_list.take(keep)
+    rich_keys = rich_keys[keep]
+
+    if len(well_known) == 0:
+        return rich_list
+
+    # 安定ソートしたwell-knownのキーに対して二分探索（重複時は最後のエントリを採用）
+    well_known_keys = account_keys(well_known.account_id)
+    order = np.argsort(well_known_keys, kind='stable')
+    sorted_keys = well_known_keys[order]
+    position = np.searchsorted(sorted_keys, rich_keys, side='right') - 1
+    candidate = order[np.clip(position, 0, len(order) - 1)]
+    matched = (position >= 0) & (well_known.account_id[candidate] == rich_list.account_id)
+    # キーは一致したが別アカウントに当たった行（キー衝突）だけ、辞書で引き直す
+    collided = (position >= 0) & ~matched & (sorted_keys[np.clip(position, 0, len(order) - 1)] == rich_keys)
+    if collided.any():
+        latest = {account_id_bytes(account_id): index for index, account_id in enumerate(well_known.account_id)}
+        for index in np.flatnonzero(collided):
+            found = latest.get(account_id_bytes(rich_list.account_id[index]))
+            if found is not None:
+                candidate[index] = found
+                matched[index] = True
+    source = candidate[matched]
+
+    # take()はコピーを返すので、ここで列を書き換えても呼び出し元には影響しない
+    for column in STRING_COLUMNS + ('verified',):
+        getattr(rich_list, column)[matched] = getattr(well_known, column)[source]
+
+    remaining = first_occurrences(well_known.account_id)
+    remaining = remaining[~np.isin(well_known.account_id[remaining], well_known.account_id[source])]
+    extras = well_known.take(remaining)
+    extras.balance = np.zeros(len(extras), dtype=np.int64)
+
+    return AccountColumns.concat(rich_list, extras)
+
+def rank_accounts(columns: AccountColumns) -> RankedSnapshot:
+    """Order accounts by balance (descending, stable) and compute holding percentages"""
+    order = np.argsort(-columns.balance, kind='stable')
+    ranked = columns.take(order)
+    total_drops = int(ranked.balance.sum())
+    if total_drops > 0:
+        percentage = ranked.balance / total_drops * 100
+    else:
+        percentage = np.zeros(len(ranked), dtype=np.float64)
+    return RankedSnapshot(columns=ranked, percentage=percentage, total_drops=total_drops)
@@ -0,0 +1,292 @@
+import asyncio
+import functools
+import json
+import os
+import sys
+import time
+from dataclasses import dataclass, asdict, field
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from rich_list_snapshot import AccountColumns, AccountColumnsBuilder
+from xrpscan_cache import XRPScanResponseError, sniff_html
+
+# XRPScan APIキャッシュと同じディレクトリに置き、ワークフローのキャッシュで引き継ぐ
+HEALTH_PATH = os.path.join(".xrpscan_cache", "source_health.json")
+
+# 取得する順位の深さ（XRPScanは上位10,000件まで、それ以上は台帳から読む）
+DEFAULT_DEPTH = 10_000
+XRPSCAN_MAX_DEPTH = 10_000
+
+CLOSED = "closed"        # 正常
+OPEN = "open"            # 障害中（クールダウンが明けるまで使わない）
+HALF_OPEN = "half_open"  # クールダウン明け、1回だけ試す
+
+@dataclass
+class SourceHealth:
+    state: str = CLOSED
+    consecutive_failures: int = 0
+    open_count: int = 0          # 連続してOPENになった回数（クールダウンの倍率）
+    opened_at: float = 0.0
+    last_success_at: float = 0.0
+    last_failure_at: float = 0.0
+    last_status: Optional[int] = None
+    last_content_type: str = ""
+    last_error: str = ""
+    last_diagnosis: str = ""
+    last_latency: Optional[float] = None
+    latency_ewma: Optional[float] = None
+
+@dataclass
+class RichListSource:
+    name: str
+    cost: int                                  # 小さいほど安い（先に試す）
+    fetch: Callable[[str, bool, int], Awaitable[int]]  # (snapshot_path, probe, depth) -> 行数
+    max_depth: Optional[int] = None            # 取得できる最大の順位（Noneは無制限）
+    validated: bool = False                    # 残高が検証済み台帳から来ているか
+    health: SourceHealth = field(default_factory=SourceHealth)
+
+def ledger_source_enabled() -> bool:
+    """Whether the ledger source may be used (RICH_LIST_LEDGER_SOURCE=1)
+
+    A full ledger walk is about 25,000 ledger_data requests to a public node,
+    so it is opt-in rather than an automatic fallback.
+    """
+    return os.environ.get("RICH_LIST_LEDGER_SOURCE", "") == "1"
+
+def rich_list_depth() -> int:
+    """Configured rich list depth (RICH_LIST_DEPTH, default 10,000)"""
+    depth = int(os.environ.get("RICH_LIST_DEPTH", DEFAULT_DEPTH))
+    if depth <= 0:
+        raise ValueError(f"RICH_LIST_DEPTH must be positive, got {depth}")
+    return depth
+
+class SourceManager:
+    """Pick the cheapest healthy rich list source, with a persisted circuit breaker per source
+
+    A source that fails failure_threshold times in a row is opened and
+    skipped until its cooldown (doubling on every re-open, capped at
+    max_cooldown) has passed. After that it gets a single probe attempt
+    without the usual retry back-off. Health is saved to HEALTH_PATH so
+    the next run starts from what this run learned. Sources whose
+    max_depth is below the requested depth are left out.
+    """
+
+    def __init__(self, sources: List[RichListSource], depth: int = DEFAULT_DEPTH, health_path: str = HEALTH_PATH,
+                 failure_threshold: int = 2, cooldown: int = 30 * 60, max_cooldown: int = 6 * 3600):
+        # 要求された深さまで取得できないソースは候補から外す
+        self.depth = depth
+        self.sources = sorted(
+            (source for source in sources if source.max_depth is None or source.max_depth >= depth),
+            key=lambda source: source.cost
+        )
+        if not self.sources:
+            raise ValueError(f"No rich list source supports a depth of {depth}"
+                             + ("" if ledger_source_enabled() else " (set RICH_LIST_LEDGER_SOURCE=1 to read the ledger)"))
+        self.health_path = health_path
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.load_health()
+
+    def load_health(self):
+        try:
+            with open(self.health_path, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            saved = {}
+        # 今回使わないソースの状態も保存時に残す
+        self._saved_health = saved
+        for source in self.sources:
+            if source.name in saved:
+                known = SourceHealth.__dataclass_fields__
+                source.health = SourceHealth(**{k: v for k, v in saved[source.name].items() if k in known})
+
+    def save_health(self):
+        os.makedirs(os.path.dirname(self.health_path) or ".", exist_ok=True)
+        temp_path = f"{self.health_path}.temp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            health = {**self._saved_health, **{source.name: asdict(source.health) for source in self.sources}}
+            json.dump(health, f, indent=2)
+        os.replace(temp_path, self.health_path)
+
+    def current_state(self, health: SourceHealth) -> str:
+        if health.state != OPEN:
+            return health.state
+        cooldown = min(self.cooldown * 2 ** max(health.open_count - 1, 0), self.max_cooldown)
+        if time.time() - health.opened_at >= cooldown:
+            return HALF_OPEN
+        return OPEN
+
+    def record_success(self, health: SourceHealth, latency: float):
+        health.state = CLOSED
+        health.consecutive_failures = 0
+        health.open_count = 0
+        health.last_success_at = time.time()
+        health.last_latency = latency
+        health.latency_ewma = latency if health.latency_ewma is None else 0.7 * health.latency_ewma + 0.3 * latency
+
+    def record_failure(self, health: SourceHealth, error: Exception, latency: float, probe: bool):
+        health.consecutive_failures += 1
+        health.last_failure_at = time.time()
+        health.last_latency = latency
+        health.last_error = str(error)[:500]
+
+        # 例外の連鎖からXRPScanの応答情報（ステータス・Content-Type・本文の先頭）を拾う
+        cause = error
+        while cause is not None and not isinstance(cause, XRPScanResponseError):
+            cause = cause.__cause__
+        if cause is not None:
+            health.last_status = cause.status
+            health.last_content_type = cause.content_type
+            health.last_diagnosis = sniff_html(cause.preview) or ""
+        else:
+            health.last_status = None
+            health.last_content_type = ""
+            health.last_diagnosis = ""
+
+        if probe or health.consecutive_failures >= self.failure_threshold:
+            # 閉じた状態から開く場合は1から、プローブ失敗ならクールダウンを延ばす
+            health.open_count = 1 if health.state == CLOSED else health.open_count + 1
+            health.state = OPEN
+            health.opened_at = time.time()
+
+    async def try_source(self, source: RichListSource, snapshot_path: str, probe: bool) -> bool:
+        mode = "probe" if probe else "normal"
+        print(f"Trying rich list source '{source.name}' ({mode})...")
+        started = time.perf_counter()
+        try:
+            count = await source.fetch(snapshot_path, probe, self.depth)
+            if count == 0:
+                raise Exception("Source returned an empty rich list")
+        except Exception as e:
+            latency = time.perf_counter() - started
+            self.record_failure(source.health, e, latency, probe)
+            self.save_health()
+            diagnosis = f" [{source.health.last_diagnosis}]" if source.health.last_diagnosis else ""
+            print(f"Source '{source.name}' failed after {latency:.1f}s: {e}{diagnosis}")
+            return False
+
+        latency = time.perf_counter() - started
+        self.record_success(source.health, latency)
+        self.save_health()
+        print(f"Source '{source.name}' succeeded in {latency:.1f}s ({count} entries)")
+        return True
+
+    async def fetch_snapshot(self, snapshot_path: str) -> RichListSource:
+        """Write a snapshot from the first source that works; returns that source"""
+        skipped = []
+        for source in self.sources:
+            state = self.current_state(source.health)
+            if state == OPEN:
+                print(f"Skipping source '{source.name}' (circuit open: {source.health.last_error})")
+                skipped.append(source)
+                continue
+            if await self.try_source(source, snapshot_path, probe=state == HALF_OPEN):
+                return source
+
+        # 全ソースが障害中なら、安い順に1回ずつだけ試す
+        for source in skipped:
+            if await self.try_source(source, snapshot_path, probe=True):
+                return source
+
+        raise Exception("All rich list sources failed")
+
+async def fetch_from_api(snapshot_path: str, probe: bool, depth: int) -> int:
+    from loader import XRPDataFetcher
+
+    async with XRPDataFetcher() as fetcher:
+        if probe:
+            fetcher.max_attempts = 1
+        return await fetcher.write_rich_list_snapshot(snapshot_path, depth)
+
+async def load_well_known_or_empty(fetcher) -> AccountColumns:
+    """XRPScan's well-known accounts (cached), or no accounts if they cannot be fetched"""
+    try:
+        return await fetcher.load_well_known_columns()
+    except Exception as e:
+        print(f"Well-known accounts unavailable, continuing without them: {e}")
+        return AccountColumnsBuilder().build()
+
+async def fetch_from_ledger(snapshot_path: str, probe: bool, depth: int) -> int:
+    from ledger_loader import LedgerRichListLoader
+    from loader import XRPDataFetcher
+
+    # 数千ページを辿るため、プローブでもページ単位のリトライは残す
+    ledger = LedgerRichListLoader()
+    async with XRPDataFetcher() as fetcher:
+        # ラベルはXRPScanのwell-known（キャッシュ済み）から付ける。取れなければラベルなしで続ける
+        rich_list, well_known_accounts = await asyncio.gather(
+            ledger.load_rich_list_columns(depth),
+            load_well_known_or_empty(fetcher)
+        )
+        snapshot = fetcher.merge_accounts(rich_list, well_known_accounts)
+        await fetcher.verify_domains(snapshot)
+        return fetcher.write_ranked_snapshot(snapshot_path, snapshot, escrow_pairs=ledger.escrow_pairs)
+
+async def fetch_from_web(snapshot_path: str, probe: bool, depth: int, browser_pool=None) -> int:
+    """Scrape the balances page, then merge, verify and label it like the API and ledger sources
+
+    The page only shows a label per account, so domain/twitter come from the
+    well-known accounts; without them the snapshot is written with the page
+    labels only (no domain verification or domain/twitter entity links).
+    """
+    # seleniumはWebスクレイプが必要な時だけ読み込む
+    from loader import XRPDataFetcher
+    from scraper import XRPLRichListScraper
+
+    def scrape_with(debugger_address: Optional[str]):
+        scraper = XRPLRichListScraper(debugger_address=debugger_address)
+        try:
+            return scraper.scrape_rows(limit=depth)
+        finally:
+            scraper.close()
+
+    def scrape():
+        if browser_pool is None:
+            return scrape_with(None)
+        # デーモンモードでは起動済みのChromeを使い回す
+        with browser_pool.session() as debugger_address:
+            return scrape_with(debugger_address)
+
+    async with XRPDataFetcher() as fetcher:
+        if probe:
+            fetcher.max_attempts = 1
+        entries, well_known_accounts = await asyncio.gather(
+            asyncio.to_thread(scrape),
+            load_well_known_or_empty(fetcher)
+        )
+        # ページのラベルを名前として持たせる（well-knownに一致したアカウントはそちらで上書きされる）
+        builder = AccountColumnsBuilder()
+        for entry in entries:
+            builder.append(entry['address'], entry['balance_drops'], entry['label'],
+                           escrow_drops=entry['escrow_drops'])
+        snapshot = fetcher.merge_accounts(builder.build(), well_known_accounts)
+        await fetcher.verify_domains(snapshot)
+        return fetcher.write_ranked_snapshot(snapshot_path, snapshot)
+
+def default_sources(browser_pool=None) -> List[RichListSource]:
+    """All enabled rich list sources; browser_pool (a BrowserPool) keeps Chrome warm for the web source"""
+    sources = [
+        RichListSource(name="xrpscan_api", cost=1, fetch=fetch_from_api, max_depth=XRPSCAN_MAX_DEPTH),
+        RichListSource(name="xrpscan_web", cost=10, fetch=functools.partial(fetch_from_web, browser_pool=browser_pool),
+                       max_depth=XRPSCAN_MAX_DEPTH)
+    ]
+    if ledger_source_enabled():
+        sources.append(RichListSource(name="xrpl_ledger", cost=20, fetch=fetch_from_ledger, validated=True))
+    return sources
+
+async def main():
+    try:
+        manager = SourceManager(default_sources(), depth=rich_list_depth())
+        source = await manager.fetch_snapshot("rich_list_temp.arrow")
+        print(f"Rich list snapshot written from '{source.name}'")
+        # GitHub Actionsでは後続の検証ステップを飛ばすかどうかを出力する
+        if "GITHUB_OUTPUT" in os.environ:
+            with open(os.environ["GITHUB_OUTPUT"], 'a', encoding='utf-8') as f:
+                f.write(f"validated={'true' if source.validated else 'false'}\n")
+    except Exception as e:
+        print(f"Fatal error: {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    asyncio.run(main())
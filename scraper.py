@@ -4,10 +4,13 @@ from datetime import datetime, timezone
 import time
 import csv
 import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict
 from typing import Optional, Tuple
 from dataclasses import dataclass
 
+import numpy as np
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait, Select
@@ -18,118 +21,490 @@ from xrpl.clients import JsonRpcClient
 from xrpl.models import AccountInfo, AccountObjects
 from xrpl.asyncio.clients import AsyncJsonRpcClient
 
+from rich_list_snapshot import DROPS_PER_XRP, format_xrp, xrp_to_drops
+
 @dataclass
 class RichListEntry:
     rank: int
     address: str
     label: str
-    balance_xrp: float
-    escrow_xrp: float
+    balance_drops: int
+    escrow_drops: int
     percentage: float
 
 
+def parse_rich_list_html(html: str, header_xpath: str, limit: Optional[int] = None) -> List[List[str]]:
+    """Cell texts [rank, address, label, balance, escrow, percentage] of the rich list table in a saved page
+
+    Same rows as XRPLRichListScraper.EXTRACT_ROWS_SCRIPT, read from page HTML with lxml, so it
+    runs without a browser (e.g. against saved fixtures). Amounts stay as text; parse_table_rows
+    turns them into exact drops.
+    """
+    # lxmlはページソースを解析する時だけ必要
+    from lxml import html as lxml_html
+
+    def text(element) -> str:
+        return ' '.join(element.text_content().split())
+
+    document = lxml_html.fromstring(html)
+    tables = document.xpath(f"{header_xpath}/ancestor::table[1]")
+    if not tables:
+        raise Exception("Rich list table not found")
+    rows = []
+    for row in tables[0].xpath("./tbody/tr"):
+        cells = row.xpath("./td")
+        if len(cells) < 7:
+            continue
+        links = cells[1].xpath(".//a")
+        rows.append([text(cells[0]), text(links[0]) if links else '', text(cells[3]),
+                     text(cells[4]), text(cells[5]), text(cells[6])])
+        if limit and len(rows) >= limit:
+            break
+    return rows
+
+class RowsReady:
+    """WebDriverWait condition: the table has `expected` rows, or (if accept_idle) its row count has
+    moved off `initial` and it and the page's network activity have been unchanged for `settle` seconds"""
+
+    # テーブルの行数と、これまでに読み込んだリソース数を1回の往復で取る
+    COUNT_SCRIPT = """
+        const header = document.evaluate(arguments[0], document, null,
+            XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+        const table = header && header.closest('table');
+        const first = table && table.querySelector('tbody tr td');
+        return [table ? table.querySelectorAll('tbody tr').length : 0,
+                performance.getEntriesByType('resource').length,
+                first ? first.innerText.trim() : ''];
+    """
+
+    def __init__(self, header_xpath: str, expected: int, initial: int = 0, settle: float = 2.0,
+                 accept_idle: bool = True):
+        self.header_xpath = header_xpath
+        self.expected = expected
+        self.initial = initial   # 表示件数を変える前の行数（これのままなら再描画前）
+        self.settle = settle
+        self.accept_idle = accept_idle
+        self._last = None
+        self._since = 0.0
+
+    def __call__(self, driver) -> Optional[int]:
+        rows, resources, _ = driver.execute_script(self.COUNT_SCRIPT, self.header_xpath)
+        return self.check(rows, resources)
+
+    def check(self, rows: int, resources: int) -> Optional[int]:
+        if rows >= self.expected:
+            return rows
+        now = time.monotonic()
+        if (rows, resources) != self._last:
+            self._last, self._since = (rows, resources), now
+            return None
+        # 行数が揃わなくても、通信が止まって行数も変わらなければ読み込み完了とみなす
+        if self.accept_idle and rows and rows != self.initial and now - self._since >= self.settle:
+            print(f"Network idle with {rows} rows (expected {self.expected})")
+            return rows
+        return None
+
+class PageReady(RowsReady):
+    """RowsReady for page `page` of a table paged at `expected` rows, which also pages forward to it
+
+    Each call clicks at most once: the furthest visible page link up to
+    `page`, or the pagination's next control if none is visible. Only the
+    last page may finish short of `expected` rows (on network idle).
+    """
+
+    # ページ番号のリンク（react-bootstrapのPagination）のうち目的のページに一番近いものか「次へ」を押す
+    NAVIGATE_SCRIPT = """
+        const target = arguments[0], current = arguments[1];
+        const items = Array.from(document.querySelectorAll('ul.pagination a, ul.pagination button'));
+        let best = null, bestPage = current;
+        for (const item of items) {
+            const text = item.innerText.trim();
+            const page = parseInt(text, 10);
+            if (String(page) === text && page > bestPage && page <= target) {
+                best = item;
+                bestPage = page;
+            }
+        }
+        if (!best) {
+            best = items.find(item => /›|Next/.test(item.innerText) && !item.closest('.disabled'));
+            bestPage = best ? current + 1 : null;
+        }
+        if (best) best.click();
+        return bestPage;
+    """
+
+    def __init__(self, header_xpath: str, expected: int, page: int, initial: int = 0, last: bool = False,
+                 settle: float = 2.0):
+        super().__init__(header_xpath, expected, initial, settle=settle, accept_idle=last)
+        self.page = page
+        self.first_rank = str((page - 1) * expected + 1)
+        self._clicked: Optional[Tuple[int, float]] = None   # (向かっているページ, 押した時刻)
+
+    def __call__(self, driver) -> Optional[int]:
+        rows, resources, first = driver.execute_script(self.COUNT_SCRIPT, self.header_xpath)
+        # 前のページの行が残っている間は待つ
+        if first != self.first_rank:
+            self._last = None
+            self.navigate(driver, rows, first)
+            return None
+        return self.check(rows, resources)
+
+    def navigate(self, driver, rows: int, first: str):
+        # 表示件数の切り替えが反映されてから（1ページの行数が揃ってから）ページを送る
+        if rows < self.expected or not first.isdigit():
+            return
+        current = (int(first) - 1) // self.expected + 1
+        if current >= self.page:
+            return
+        # 押したページがまだ描画されていなければ待つ（反応がないまま落ち着いたら押し直す）
+        if self._clicked and current < self._clicked[0] and time.monotonic() - self._clicked[1] < self.settle:
+            return
+        heading = driver.execute_script(self.NAVIGATE_SCRIPT, self.page, current)
+        if heading is None:
+            raise Exception(f"No pagination link towards page {self.page} (showing page {current})")
+        self._clicked = (heading, time.monotonic())
+
+def merge_pages(pages: Dict[int, List[List[str]]], limit: int) -> List[List[str]]:
+    """Rows of all pages in rank order, up to `limit`; duplicate ranks are dropped, missing ranks raise"""
+    by_rank: Dict[int, List[str]] = {}
+    duplicates = 0
+    for page in sorted(pages):
+        for row in pages[page]:
+            rank = row[0].strip()
+            if not rank.isdigit():
+                continue
+            if int(rank) in by_rank:
+                duplicates += 1
+                continue
+            by_rank[int(rank)] = row
+    if duplicates:
+        print(f"Dropped {duplicates} duplicate rows across pages")
+    if not by_rank:
+        raise Exception("Paged scrape returned no rows")
+
+    # ページの境目で行が抜けていないか確認する（抜けたままでは検証でも気づけない）
+    last = min(max(by_rank), limit)
+    missing = [rank for rank in range(1, last + 1) if rank not in by_rank]
+    if missing:
+        raise Exception(f"{len(missing)} ranks missing from paged scrape (first: {missing[:5]})")
+    return [by_rank[rank] for rank in range(1, last + 1)]
+
 class XRPLRichListScraper:
-    def __init__(self):
+    # 見出しは表示件数で変わる（"Top 10,000 XRP balances" など）ので件数を含めない
+    TABLE_HEADER_XPATH = "//th[contains(text(), 'XRP balances')]"
+    MAX_ROWS = 10000  # XRPScanの表示件数の上限
+
+    # 表の取得に不要なリソース（画像・フォント・CSS・解析スクリプト）はCDPで読み込ませない
+    BLOCKED_URLS = [
+        "*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.svg", "*.ico",
+        "*.woff", "*.woff2", "*.ttf", "*.otf", "*.css",
+        "*google-analytics.com*", "*googletagmanager.com*", "*doubleclick.net*",
+        "*cloudflareinsights.com*", "*hotjar.com*"
+    ]
+
+    PAGE_SIZE_SELECT = "select#formGroupPage"
+
+    def __init__(self, timeout: int = 60, extract: Optional[str] = None, debugger_address: Optional[str] = None,
+                 max_tabs: int = 4):
         self.url = "https://xrpscan.com/balances"
+        self.timeout = timeout
+        self.max_tabs = max_tabs   # ページ分割で取る場合に並行して開くタブ数
+        # script: ページ内のスクリプトで抽出 / page_source: HTMLを取ってブラウザを閉じ、lxmlで解析
+        self.extract = extract or os.environ.get("SCRAPER_EXTRACT", "script")
+        if self.extract not in ("script", "page_source"):
+            raise ValueError(f"Unknown extract mode: {self.extract}")
         options = webdriver.ChromeOptions()
-        options.add_argument('--headless=new')
-        options.add_argument('--no-sandbox')
+        # debugger_addressがあれば起動済みのChrome（BrowserPool）に接続し、新しいタブで作業する
+        self.pooled = debugger_address is not None
+        if self.pooled:
+            options.debugger_address = debugger_address
+        else:
+            options.add_argument('--headless=new')
+            options.add_argument('--no-sandbox')
+            options.add_argument('--blink-settings=imagesEnabled=false')
         self.driver = webdriver.Chrome(options=options)
-        self.driver.implicitly_wait(20)
+        self.tabs: List[str] = []   # 自分で開いたタブ（接続先のChromeでは閉じるのはこれだけ）
+        if self.pooled:
+            self.open_tab()
+        # 暗黙の待機は使わず、必要な箇所だけ明示的に待つ
+        self.driver.implicitly_wait(0)
+        self.block_resources()
+
+    def open_tab(self) -> str:
+        """Open a new tab, switch to it and remember it for close()"""
+        self.driver.switch_to.new_window('tab')
+        handle = self.driver.current_window_handle
+        self.tabs.append(handle)
+        return handle
+
+    def block_resources(self):
+        # CDPの設定はタブごとなので、新しいタブでも呼ぶ
+        try:
+            self.driver.execute_cdp_cmd('Network.enable', {})
+            self.driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': self.BLOCKED_URLS})
+        except Exception as e:
+            print(f"Resource blocking unavailable: {e}")
 
-    def wait_for_rich_list_table(self):
+    def wait_for_rich_list_table(self, expected: int = MAX_ROWS) -> bool:
+        """Switch the page size to MAX_ROWS and wait until the rows are there (no fixed sleeps)"""
         print("Waiting for rich list table to load...")
         try:
-            wait = WebDriverWait(self.driver, 40)
-            
+            started = time.perf_counter()
+            wait = WebDriverWait(self.driver, self.timeout, poll_frequency=0.25)
+
             select_element = wait.until(EC.presence_of_element_located(
-                (By.CSS_SELECTOR, "select#formGroupPage")))
-            select = Select(select_element)
-            select.select_by_value("10000")
-            print("Changed display count to 10000 entries")
-            
-            time.sleep(10)
+                (By.CSS_SELECTOR, self.PAGE_SIZE_SELECT)))
+            initial, _, _ = self.driver.execute_script(RowsReady.COUNT_SCRIPT, self.TABLE_HEADER_XPATH)
+            Select(select_element).select_by_value(str(self.MAX_ROWS))
+            print(f"Changed display count to {self.MAX_ROWS} entries")
 
-            table_header = wait.until(EC.presence_of_element_located(
-                (By.XPATH, "//th[contains(text(), 'Top 10,000 XRP balances')]")))
-            print("Rich list table header found")
-            
-            time.sleep(10)
+            rows = wait.until(RowsReady(self.TABLE_HEADER_XPATH, expected, initial))
+            print(f"Rich list table ready with {rows} rows in {time.perf_counter() - started:.1f}s")
             return True
-            
+
         except Exception as e:
             print(f"Error while waiting for rich list table: {e}")
             return False
 
-    def parse_xrp_amount(self, text: str) -> float:
-        try:
-            amount_str = text.replace('XRP', '').replace(',', '').strip()
-            if not amount_str or amount_str == '-':
-                return 0.0
-            return float(amount_str)
-        except (ValueError, AttributeError) as e:
-            print(f"Error parsing XRP amount '{text}': {e}")
-            return 0.0
-
-    def parse_percentage(self, text: str) -> float:
+    # テーブルの各行からセルのテキストを取り出し、JSON文字列1つで返す（WebDriverの往復は1回）
+    # 金額はJSの数値にせずテキストのまま返し、Python側でdropsに変換する（丸め誤差を入れない）
+    EXTRACT_ROWS_SCRIPT = """
+        const header = document.evaluate(arguments[0], document, null,
+            XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+        const table = header && header.closest('table');
+        if (!table) return null;
+        const limit = arguments[1];
+        const rows = [];
+        for (const row of table.querySelectorAll('tbody tr')) {
+            const cells = row.cells;
+            if (cells.length < 7) continue;
+            const link = cells[1].querySelector('a');
+            rows.push([cells[0].innerText, link ? link.innerText : '', cells[3].innerText,
+                       cells[4].innerText, cells[5].innerText, cells[6].innerText]);
+            if (limit && rows.length >= limit) break;
+        }
+        return JSON.stringify(rows);
+    """
+
+    def parse_xrp_amounts(self, texts: np.ndarray) -> np.ndarray:
+        """'1,234.5 XRP' -> 1234500000 drops (int64) for a whole column ('' and '-' are 0)
+
+        The text is split at the decimal point and read as integers, so
+        amounts are exact to the drop and never pass through float.
+        """
+        cleaned = np.char.strip(np.char.replace(np.char.replace(texts, 'XRP', ''), ',', ''))
+        cleaned[(cleaned == '') | (cleaned == '-')] = '0'
+        parts = np.char.partition(cleaned, '.')
+        whole, fraction = parts[:, 0], parts[:, 2]
+        simple = (np.char.isdigit(whole) & (np.char.isdigit(fraction) | (fraction == ''))
+                  & (np.char.str_len(fraction) <= 6))
+        drops = np.zeros(len(cleaned), dtype=np.int64)
+        if simple.any():
+            # 小数部を6桁に右詰めすればそのままdrops単位の整数になる
+            drops[simple] = (whole[simple].astype(np.int64) * DROPS_PER_XRP
+                             + np.char.ljust(fraction[simple], 6, '0').astype(np.int64))
+        # それ以外の書式（".5" や指数表記など）だけDecimalで1件ずつ変換する（変換できない値は0）
+        for index in np.flatnonzero(~simple):
+            try:
+                drops[index] = xrp_to_drops(cleaned[index])
+            except ArithmeticError:
+                print(f"Error parsing XRP amount '{texts[index]}'")
+        return drops
+
+    def parse_percentages(self, texts: np.ndarray) -> np.ndarray:
+        """'0.0123%' -> 0.0123 for a whole column"""
+        cleaned = np.char.strip(np.char.replace(texts, '%', ''))
+        cleaned[(cleaned == '') | (cleaned == '-')] = '0'
         try:
-            return float(text.replace('%', '').strip())
-        except (ValueError, AttributeError):
-            return 0.0
+            return cleaned.astype(np.float64)
+        except ValueError:
+            # 1件でも数値でなければ、その列だけ1件ずつ変換する（変換できない値は0）
+            values = np.zeros(len(cleaned), dtype=np.float64)
+            for index, text in enumerate(cleaned):
+                try:
+                    values[index] = float(text)
+                except ValueError:
+                    print(f"Error parsing percentage '{texts[index]}'")
+            return values
+
+    def parse_table_rows(self, rows: List[List[str]], snapshot_date: str) -> List[Dict]:
+        """Cell texts [rank, address, label, balance, escrow, percentage] -> row dicts
+
+        The amount and percentage columns are cleaned up as whole numpy
+        arrays (amounts as exact drops); rows whose rank is not a number
+        are skipped.
+        """
+        if not rows:
+            return []
+        cells = np.array(rows, dtype=str)
+        ranks = np.char.strip(cells[:, 0])
+        valid = np.char.isdigit(ranks)
+        if not valid.all():
+            print(f"Skipping {int((~valid).sum())} rows without a rank")
+            cells, ranks = cells[valid], ranks[valid]
+
+        addresses = np.char.strip(cells[:, 1])
+        labels = np.char.strip(cells[:, 2])
+        labels[labels == ''] = "Unknown"
+        columns = zip(
+            ranks.astype(np.int64).tolist(),
+            addresses.tolist(),
+            labels.tolist(),
+            self.parse_xrp_amounts(cells[:, 3]).tolist(),
+            self.parse_xrp_amounts(cells[:, 4]).tolist(),
+            self.parse_percentages(cells[:, 5]).tolist()
+        )
+        return [
+            {
+                'rank': rank,
+                'address': address,
+                'label': label,
+                'balance_drops': balance,
+                'escrow_drops': escrow,
+                'percentage': percentage,
+                'snapshot_date': snapshot_date
+            }
+            for rank, address, label, balance, escrow, percentage in columns
+        ]
+
+    def scrape_rows(self, limit: Optional[int] = None) -> List[Dict]:
+        """Scrape the rich list table into row dicts (raises if the table does not load)"""
+        self.driver.get(self.url)
+        if not self.wait_for_rich_list_table(min(limit or self.MAX_ROWS, self.MAX_ROWS)):
+            # 10,000件表示が選べない・読み込めない場合は、小さいページを複数タブで並行に取る
+            print("Falling back to paged scraping...")
+            started = time.perf_counter()
+            rows = self.scrape_paged(limit or self.MAX_ROWS)
+            print(f"Scraped {len(rows)} rows in {time.perf_counter() - started:.1f}s")
+            return self.parse_table_rows(rows, datetime.now(timezone.utc).isoformat())
+
+        started = time.perf_counter()
+        if self.extract == "page_source":
+            rows = self.extract_from_page_source(limit)
+        else:
+            raw = self.driver.execute_script(self.EXTRACT_ROWS_SCRIPT, self.TABLE_HEADER_XPATH, limit or 0)
+            if raw is None:
+                raise Exception("Rich list table not found")
+            rows = json.loads(raw)
+        print(f"Extracted {len(rows)} rows in {time.perf_counter() - started:.1f}s")
+
+        entries = self.parse_table_rows(rows, datetime.now(timezone.utc).isoformat())
+        print(f"Processed {len(entries)} entries")
+        return entries
+
+    def page_sizes(self) -> List[int]:
+        """Page sizes offered by the page-size select"""
+        WebDriverWait(self.driver, self.timeout, poll_frequency=0.25).until(
+            EC.presence_of_element_located((By.CSS_SELECTOR, self.PAGE_SIZE_SELECT)))
+        values = self.driver.execute_script(
+            "return Array.from(document.querySelector(arguments[0]).options, option => option.value);",
+            self.PAGE_SIZE_SELECT)
+        return sorted(int(value) for value in values if value.isdigit())
+
+    def open_page(self, page: int, page_size: int, last: bool = False) -> PageReady:
+        """Load the balances page in the current tab and switch it to `page_size` rows
+
+        Returns the condition that pages forward to `page` and reports it ready.
+        """
+        self.driver.get(self.url)
+        wait = WebDriverWait(self.driver, self.timeout, poll_frequency=0.25)
+        select_element = wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, self.PAGE_SIZE_SELECT)))
+        initial, _, _ = self.driver.execute_script(RowsReady.COUNT_SCRIPT, self.TABLE_HEADER_XPATH)
+        Select(select_element).select_by_value(str(page_size))
+        return PageReady(self.TABLE_HEADER_XPATH, page_size, page, initial, last)
+
+    def scrape_paged(self, limit: int) -> List[List[str]]:
+        """Scrape `limit` rows as pages of the largest smaller page size, several tabs at a time
+
+        Every WebDriver command is serial, including driver.get and the
+        page-size switch in open_page, which block one tab at a time. What
+        overlaps is the browser's side: after that, each tab's data
+        requests and renders run while the driver polls the other tabs.
+        Polling pages a tab forward one click at a time (PageReady), so a
+        deep page does not hold up the rest. A tab is extracted as soon as
+        its page is ready and then reused. Pages are merged by rank.
+        """
+        smaller = [size for size in self.page_sizes() if size < self.MAX_ROWS]
+        if not smaller:
+            raise Exception("No page size available for paged scraping")
+        page_size = smaller[-1]
+        page_count = -(-limit // page_size)
+        pending = list(range(1, page_count + 1))
+        print(f"Scraping {page_count} pages of {page_size} rows in up to {self.max_tabs} tabs...")
+
+        free = [self.driver.current_window_handle]
+        while len(free) < min(self.max_tabs, page_count):
+            free.append(self.open_tab())
+            self.block_resources()
+
+        pages: Dict[int, List[List[str]]] = {}
+        loading: Dict[str, Tuple[int, PageReady, float]] = {}   # タブ -> (ページ, 待機条件, 期限)
+        while pending or loading:
+            while pending and free:
+                handle = free.pop()
+                page = pending.pop(0)
+                self.driver.switch_to.window(handle)
+                loading[handle] = (page, self.open_page(page, page_size, last=page == page_count),
+                                   time.monotonic() + self.timeout)
+
+            for handle, (page, ready, deadline) in list(loading.items()):
+                self.driver.switch_to.window(handle)
+                if ready(self.driver):
+                    raw = self.driver.execute_script(self.EXTRACT_ROWS_SCRIPT, self.TABLE_HEADER_XPATH, 0)
+                    pages[page] = json.loads(raw or "[]")
+                    print(f"Page {page}/{page_count}: {len(pages[page])} rows")
+                    del loading[handle]
+                    free.append(handle)
+                elif time.monotonic() > deadline:
+                    raise Exception(f"Page {page} did not load within {self.timeout}s")
+            time.sleep(0.25)
+
+        return merge_pages(pages, limit)
+
+    def extract_from_page_source(self, limit: Optional[int] = None) -> List[List[str]]:
+        """Take one page_source snapshot, then parse it in a worker thread while the browser quits"""
+        html = self.driver.page_source
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            parsed = executor.submit(parse_rich_list_html, html, self.TABLE_HEADER_XPATH, limit)
+            self.close()
+            return parsed.result()
+
+    def close(self):
+        # page_sourceモードでは抽出直後に閉じているので2回目は何もしない
+        if self.driver is not None:
+            if self.pooled:
+                # 自分で開いたタブだけ閉じる（接続したChromeはquitしても終了しない）
+                for handle in self.tabs:
+                    try:
+                        self.driver.switch_to.window(handle)
+                        self.driver.close()
+                    except Exception as e:
+                        print(f"Error closing scraper tab: {e}")
+                self.tabs = []
+            self.driver.quit()
+            self.driver = None
 
     def scrape_to_csv(self, output_path: str) -> bool:
         try:
-            self.driver.get(self.url)
-            if not self.wait_for_rich_list_table():
-                return False
-
-            table = self.driver.find_element(
-                By.XPATH, 
-                "//th[contains(text(), 'Top 10,000 XRP balances')]/ancestor::table"
-            )
-            rows = table.find_elements(By.CSS_SELECTOR, "tbody tr")
+            entries = self.scrape_rows()
             
             with open(output_path, 'w', newline='', encoding='utf-8') as csvfile:
                 fieldnames = ['rank', 'address', 'label', 'balance_xrp', 'escrow_xrp', 'percentage', 'snapshot_date', 'exists']
-                writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+                writer = csv.DictWriter(csvfile, fieldnames=fieldnames, extrasaction='ignore')
                 writer.writeheader()
-                
-                snapshot_date = datetime.now(timezone.utc).isoformat()
-                processed_count = 0
+                # CSVには drops から正確に書式化したXRP額を書く
+                for entry in entries:
+                    writer.writerow({**entry, 'balance_xrp': format_xrp(entry['balance_drops']),
+                                     'escrow_xrp': format_xrp(entry['escrow_drops'])})
 
-                for row in rows:
-                    try:
-                        cells = row.find_elements(By.TAG_NAME, "td")
-                        if len(cells) < 7:
-                            continue
-
-                        entry = {
-                            'rank': int(cells[0].text.strip()),
-                            'address': cells[1].find_element(By.TAG_NAME, "a").text.strip(),
-                            'label': cells[3].text.strip() or "Unknown",
-                            'balance_xrp': self.parse_xrp_amount(cells[4].text),
-                            'escrow_xrp': self.parse_xrp_amount(cells[5].text) if cells[5].text.strip() else 0.0,
-                            'percentage': self.parse_percentage(cells[6].text),
-                            'snapshot_date': snapshot_date
-                        }
-                        writer.writerow(entry)
-                        processed_count += 1
-
-                        if processed_count % 100 == 0:
-                            print(f"Processed {processed_count} entries...")
-
-                    except Exception as e:
-                        print(f"Error processing row: {e}")
-                        continue
-
-            print(f"Successfully saved {processed_count} entries to CSV")
+            print(f"Successfully saved {len(entries)} entries to CSV")
             return True
 
         except Exception as e:
             print(f"Error scraping rich list: {e}")
             return False
         finally:
-            self.driver.quit()
+            self.close()
 
 
 class XRPLBalanceValidator:
@@ -147,7 +522,8 @@ class XRPLBalanceValidator:
             await self.client._client.close()
         self.client = None
 
-    async def get_escrow_info(self, address: str) -> Optional[float]:
+    async def get_escrow_info(self, address: str) -> Optional[int]:
+        """Total escrowed drops of the account"""
         for attempt in range(self.max_retries + 1):
             try:
                 response = await self.client.request(AccountObjects(
@@ -166,7 +542,7 @@ class XRPLBalanceValidator:
                         
                         escrows = response_dict['result']['account_objects']
                         return sum(
-                            float(escrow['Amount']) / 1000000 
+                            int(escrow['Amount'])
                             for escrow in escrows 
                             if isinstance(escrow, dict) and 'Amount' in escrow
                         )
@@ -274,8 +650,8 @@ class XRPLBalanceValidator:
         finally:
             await self.cleanup_client()
 
-    async def check_and_get_account_info(self, address: str) -> Tuple[bool, Optional[float], Optional[float]]:
-        """アカウントの存在確認とバランス取得を行う"""
+    async def check_and_get_account_info(self, address: str) -> Tuple[bool, str, str]:
+        """アカウントの存在確認とバランス取得を行う（残高はdropsから正確に書式化したXRP額）"""
         for attempt in range(self.max_retries + 1):
             try:
                 response = await self.client.request(AccountInfo(
@@ -292,11 +668,9 @@ class XRPLBalanceValidator:
                         'account_data' in response_dict['result'] and 
                         'Balance' in response_dict['result']['account_data']):
                         
-                        balance = float(response_dict['result']['account_data']['Balance']) / 1000000
-                        escrow_balance = await self.get_escrow_info(address)
-                        if escrow_balance is None:
-                            escrow_balance = 0
-                        return True, balance, escrow_balance
+                        balance = int(response_dict['result']['account_data']['Balance'])
+                        escrow_drops = await self.get_escrow_info(address)
+                        return True, format_xrp(balance), format_xrp(escrow_drops or 0)
                     
                     if attempt < self.max_retries:
                         print(f"Retry {attempt + 1}/{self.max_retries} for account {address}")
@@ -304,7 +678,7 @@ class XRPLBalanceValidator:
                         continue
                     
                     print(f"Account {address} does not exist")
-                    return False, 0, 0
+                    return False, format_xrp(0), format_xrp(0)
                         
                 except Exception as e:
                     if attempt < self.max_retries:
@@ -0,0 +1,251 @@
+import csv
+import hashlib
+import json
+import mmap
+import os
+import sys
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.ipc as ipc
+
+# パイプライン間で受け渡すスナップショットの列定義（CSVの列順と同じ）
+SNAPSHOT_SCHEMA = pa.schema([
+    pa.field('rank', pa.int32()),
+    pa.field('address', pa.string()),
+    pa.field('account_id', pa.binary(20)),   # DBのキー（クラシックアドレスは表示・検証用）
+    pa.field('label', pa.string()),
+    pa.field('grouped_label', pa.string()),
+    pa.field('balance_drops', pa.int64()),   # 金額はすべてdrops（整数）で保持
+    pa.field('escrow_drops', pa.int64()),
+    pa.field('percentage', pa.float64()),
+    pa.field('domain', pa.string()),
+    pa.field('twitter', pa.string()),
+    pa.field('verified', pa.bool_()),
+    pa.field('domain_verified', pa.bool_()),   # ドメインのxrp-ledger.tomlにアカウントが載っているか
+    pa.field('snapshot_date', pa.string()),
+    pa.field('exists', pa.bool_())
+])
+
+RLUSD_SNAPSHOT_SCHEMA = SNAPSHOT_SCHEMA.insert(
+    SNAPSHOT_SCHEMA.get_field_index('percentage') + 1,
+    pa.field('balance_rlusd', pa.float64())
+)
+
+# 内容ハッシュに含めない列（順位と割合は並びと残高から決まり、日時は毎回変わる）
+DERIVED_COLUMNS = frozenset({'rank', 'percentage', 'snapshot_date'})
+
+def _as_array(values: Any, type: pa.DataType) -> pa.Array:
+    if isinstance(values, pa.Array):
+        return values.cast(type)
+    array = pa.array(values, type=type)
+    # 大きなnumpy文字列配列はChunkedArrayで返るので1つにまとめる
+    if isinstance(array, pa.ChunkedArray):
+        array = array.combine_chunks()
+    return array
+
+def write_snapshot(path: str, columns: Dict[str, Any], schema: pa.Schema = SNAPSHOT_SCHEMA) -> int:
+    """Write columns as a single-batch, uncompressed Arrow IPC file
+
+    One record batch keeps every column in one contiguous buffer, which is
+    what lets SnapshotUpdater patch fixed-width columns in place.
+    """
+    batch = pa.RecordBatch.from_arrays(
+        [_as_array(columns[field.name], field.type) for field in schema],
+        schema=schema
+    )
+    content_hash, label_hashes = content_digest(batch)
+    batch = batch.replace_schema_metadata({
+        **(schema.metadata or {}),
+        b'content_hash': content_hash.encode(),
+        b'label_hashes': json.dumps(label_hashes, ensure_ascii=False, sort_keys=True).encode()
+    })
+    temp_path = f"{path}.temp"
+    with pa.OSFile(temp_path, 'wb') as sink:
+        with ipc.new_file(sink, batch.schema) as writer:
+            writer.write_batch(batch)
+    os.replace(temp_path, path)
+    return batch.num_rows
+
+def _column_bytes(array: pa.Array) -> Iterator[Any]:
+    """Canonical bytes of an array, independent of buffer offsets and padding"""
+    if array.null_count:
+        yield array.is_null().to_numpy(zero_copy_only=False).tobytes()
+    if pa.types.is_string(array.type) or pa.types.is_binary(array.type):
+        buffers = array.buffers()
+        offsets = np.frombuffer(buffers[1], dtype=np.int32)[array.offset:array.offset + len(array) + 1]
+        yield (offsets - offsets[0]).tobytes()
+        if buffers[2] is not None and offsets[-1] > offsets[0]:
+            yield buffers[2].slice(int(offsets[0]), int(offsets[-1] - offsets[0]))
+    elif pa.types.is_fixed_size_binary(array.type):
+        # to_numpyはbytesオブジェクトの配列になるので、データバッファをそのまま使う
+        width = array.type.byte_width
+        yield array.buffers()[1].slice(array.offset * width, len(array) * width)
+    else:
+        yield array.to_numpy(zero_copy_only=False).tobytes()
+
+def _hash_columns(batch: pa.RecordBatch, skip: frozenset) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    for field, column in zip(batch.schema, batch.columns):
+        if field.name in skip:
+            continue
+        digest.update(f"{field.name}:{field.type}\n".encode())
+        for chunk in _column_bytes(column):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def content_digest(batch: pa.RecordBatch) -> Tuple[str, Dict[str, str]]:
+    """Content hash of a snapshot plus one sub-hash per grouped_label
+
+    Derived and per-run columns (DERIVED_COLUMNS) are left out, so two runs
+    over the same balances and labels hash equal. Row order is part of the
+    hash.
+    """
+    content_hash = _hash_columns(batch, DERIVED_COLUMNS)
+    if 'grouped_label' not in batch.schema.names:
+        return content_hash, {}
+
+    # 文字列のままソートせず、辞書エンコードした整数コードでグループ分けする
+    encoded = batch.column('grouped_label').fill_null('').dictionary_encode()
+    names = encoded.dictionary.to_pylist()
+    codes = encoded.indices.to_numpy()
+    order = np.argsort(codes, kind='stable')
+    sorted_codes = codes[order]
+    starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]])
+    label_hashes = {}
+    # ラベルごとに元の行順のまま部分ハッシュを取る（どのラベルが変わったかを追えるように）
+    for start, end in zip(starts, np.r_[starts[1:], len(order)]):
+        rows = batch.take(pa.array(order[start:end]))
+        label_hashes[names[sorted_codes[start]]] = _hash_columns(rows, DERIVED_COLUMNS | {'grouped_label'})
+    return content_hash, label_hashes
+
+def snapshot_digest(path: str) -> Tuple[Optional[str], Dict[str, str]]:
+    """Content hash and per-label hashes stored in a snapshot file's metadata"""
+    metadata = ipc.open_file(pa.memory_map(path, 'r')).schema.metadata or {}
+    content_hash = metadata.get(b'content_hash')
+    label_hashes = json.loads(metadata.get(b'label_hashes', b'{}'))
+    return (content_hash.decode() if content_hash else None), label_hashes
+
+def read_snapshot(path: str) -> pa.Table:
+    """Memory-mapped, zero-copy read of a snapshot file"""
+    return ipc.open_file(pa.memory_map(path, 'r')).read_all()
+
+def snapshot_row_count(path: str) -> int:
+    """Number of rows, read from the record batch metadata only"""
+    reader = ipc.open_file(pa.memory_map(path, 'r'))
+    return sum(reader.get_batch(i).num_rows for i in range(reader.num_record_batches))
+
+def iter_snapshot_rows(path: str, batch_size: int, columns: List[str] = None) -> Iterator[List[Dict]]:
+    """Yield the snapshot as lists of row dicts, batch_size rows at a time"""
+    table = read_snapshot(path)
+    if columns:
+        table = table.select(columns)
+    for offset in range(0, table.num_rows, batch_size):
+        yield table.slice(offset, batch_size).to_pylist()
+
+class SnapshotUpdater:
+    """Open a snapshot file read-write and update its fixed-width columns in place
+
+    Values are written straight into the memory-mapped column buffers, so the
+    file is never re-serialized. Only float/int/bool columns without nulls can
+    be updated; strings keep their written values.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, 'r+b')
+        self._mmap = mmap.mmap(self._file.fileno(), 0)
+        base = pa.py_buffer(self._mmap)
+        reader = ipc.open_file(pa.BufferReader(base))
+        if reader.num_record_batches != 1:
+            raise ValueError(f"{path}: expected a single record batch, got {reader.num_record_batches}")
+        self.batch = reader.get_batch(0)
+        self._base_address = base.address
+        self._views: Dict[str, np.ndarray] = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __len__(self) -> int:
+        return self.batch.num_rows
+
+    def column(self, name: str) -> pa.Array:
+        return self.batch.column(name)
+
+    def _view(self, name: str) -> np.ndarray:
+        if name in self._views:
+            return self._views[name]
+
+        array = self.batch.column(name)
+        if array.null_count or array.offset:
+            raise ValueError(f"Column {name} cannot be updated in place")
+        data = array.buffers()[1]
+        offset = data.address - self._base_address
+        if pa.types.is_boolean(array.type):
+            # boolはビットマップ（LSB順）なのでバイト列として扱う
+            view = np.ndarray(data.size, dtype=np.uint8, buffer=self._mmap, offset=offset)
+        elif pa.types.is_floating(array.type) or pa.types.is_integer(array.type):
+            view = np.ndarray(len(array), dtype=array.type.to_pandas_dtype(), buffer=self._mmap, offset=offset)
+        else:
+            raise ValueError(f"Column {name} ({array.type}) is not fixed-width")
+        self._views[name] = view
+        return view
+
+    def update(self, index: int, **values):
+        """Overwrite fixed-width columns of one row, e.g. update(3, balance_drops=1500000, exists=True)"""
+        for name, value in values.items():
+            view = self._view(name)
+            if pa.types.is_boolean(self.batch.schema.field(name).type):
+                mask = 1 << (index & 7)
+                if value:
+                    view[index >> 3] |= mask
+                else:
+                    view[index >> 3] &= ~mask & 0xff
+            else:
+                view[index] = value
+
+    def close(self):
+        if self._mmap is None:
+            return
+        self._mmap.flush()
+        # mmapを閉じる前にバッファへの参照をすべて手放す
+        self._views.clear()
+        self.batch = None
+        try:
+            self._mmap.close()
+        except BufferError:
+            pass  # 呼び出し元がまだ列を参照している場合はGCに任せる
+        self._file.close()
+        self._mmap = None
+
+def export_csv(snapshot_path: str, csv_path: str) -> int:
+    """Write a snapshot out as CSV (same columns and order as the snapshot)"""
+    table = read_snapshot(snapshot_path)
+    with open(csv_path, 'w', newline='', encoding='utf-8') as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(table.column_names)
+        for batch in table.to_batches(max_chunksize=10000):
+            columns = [
+                # AccountIDは16進文字列で書き出す
+                [value.hex() for value in column.to_pylist()] if pa.types.is_fixed_size_binary(column.type)
+                else column.to_pylist()
+                for column in batch.columns
+            ]
+            writer.writerows(zip(*columns))
+    return table.num_rows
+
+def main():
+    if len(sys.argv) < 2:
+        print("Usage: python snapshot_file.py <snapshot.arrow> [output.csv]")
+        sys.exit(1)
+    snapshot_path = sys.argv[1]
+    csv_path = sys.argv[2] if len(sys.argv) > 2 else os.path.splitext(snapshot_path)[0] + ".csv"
+    count = export_csv(snapshot_path, csv_path)
+    print(f"Exported {count} entries to {csv_path}")
+
+if __name__ == "__main__":
+    main()
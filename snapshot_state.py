@@ -0,0 +1,183 @@
+import json
+import os
+import time
+from dataclasses import dataclass, asdict, field
+from typing import Dict, List, Optional
+
+from snapshot_file import read_snapshot, snapshot_digest
+
+# 前回アップロードしたスナップショットの内容ハッシュ（ワークフローのキャッシュで引き継ぐ）
+STATE_PATH = os.path.join(".xrpscan_cache", "last_upload.json")
+
+# この時間を超えて持ち越しが続いたら、内容が同じでも全件アップロードする
+MAX_CARRY_FORWARD = 6 * 3600
+
+# アップロード中のスナップショットの進み具合（同じスナップショットをやり直すときに続きから送る）
+PROGRESS_PATH = os.path.join(".xrpscan_cache", "upload_progress.json")
+
+@dataclass
+class UploadState:
+    content_hash: str
+    label_hashes: Dict[str, str] = field(default_factory=dict)
+    rows: int = 0
+    snapshot_date: str = ""     # 最後にサマリーへ反映したスナップショットの日時
+    uploaded_at: float = 0.0    # 最後に全件アップロードした時刻
+
+def load_state(path: str = STATE_PATH) -> Optional[UploadState]:
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            saved = json.load(f)
+        return UploadState(**{k: v for k, v in saved.items() if k in UploadState.__dataclass_fields__})
+    except (OSError, ValueError, TypeError):
+        return None
+
+def save_state(state: UploadState, path: str = STATE_PATH):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    temp_path = f"{path}.temp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(asdict(state), f, indent=2, ensure_ascii=False)
+    os.replace(temp_path, path)
+
+def snapshot_date_of(snapshot_path: str) -> str:
+    dates = read_snapshot(snapshot_path).column('snapshot_date')
+    return dates[0].as_py() if len(dates) else ""
+
+class SnapshotChangeDetector:
+    """Decide whether a freshly loaded snapshot differs from the last uploaded one
+
+    The content hash is written into the snapshot when it is loaded (before
+    validation), so equal hashes mean XRPScan served the same list again.
+    In that case the run can carry the previous upload forward instead of
+    validating and inserting every row. After MAX_CARRY_FORWARD seconds
+    without a full upload, the snapshot counts as changed anyway, so the
+    stored rows and change windows do not go stale.
+    """
+
+    def __init__(self, state_path: str = STATE_PATH, max_carry_forward: int = MAX_CARRY_FORWARD):
+        self.state_path = state_path
+        self.max_carry_forward = max_carry_forward
+        self.previous = load_state(state_path)
+
+    def is_unchanged(self, snapshot_path: str) -> bool:
+        content_hash, _ = snapshot_digest(snapshot_path)
+        if self.previous is None or content_hash is None:
+            return False
+        if time.time() - self.previous.uploaded_at > self.max_carry_forward:
+            print("Last full upload is too old, uploading even if unchanged")
+            return False
+        return content_hash == self.previous.content_hash
+
+    def changed_labels(self, snapshot_path: str) -> List[str]:
+        """grouped_labels whose rows differ from the last upload (new and removed labels included)"""
+        _, label_hashes = snapshot_digest(snapshot_path)
+        previous = self.previous.label_hashes if self.previous else {}
+        return sorted(label for label in previous.keys() | label_hashes.keys()
+                      if previous.get(label) != label_hashes.get(label))
+
+    def record_upload(self, snapshot_path: str, rows: int):
+        content_hash, label_hashes = snapshot_digest(snapshot_path)
+        if content_hash is None:
+            return
+        self.previous = UploadState(
+            content_hash=content_hash,
+            label_hashes=label_hashes,
+            rows=rows,
+            snapshot_date=snapshot_date_of(snapshot_path),
+            uploaded_at=time.time()
+        )
+        save_state(self.previous, self.state_path)
+
+    def record_carry_forward(self, snapshot_path: str):
+        self.previous.snapshot_date = snapshot_date_of(snapshot_path)
+        save_state(self.previous, self.state_path)
+
+def upload_run_id(snapshot_path: str) -> str:
+    """Id of one snapshot's upload: its snapshot_date and content hash (stable across validation)"""
+    content_hash, _ = snapshot_digest(snapshot_path)
+    return f"{snapshot_date_of(snapshot_path)}/{(content_hash or 'unhashed')[:16]}"
+
+@dataclass
+class UploadProgress:
+    run_id: str
+    snapshot_date: str
+    total_rows: int
+    high_water: int = 0         # この順位まではすべてDBにある
+    completed: bool = False     # DB側で全行がそろったことを確認済み
+
+class UploadProgressTracker:
+    """Persisted high-water mark of a snapshot upload, keyed by run id
+
+    Batches finish out of order, so ranks confirmed above the high-water
+    mark are held until the gap below them closes. Only the contiguous
+    prefix is saved: a retry of the same snapshot (uploader.py retries in
+    process while the snapshot file is still on disk) skips ranks up to it
+    and resends the rest, which the upsert makes harmless. Progress of any
+    other run id is discarded; a later job scrapes a new snapshot, and the
+    rows an abandoned run left behind are removed by
+    cleanup_rich_list_uploads() in function.sql.
+    """
+
+    def __init__(self, snapshot_path: str, path: str = PROGRESS_PATH, save_interval: float = 2.0):
+        self.path = path
+        self.save_interval = save_interval
+        run_id = upload_run_id(snapshot_path)
+        saved = self.load()
+        if saved is not None and saved.run_id == run_id:
+            self.progress = saved
+        else:
+            self.progress = UploadProgress(run_id=run_id, snapshot_date=snapshot_date_of(snapshot_path),
+                                           total_rows=len(read_snapshot(snapshot_path)))
+        self.confirmed = set()   # high_waterより上で送信済みの順位
+        self._saved_at = 0.0
+
+    @property
+    def run_id(self) -> str:
+        return self.progress.run_id
+
+    @property
+    def high_water(self) -> int:
+        return self.progress.high_water
+
+    def load(self) -> Optional[UploadProgress]:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+            return UploadProgress(**{k: v for k, v in saved.items() if k in UploadProgress.__dataclass_fields__})
+        except (OSError, ValueError, TypeError):
+            return None
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        temp_path = f"{self.path}.temp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(asdict(self.progress), f, indent=2)
+        os.replace(temp_path, self.path)
+        self._saved_at = time.monotonic()
+
+    def mark_rows(self, rows: List[Dict]):
+        """Record uploaded rows (by rank) and advance the high-water mark"""
+        high_water = self.progress.high_water
+        self.confirmed.update(row['rank'] for row in rows if row['rank'] > high_water)
+        while high_water + 1 in self.confirmed:
+            high_water += 1
+            self.confirmed.remove(high_water)
+        self.progress.high_water = high_water
+        # 毎バッチ書き込むと1M行では数千回になるので間隔を空ける
+        if time.monotonic() - self._saved_at >= self.save_interval:
+            self.save()
+
+    def mark_all(self):
+        self.progress.high_water = self.progress.total_rows
+        self.confirmed.clear()
+        self.save()
+
+    def complete(self):
+        self.progress.completed = True
+        self.save()
+
+    def reset(self):
+        """Forget the high-water mark (rows turned out to be missing), so the next run resends everything"""
+        self.progress.high_water = 0
+        self.progress.completed = False
+        self.confirmed.clear()
+        self.save()
@@ -1,10 +1,12 @@
+-- 適用順: table.sql → function.sql（group_label()を使うトリガーと既存行への付与はfunction.sql側にある）
+
 CREATE TABLE xrpl_rich_list (
     id BIGSERIAL PRIMARY KEY,
     rank INTEGER NOT NULL,
     address VARCHAR(35) NOT NULL,  -- XRPLアドレスは34文字
     label TEXT,                    -- アカウントのラベル（Unknown可）
-    balance_xrp DECIMAL(20, 6),    -- XRPの残高
-    escrow_xrp DECIMAL(20, 6),     -- エスクローのXRP残高
+    balance_xrp DECIMAL(20, 6),    -- XRPの残高（表示用、集計はbalance_dropsを使う）
+    escrow_xrp DECIMAL(20, 6),     -- エスクローのXRP残高（表示用）
     percentage DECIMAL(6, 3),      -- 全体に対する保有割合（%）
     exists BOOLEAN NOT NULL,       -- アカウントの存在状態
     snapshot_date TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
@@ -16,6 +18,20 @@ CREATE TABLE xrpl_rich_list (
 -- domainカラムを追加
 ALTER TABLE xrpl_rich_list ADD COLUMN domain TEXT;
 
+-- grouped_labelカラムを追加（label_groups.jsonのルールで取り込み時に計算）
+ALTER TABLE xrpl_rich_list ADD COLUMN grouped_label VARCHAR(255);
+
+-- 残高をdrops（整数）で保持するカラムを追加（集計は整数演算で行う）
+ALTER TABLE xrpl_rich_list ADD COLUMN balance_drops BIGINT;
+ALTER TABLE xrpl_rich_list ADD COLUMN escrow_drops BIGINT;
+UPDATE xrpl_rich_list
+SET balance_drops = ROUND(balance_xrp * 1000000)::BIGINT,
+    escrow_drops = ROUND(COALESCE(escrow_xrp, 0) * 1000000)::BIGINT
+WHERE balance_drops IS NULL;
+
+-- 10万件以上の深さでは割合が0.001%未満になり DECIMAL(6, 3) では0に丸まるため倍精度にする
+ALTER TABLE xrpl_rich_list ALTER COLUMN percentage TYPE DOUBLE PRECISION;
+
 -- 効率的な検索のためのインデックス
 CREATE INDEX idx_xrpl_rich_list_snapshot_date ON xrpl_rich_list(snapshot_date);
 CREATE INDEX idx_xrpl_rich_list_address ON xrpl_rich_list(address);
@@ -23,6 +39,89 @@ CREATE INDEX idx_xrpl_rich_list_rank ON xrpl_rich_list(rank);
 CREATE INDEX idx_xrpl_rich_list_exists ON xrpl_rich_list(exists);
 CREATE INDEX idx_xrpl_rich_list_domain ON xrpl_rich_list(domain);
 
+-- クラシックアドレス（base58）と20バイトのAccountIDの相互変換
+CREATE OR REPLACE FUNCTION xrpl_address(account_id bytea)
+RETURNS text
+LANGUAGE plpgsql
+IMMUTABLE STRICT PARALLEL SAFE
+AS $$
+DECLARE
+    alphabet CONSTANT text := 'rpshnaf39wBUDNEGHJKLM4PQRST7VWXYZ2bcdeCg65jkm8oFqi1tuvAxyz';
+    payload bytea := '\x00'::bytea || account_id;
+    data bytea := payload || substring(sha256(sha256(payload)) from 1 for 4);
+    n numeric := 0;
+    result text := '';
+BEGIN
+    FOR i IN 0 .. length(data) - 1 LOOP
+        n := n * 256 + get_byte(data, i);
+    END LOOP;
+    WHILE n > 0 LOOP
+        result := substr(alphabet, mod(n, 58)::int + 1, 1) || result;
+        n := div(n, 58);
+    END LOOP;
+    -- 先頭の0x00バイト（種別）は 'r' になる
+    FOR i IN 0 .. length(data) - 1 LOOP
+        EXIT WHEN get_byte(data, i) <> 0;
+        result := 'r' || result;
+    END LOOP;
+    RETURN result;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION xrpl_account_id(address text)
+RETURNS bytea
+LANGUAGE plpgsql
+IMMUTABLE STRICT PARALLEL SAFE
+AS $$
+DECLARE
+    alphabet CONSTANT text := 'rpshnaf39wBUDNEGHJKLM4PQRST7VWXYZ2bcdeCg65jkm8oFqi1tuvAxyz';
+    n numeric := 0;
+    digit integer;
+    data bytea := '\x'::bytea;
+BEGIN
+    FOR i IN 1 .. length(address) LOOP
+        digit := strpos(alphabet, substr(address, i, 1)) - 1;
+        IF digit < 0 THEN
+            RAISE EXCEPTION 'Invalid XRPL address: %', address;
+        END IF;
+        n := n * 58 + digit;
+    END LOOP;
+    -- 種別1バイト + AccountID 20バイト + チェックサム4バイト
+    FOR i IN 1 .. 25 LOOP
+        data := set_byte('\x00'::bytea, 0, mod(n, 256)::int) || data;
+        n := div(n, 256);
+    END LOOP;
+    IF n > 0 OR get_byte(data, 0) <> 0
+       OR substring(sha256(sha256(substring(data from 1 for 21))) from 1 for 4) <> substring(data from 22 for 4) THEN
+        RAISE EXCEPTION 'Invalid XRPL address: %', address;
+    END IF;
+    RETURN substring(data from 2 for 20);
+END;
+$$;
+
+-- アドレスを20バイトのAccountID（bytea）で保持する（一意制約とインデックスのキーが約半分になる）
+ALTER TABLE xrpl_rich_list ADD COLUMN account_id BYTEA;
+UPDATE xrpl_rich_list SET account_id = xrpl_account_id(address) WHERE account_id IS NULL;
+ALTER TABLE xrpl_rich_list
+    ALTER COLUMN account_id SET NOT NULL,
+    ADD CONSTRAINT xrpl_rich_list_account_id_length CHECK (octet_length(account_id) = 20),
+    ADD CONSTRAINT xrpl_rich_list_unique_account_snapshot UNIQUE (account_id, snapshot_date),
+    DROP CONSTRAINT xrpl_rich_list_unique_snapshot;
+CREATE INDEX idx_xrpl_rich_list_account_id ON xrpl_rich_list(account_id);
+
+-- addressは移行期間のあいだ非推奨のカラムとして残す（インデックスも残す）
+-- 外部の読み取りがaccount_idかxrpl_rich_list_with_addressに移ったら、インデックスごと削除する
+-- ローダーは引き続き書き込み、書かれなかった行はfunction.sqlのトリガーがaccount_idから埋める
+ALTER TABLE xrpl_rich_list ALTER COLUMN address DROP NOT NULL;
+
+-- クラシックアドレスが必要な読み取り用のビュー（addressカラムの削除後も同じ形で読める）
+CREATE VIEW xrpl_rich_list_with_address AS
+SELECT
+    r.id, r.rank, r.account_id, r.label, r.grouped_label, r.balance_xrp, r.escrow_xrp,
+    r.balance_drops, r.escrow_drops, r.percentage, r.exists, r.domain, r.snapshot_date,
+    COALESCE(r.address, xrpl_address(r.account_id)) AS address
+FROM xrpl_rich_list r;
+
 
 CREATE TABLE xrpl_rich_list_summary (
     id SERIAL PRIMARY KEY,
@@ -509,3 +608,108 @@ SELECT
     *
 FROM country_data
 ORDER BY total_xrp DESC;
+
+-- xrp-ledger.tomlでドメインとアカウントを相互に確認できたか
+ALTER TABLE xrpl_rich_list ADD COLUMN domain_verified BOOLEAN NOT NULL DEFAULT false;
+
+-- ビューの列は作成時に決まるので、列を追加したらビューを作り直す
+DROP VIEW xrpl_rich_list_with_address;
+CREATE VIEW xrpl_rich_list_with_address AS
+SELECT
+    r.id, r.rank, r.account_id, r.label, r.grouped_label, r.balance_xrp, r.escrow_xrp,
+    r.balance_drops, r.escrow_drops, r.percentage, r.exists, r.domain, r.snapshot_date, r.domain_verified,
+    COALESCE(r.address, xrpl_address(r.account_id)) AS address
+FROM xrpl_rich_list r;
+
+-- スナップショットごとのアップロード（全行がそろったものだけをサマリーに使う）
+CREATE TABLE xrpl_rich_list_uploads (
+    run_id TEXT PRIMARY KEY,                      -- snapshot_date/内容ハッシュ
+    snapshot_date TIMESTAMP WITH TIME ZONE NOT NULL,
+    expected_rows INTEGER NOT NULL,
+    uploaded_rows INTEGER,
+    started_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    completed_at TIMESTAMP WITH TIME ZONE         -- 全行がそろったことを確認した時刻
+);
+CREATE INDEX idx_xrpl_rich_list_uploads_completed ON xrpl_rich_list_uploads(snapshot_date) WHERE completed_at IS NOT NULL;
+
+-- サマリーにあるスナップショット時刻の一覧（変化量の基準時刻をサマリー全体を走査せずに引くため）
+CREATE TABLE xrpl_rich_list_snapshot_times (
+    created_at TIMESTAMP WITH TIME ZONE PRIMARY KEY
+);
+
+-- サマリーへの追加・削除に合わせて一覧を保つ（文単位なので1スナップショットにつき1回だけ動く）
+CREATE OR REPLACE FUNCTION add_snapshot_times()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO xrpl_rich_list_snapshot_times (created_at)
+    SELECT DISTINCT created_at FROM new_rows WHERE created_at IS NOT NULL
+    ON CONFLICT (created_at) DO NOTHING;
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+CREATE OR REPLACE FUNCTION remove_snapshot_times()
+RETURNS TRIGGER AS $$
+BEGIN
+    DELETE FROM xrpl_rich_list_snapshot_times t
+    WHERE t.created_at IN (SELECT DISTINCT created_at FROM old_rows)
+    AND NOT EXISTS (SELECT 1 FROM xrpl_rich_list_summary s WHERE s.created_at = t.created_at);
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+CREATE TRIGGER summary_add_snapshot_times
+    AFTER INSERT ON xrpl_rich_list_summary
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION add_snapshot_times();
+
+CREATE TRIGGER summary_remove_snapshot_times
+    AFTER DELETE ON xrpl_rich_list_summary
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION remove_snapshot_times();
+
+INSERT INTO xrpl_rich_list_snapshot_times (created_at)
+SELECT DISTINCT created_at FROM xrpl_rich_list_summary WHERE created_at IS NOT NULL;
+
+-- 基準時刻の行はcreated_atで絞ってからgrouped_labelで引く（created_atだけのインデックスはこれで足りる）
+CREATE INDEX idx_summary_created_at_label ON xrpl_rich_list_summary(created_at, grouped_label);
+DROP INDEX idx_summary_created_at;
+
+-- サマリーにカテゴリと国を持たせ、集計のたびにxrpl_rich_list_categoriesと結合しないようにする
+ALTER TABLE xrpl_rich_list_summary
+    ADD COLUMN category VARCHAR(50),
+    ADD COLUMN country VARCHAR(50);
+
+UPDATE xrpl_rich_list_summary s
+SET category = c.category, country = c.country
+FROM xrpl_rich_list_categories c
+WHERE s.grouped_label = c.grouped_label;
+
+-- カテゴリの登録・変更・削除を過去のサマリーにも反映する（これまで結合で得ていた結果と同じになる）
+CREATE OR REPLACE FUNCTION sync_summary_categories()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'DELETE' OR (TG_OP = 'UPDATE' AND OLD.grouped_label IS DISTINCT FROM NEW.grouped_label) THEN
+        UPDATE xrpl_rich_list_summary
+        SET category = NULL, country = NULL
+        WHERE grouped_label = OLD.grouped_label;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        UPDATE xrpl_rich_list_summary
+        SET category = NEW.category, country = NEW.country
+        WHERE grouped_label = NEW.grouped_label;
+    END IF;
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+CREATE TRIGGER categories_sync_summary
+    AFTER INSERT OR UPDATE OF grouped_label, category, country OR DELETE ON xrpl_rich_list_categories
+    FOR EACH ROW
+    EXECUTE FUNCTION sync_summary_categories();
+
+-- 変化量・時系列統計の集計キー（時刻で絞ってカテゴリ・国ごとに集計する）
+CREATE INDEX idx_summary_created_at_category ON xrpl_rich_list_summary(created_at, category) WHERE category IS NOT NULL;
+CREATE INDEX idx_summary_created_at_country ON xrpl_rich_list_summary(created_at, country) WHERE country IS NOT NULL;
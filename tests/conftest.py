@@ -0,0 +1,81 @@
+import hashlib
+import os
+import uuid
+
+import pytest
+
+from account_id import encode_account_id
+from snapshot_file import write_snapshot
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def snapshot_columns(balances, labels=None, snapshot_date="2024-05-01T00:00:00+00:00"):
+    """Columns of a small snapshot in SNAPSHOT_SCHEMA, ranked in the given order"""
+    count = len(balances)
+    labels = labels or ["Unknown"] * count
+    account_ids = [hashlib.blake2b(i.to_bytes(8, 'big'), digest_size=20).digest() for i in range(count)]
+    total = sum(balances) or 1
+    return {
+        'rank': list(range(1, count + 1)),
+        'address': [encode_account_id(account_id) for account_id in account_ids],
+        'account_id': account_ids,
+        'label': labels,
+        'grouped_label': labels,
+        'balance_drops': list(balances),
+        'escrow_drops': [0] * count,
+        'percentage': [balance / total * 100 for balance in balances],
+        'domain': [''] * count,
+        'twitter': [''] * count,
+        'verified': [False] * count,
+        'domain_verified': [False] * count,
+        'snapshot_date': [snapshot_date] * count,
+        'exists': [True] * count
+    }
+
+@pytest.fixture
+def make_snapshot(tmp_path):
+    """Write a snapshot file under tmp_path and return its path"""
+    def make(balances, labels=None, snapshot_date="2024-05-01T00:00:00+00:00", name="snapshot.arrow"):
+        path = str(tmp_path / name)
+        write_snapshot(path, snapshot_columns(balances, labels, snapshot_date))
+        return path
+    return make
+
+@pytest.fixture(scope="session")
+def postgres_dsn(tmp_path_factory):
+    """DSN of a throwaway Postgres: TEST_DATABASE_URL if set, else a temporary pgserver instance
+
+    Tests that need it are skipped when neither is available.
+    """
+    dsn = os.environ.get("TEST_DATABASE_URL")
+    if dsn:
+        yield dsn
+        return
+    pgserver = pytest.importorskip("pgserver")
+    try:
+        server = pgserver.get_server(str(tmp_path_factory.mktemp("pgdata")), cleanup_mode="delete")
+    except Exception as e:
+        pytest.skip(f"Could not start a temporary Postgres: {e}")
+    yield server.get_uri()
+    server.cleanup()
+
+@pytest.fixture
+def pg(postgres_dsn):
+    """Autocommit connection whose search_path is a fresh schema, dropped afterwards"""
+    psycopg = pytest.importorskip("psycopg")
+    schema = f"test_{uuid.uuid4().hex[:12]}"
+    with psycopg.connect(postgres_dsn, autocommit=True) as connection:
+        connection.execute(f"CREATE SCHEMA {schema}")
+        connection.execute(f"SET search_path = {schema}")
+        try:
+            yield connection
+        finally:
+            connection.execute(f"DROP SCHEMA {schema} CASCADE")
+
+@pytest.fixture
+def rich_list_db(pg):
+    """pg with table.sql and then function.sql applied, the order a fresh database needs"""
+    for name in ("table.sql", "function.sql"):
+        with open(os.path.join(ROOT, name), 'r', encoding='utf-8') as f:
+            pg.execute(f.read())
+    return pg
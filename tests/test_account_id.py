@@ -0,0 +1,64 @@
+import hashlib
+
+import numpy as np
+import pytest
+
+from account_id import (account_id_array, account_id_bytes, account_id_hex, decode_account_id,
+                        encode_account_id)
+
+# XRPLの既知のアドレスとAccountID
+KNOWN = [
+    ("rHb9CJAWyB4rj91VRWn96DkukG4bwdtyTh", bytes.fromhex("B5F762798A53D543A014CAF8B297CFF8F2F937E8")),
+    ("rrrrrrrrrrrrrrrrrrrrrhoLvTp", bytes(20)),
+    ("rrrrrrrrrrrrrrrrrrrrBZbvji", bytes(19) + b'\x01'),
+]
+
+def random_ids(count: int):
+    ids = [hashlib.blake2b(n.to_bytes(4, 'big'), digest_size=20).digest() for n in range(count)]
+    # 先頭が0バイトのAccountIDは先頭に 'r' が増え、アドレスが短くなる
+    ids += [bytes(zeros) + account_id[zeros:] for zeros, account_id in enumerate(ids[:8], start=1)]
+    return ids
+
+@pytest.mark.parametrize("address, account_id", KNOWN)
+def test_known_vectors(address, account_id):
+    assert decode_account_id(address) == account_id
+    assert encode_account_id(account_id) == address
+    assert account_id_bytes(account_id_array([address])[0]) == account_id
+
+def test_numpy_decoder_agrees_with_scalar_decoder_across_lengths():
+    addresses = [encode_account_id(account_id) for account_id in random_ids(200)]
+    assert len({len(address) for address in addresses}) > 2
+    decoded = account_id_array(addresses)
+    assert decoded.dtype == np.dtype('S20')
+    assert [account_id_bytes(value) for value in decoded] == [decode_account_id(address) for address in addresses]
+
+def test_account_id_bytes_restores_trailing_zero_bytes():
+    account_id = b'\x07' + bytes(19)
+    value = account_id_array([encode_account_id(account_id)])[0]
+    # numpyのS20は末尾のNULを落とす
+    assert len(bytes(value)) == 1
+    assert account_id_bytes(value) == account_id
+    assert account_id_hex(value) == '\\x07' + '00' * 19
+
+def test_empty_array():
+    assert account_id_array([]).shape == (0,)
+
+VALID = "rHb9CJAWyB4rj91VRWn96DkukG4bwdtyTh"
+
+@pytest.mark.parametrize("address, message", [
+    (VALID[:-1] + ("h" if VALID[-1] != "h" else "i"), "checksum"),   # チェックサム不一致
+    (VALID[:10] + "0" + VALID[11:], "Invalid character"),            # 0はbase58にない
+    (VALID[:10] + "l" + VALID[11:], "Invalid character"),            # lもない
+    ("r" + "rrrrrrrrrrrrrrrrrrrrBZbvji", "classic"),                  # 先頭の 'r' が多い（正規形でない）
+    (VALID[:-3], "classic"),                                          # 短すぎる
+    ("", "classic"),
+])
+def test_invalid_addresses_are_rejected_by_both_decoders(address, message):
+    with pytest.raises(ValueError, match=message):
+        decode_account_id(address)
+    with pytest.raises(ValueError, match="Invalid XRPL address"):
+        account_id_array([VALID, address])
+
+def test_encode_rejects_wrong_length():
+    with pytest.raises(ValueError, match="20 bytes"):
+        encode_account_id(bytes(19))
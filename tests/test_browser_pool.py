@@ -0,0 +1,103 @@
+import os
+import socket
+import stat
+import sys
+
+import pytest
+
+from browser_pool import BrowserPool
+
+# Chromeの代わりに、--remote-debugging-portで/json/versionだけを返すプロセスを起動する
+STAND_IN_CHROME = """#!{python}
+import http.server
+import sys
+
+port = int(next(arg.split('=', 1)[1] for arg in sys.argv if arg.startswith('--remote-debugging-port=')))
+
+class DevTools(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != '/json/version':
+            self.send_error(404)
+            return
+        body = b'{{"Browser": "HeadlessChrome/stand-in"}}'
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+http.server.HTTPServer(('127.0.0.1', port), DevTools).serve_forever()
+"""
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def executable(path, source: str) -> str:
+    path.write_text(source, encoding='utf-8')
+    path.chmod(path.stat().st_mode | stat.S_IXUSR)
+    return str(path)
+
+@pytest.fixture
+def make_pool(tmp_path):
+    pools = []
+    binary = executable(tmp_path / "chrome", STAND_IN_CHROME.format(python=sys.executable))
+    def make(**kwargs):
+        kwargs.setdefault('chrome_binary', binary)
+        pool = BrowserPool(port=free_port(), startup_timeout=10, **kwargs)
+        pools.append(pool)
+        return pool
+    yield make
+    for pool in pools:
+        pool.stop()
+
+def scrape(pool: BrowserPool) -> int:
+    """One session; returns the pid of the browser it was given"""
+    with pool.session() as address:
+        assert address == pool.debugger_address
+        assert pool.endpoint_alive()
+        return pool.process.pid
+
+def test_warm_browser_is_reused(make_pool):
+    pool = make_pool()
+    first = scrape(pool)
+    profile_dir = pool.profile_dir
+    assert scrape(pool) == first
+    assert pool.uses == 2
+    assert os.path.isdir(profile_dir)
+
+def test_browser_restarts_after_max_uses(make_pool):
+    pool = make_pool(max_uses=2)
+    first = scrape(pool)
+    assert scrape(pool) == first
+    old_profile = pool.profile_dir
+    assert scrape(pool) != first
+    assert pool.uses == 1
+    # 再起動のたびにプロファイルは作り直す
+    assert not os.path.exists(old_profile)
+
+def test_crashed_browser_is_restarted(make_pool):
+    pool = make_pool()
+    first = scrape(pool)
+    pool.process.kill()
+    pool.process.wait()
+    assert pool.restart_reason() == "unresponsive"
+    assert scrape(pool) != first
+
+@pytest.mark.skipif(not os.path.isdir("/proc"), reason="memory is read from /proc")
+def test_browser_restarts_over_the_memory_limit(make_pool):
+    pool = make_pool(max_memory_mb=1)
+    first = scrape(pool)
+    assert pool.memory_mb() > 1
+    assert pool.restart_reason().startswith("using ")
+    assert scrape(pool) != first
+
+def test_browser_that_never_answers_fails_to_start(make_pool, tmp_path):
+    pool = make_pool(chrome_binary=executable(tmp_path / "broken", f"#!{sys.executable}\nimport sys\nsys.exit(1)\n"))
+    with pytest.raises(Exception, match="did not start"):
+        scrape(pool)
+    assert pool.process is None and pool.profile_dir is None
@@ -0,0 +1,69 @@
+from decimal import Decimal
+
+import pytest
+
+pytest.importorskip("psycopg")
+from psycopg.conninfo import make_conninfo
+
+from copy_loader import CopyLoader
+from snapshot_file import write_snapshot
+from tests.conftest import snapshot_columns
+
+SNAPSHOT_DATE = "2024-05-01T00:00:00+00:00"
+
+@pytest.fixture
+def loader(rich_list_db, postgres_dsn):
+    """CopyLoader on its own connection, pointed at rich_list_db's schema"""
+    schema = rich_list_db.execute("SELECT current_schema()").fetchone()[0]
+    return CopyLoader(make_conninfo(postgres_dsn, options=f"-c search_path={schema}"), max_retries=1)
+
+def write(tmp_path, balances, escrows=None, name="snapshot.arrow"):
+    columns = snapshot_columns(balances, ["Ripple"] * len(balances), SNAPSHOT_DATE)
+    if escrows is not None:
+        columns['escrow_drops'] = escrows
+    path = str(tmp_path / name)
+    write_snapshot(path, columns)
+    return path, columns
+
+def rows(db):
+    return db.execute(
+        "SELECT rank, account_id, address, label, grouped_label, balance_drops, escrow_drops, balance_xrp, escrow_xrp,"
+        " exists, domain_verified FROM xrpl_rich_list ORDER BY rank").fetchall()
+
+def test_copy_round_trip_keeps_drops_exact(loader, rich_list_db, tmp_path):
+    # 2^53を超えるdropsもfloatを通さずにそのまま入る
+    balances = [99_999_999_999_999_999, 9_007_199_254_740_993, 1]
+    path, columns = write(tmp_path, balances, escrows=[0, 1_000_001, 0])
+    assert loader.load_snapshot(path) == 3
+
+    assert rows(rich_list_db) == [
+        (1, columns['account_id'][0], columns['address'][0], "Ripple", "Ripple", balances[0], 0,
+         Decimal("99999999999.999999"), Decimal("0"), True, False),
+        (2, columns['account_id'][1], columns['address'][1], "Ripple", "Ripple", balances[1], 1_000_001,
+         Decimal("9007199254.740993"), Decimal("1.000001"), True, False),
+        (3, columns['account_id'][2], columns['address'][2], "Ripple", "Ripple", 1, 0,
+         Decimal("0.000001"), Decimal("0"), True, False),
+    ]
+    snapshot_dates = rich_list_db.execute("SELECT DISTINCT snapshot_date::text FROM xrpl_rich_list").fetchall()
+    assert snapshot_dates == [("2024-05-01 00:00:00+00",)]
+
+def test_reloading_a_snapshot_updates_rows_in_place(loader, rich_list_db, tmp_path):
+    path, _ = write(tmp_path, [5_000_000, 3_000_000])
+    loader.load_snapshot(path)
+    # 同じ日時・同じアカウントで内容が変わったもの（返事を受け取れずに再送した場合など）
+    path, _ = write(tmp_path, [7_000_000, 2_000_000], name="again.arrow")
+    assert loader.load_snapshot(path) == 2
+
+    balances = rich_list_db.execute("SELECT rank, balance_drops, balance_xrp FROM xrpl_rich_list ORDER BY rank").fetchall()
+    assert balances == [(1, 7_000_000, Decimal("7")), (2, 2_000_000, Decimal("2"))]
+
+def test_rows_lost_between_copy_and_insert_roll_back_the_load(loader, rich_list_db, tmp_path):
+    # 取り込み先で黙って捨てられる行があれば、件数が合わないので全体を取り消す
+    rich_list_db.execute("CREATE FUNCTION skip_second_rank() RETURNS trigger LANGUAGE plpgsql AS $$"
+                         " BEGIN IF NEW.rank = 2 THEN RETURN NULL; END IF; RETURN NEW; END; $$")
+    rich_list_db.execute("CREATE TRIGGER skip_second_rank BEFORE INSERT ON xrpl_rich_list"
+                         " FOR EACH ROW EXECUTE FUNCTION skip_second_rank()")
+    path, _ = write(tmp_path, [5_000_000, 3_000_000, 1_000_000])
+    with pytest.raises(Exception, match="Inserted 2 rows but copied 3"):
+        loader.load_snapshot(path)
+    assert rows(rich_list_db) == []
@@ -0,0 +1,154 @@
+import asyncio
+import hashlib
+
+import pytest
+from aiohttp import web
+
+from account_id import encode_account_id
+from domain_verifier import (
+    AccountDomainReader, DomainResult, DomainVerifier, apply_domain_verification, normalize_domain,
+    parse_toml_accounts, vouched_unknowns
+)
+from rich_list_snapshot import AccountColumnsBuilder
+
+def address(n: int) -> str:
+    return encode_account_id(hashlib.blake2b(n.to_bytes(8, 'big'), digest_size=20).digest())
+
+@pytest.mark.parametrize("stored, expected", [
+    ("https://Example.com/", "example.com"),
+    ("example.com:443/path", "example.com"),
+    ("sub.example.co.jp.", "sub.example.co.jp"),
+    ("localhost", None),
+    ("not a domain", None),
+    ("", None),
+    (None, None),
+])
+def test_normalize_domain(stored, expected):
+    assert normalize_domain(stored) == expected
+
+def test_parse_toml_accounts_reads_accounts_tables():
+    text = f'''
+[METADATA]
+modified = 2024-01-01T00:00:00Z
+
+[[ACCOUNTS]]
+address = "{address(1)}"
+desc = "Hot wallet"
+
+[[ACCOUNTS]]
+desc = "entry without address"
+
+[[ACCOUNTS]]
+address = "{address(2)}"
+
+[[VALIDATORS]]
+address = "{address(3)}"
+'''
+    assert parse_toml_accounts(text) == [address(1), address(2)]
+
+def test_parse_toml_accounts_falls_back_to_address_lines_when_malformed():
+    text = f'''
+[[ACCOUNTS]]
+address = "{address(1)}"
+desc = "unterminated
+[[ACCOUNTS]]
+address = '{address(2)}'
+'''
+    assert parse_toml_accounts(text) == [address(1), address(2)]
+
+def test_parse_toml_accounts_without_accounts():
+    assert parse_toml_accounts('[METADATA]\nmodified = 2024-01-01\n') == []
+
+def columns(rows):
+    builder = AccountColumnsBuilder()
+    for row in rows:
+        builder.append(**row)
+    return builder.build()
+
+def vouching_snapshot():
+    accounts = columns([
+        {'address': address(1), 'balance_drops': 3, 'name': "Exchange", 'desc': "Hot", 'domain': "exchange.com"},
+        {'address': address(2), 'balance_drops': 2, 'name': "Impostor", 'domain': "exchange.com"},
+        {'address': address(3), 'balance_drops': 1},
+        {'address': address(4), 'balance_drops': 1, 'name': "Other", 'domain': "down.example"},
+        {'address': address(5), 'balance_drops': 1},
+    ])
+    results = {
+        "exchange.com": DomainResult("exchange.com", ok=True,
+                                     accounts=[address(1), address(3), address(5), "rNotAnAddress"]),
+        "down.example": DomainResult("down.example", ok=False, accounts=[address(4)]),
+    }
+    return accounts, results
+
+def test_apply_domain_verification_marks_mutual_links_only():
+    accounts, results = vouching_snapshot()
+    assert vouched_unknowns(accounts, results) == {2: "exchange.com", 4: "exchange.com"}
+    verified = apply_domain_verification(accounts, results)
+    assert verified.tolist() == [True, False, False, False, False]
+    # tomlに載っているだけでは、アカウント側が名乗っていないのでUnknownのまま
+    assert accounts.name.tolist() == ["Exchange", "Impostor", "Unknown", "Other", "Unknown"]
+    assert accounts.domain[2] == ""
+
+def test_listed_unknowns_are_named_when_their_ledger_domain_names_the_domain_back():
+    accounts, results = vouching_snapshot()
+    ledger_domains = {address(3): "exchange.com", address(5): "elsewhere.example"}
+    verified = apply_domain_verification(accounts, results, ledger_domains)
+    assert verified.tolist() == [True, False, True, False, False]
+    assert accounts.name.tolist() == ["Exchange", "Impostor", "Exchange", "Other", "Unknown"]
+    assert (accounts.domain[2], accounts.desc[2]) == ("exchange.com", "")
+
+def test_account_domain_reader_decodes_the_domain_field():
+    pytest.importorskip("xrpl")
+
+    class Response:
+        def __init__(self, payload):
+            self.payload = payload
+
+        def to_dict(self):
+            return self.payload
+
+    class FakeClient:
+        async def request(self, request):
+            if request.account == address(3):
+                raise ConnectionError("node went away")
+            domain = {address(1): "https://Exchange.com/".encode().hex(), address(2): "zz"}.get(request.account)
+            account_data = {'Balance': "1"} if domain is None else {'Balance': "1", 'Domain': domain}
+            return Response({'status': 'success', 'result': {'account_data': account_data}})
+
+    domains = asyncio.run(AccountDomainReader(client=FakeClient()).read(
+        [address(1), address(2), address(3), address(4), address(1)]))
+    assert domains == {address(1): "exchange.com", address(2): None, address(3): None, address(4): None}
+
+def test_verifier_fetches_each_domain_once_and_caches(tmp_path):
+    requests = []
+
+    async def handler(request):
+        requests.append(request.match_info['domain'])
+        if request.match_info['domain'] == "broken.example":
+            return web.Response(status=404)
+        return web.Response(text=f'[[ACCOUNTS]]\naddress = "{address(1)}"\n')
+
+    async def main():
+        app = web.Application()
+        app.router.add_get('/{domain}/xrp-ledger.toml', handler)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        try:
+            template = f"http://127.0.0.1:{port}/{{domain}}/xrp-ledger.toml"
+            cache_path = str(tmp_path / "domains.json")
+            verifier = DomainVerifier(cache_path=cache_path, url_template=template)
+            first = await verifier.verify(["https://Good.example/", "good.example", "broken.example", "", None])
+            # 新しいインスタンスでもキャッシュファイルから読み、取得し直さない
+            second = await DomainVerifier(cache_path=cache_path, url_template=template).verify(["good.example"])
+            return first, second
+        finally:
+            await runner.cleanup()
+
+    first, second = asyncio.run(main())
+    assert sorted(requests) == ["broken.example", "good.example"]
+    assert first["good.example"].ok and first["good.example"].accounts == [address(1)]
+    assert not first["broken.example"].ok and "404" in first["broken.example"].error
+    assert second["good.example"].accounts == [address(1)]
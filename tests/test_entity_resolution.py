@@ -0,0 +1,112 @@
+import hashlib
+import json
+
+import numpy as np
+import pytest
+
+import entity_resolution
+from account_id import encode_account_id
+from entity_resolution import EntityResolver, UnionFind
+from rich_list_snapshot import AccountColumnsBuilder
+
+def account_id(n: int) -> bytes:
+    return hashlib.blake2b(n.to_bytes(8, 'big'), digest_size=20).digest()
+
+def snapshot(rows):
+    """(columns, grouped_labels) from rows of (n, grouped_label, metadata)"""
+    builder = AccountColumnsBuilder()
+    for n, group, metadata in rows:
+        builder.append(encode_account_id(account_id(n)), 1, name=group, **metadata)
+    return builder.build(), [group for _, group, _ in rows]
+
+@pytest.fixture
+def state_path(tmp_path):
+    return str(tmp_path / "entities.json")
+
+def test_union_find_merges_transitively_by_size():
+    sets = UnionFind()
+    sets.union("a", "b")
+    sets.union("c", "d")
+    sets.union("d", "e")
+    assert sets.find("a") != sets.find("c")
+    root = sets.union("b", "e")
+    assert {sets.find(node) for node in "abcde"} == {root}
+    # 大きい方（c, d, e）の根に付く
+    assert root == sets.find("c")
+    assert sets.size[root] == 5
+
+def test_unknown_account_verified_for_a_labelled_domain_joins_its_group(state_path):
+    columns, groups = snapshot([
+        (1, "Exchange", {'domain': "exchange.com"}),
+        (2, "Unknown", {'domain': "exchange.com"}),
+        (3, "Unknown", {}),
+    ])
+    resolved = EntityResolver(state_path).resolve(columns, groups, domain_verified=np.array([True, True, False]))
+    assert resolved == ["Exchange", "Exchange", "Unknown"]
+
+def test_one_sided_domain_links_do_not_merge(state_path):
+    # 2はexchange.comを名乗るがtomlに載っていない、3はtomlに載っているがexchange.comを名乗らない
+    columns, groups = snapshot([
+        (1, "Exchange", {'domain': "exchange.com"}),
+        (2, "Unknown", {'domain': "exchange.com"}),
+        (3, "Unknown", {'domain': "elsewhere.example"}),
+    ])
+    resolved = EntityResolver(state_path).resolve(columns, groups, domain_verified=np.array([True, False, False]))
+    assert resolved == ["Exchange", "Unknown", "Unknown"]
+    # 検証結果がなければドメインでは結び付けない
+    assert EntityResolver(str(state_path) + ".2").resolve(columns, groups) == ["Exchange", "Unknown", "Unknown"]
+
+def test_links_merge_transitively_across_domains_and_escrows(state_path):
+    # 3 -(escrow)- 4 -(example.net)- 2 -(exchange.com)- 1(Exchange)
+    columns, groups = snapshot([
+        (1, "Exchange", {'domain': "exchange.com"}),
+        (2, "Unknown", {'domain': "exchange.com", 'twitter': "@shared"}),
+        (3, "Unknown", {}),
+        (4, "Unknown", {'twitter': "shared"}),
+    ])
+    resolved = EntityResolver(state_path, link_escrows=True).resolve(
+        columns, groups, escrow_pairs=[(account_id(3), account_id(4))],
+        domain_verified=np.array([True, True, False, False]))
+    assert resolved == ["Exchange"] * 4
+
+def test_separate_entities_and_disabled_signals_do_not_merge(state_path):
+    columns, groups = snapshot([
+        (1, "Exchange", {'domain': "exchange.com"}),
+        (2, "Other", {'twitter': "@Other"}),
+        (3, "Unknown", {'twitter': "other"}),
+        (4, "Unknown", {}),
+        (5, "Unknown", {}),
+    ])
+    # エスクローは無効
+    resolved = EntityResolver(state_path, link_escrows=False).resolve(
+        columns, groups, escrow_pairs=[(account_id(1), account_id(4))],
+        domain_verified=np.array([True, False, False, False, False]))
+    assert resolved == ["Exchange", "Other", "Other", "Unknown", "Unknown"]
+
+def test_state_is_incremental_across_runs(state_path, capsys):
+    columns, groups = snapshot([(1, "Exchange", {'domain': "exchange.com"}), (2, "Unknown", {'domain': "exchange.com"})])
+    verified = np.array([True, True])
+    EntityResolver(state_path).resolve(columns, groups, domain_verified=verified)
+    assert "2 new links" in capsys.readouterr().out
+
+    resolved = EntityResolver(state_path).resolve(columns, groups, domain_verified=verified)
+    assert "0 new links" in capsys.readouterr().out
+    assert resolved == ["Exchange", "Exchange"]
+
+def test_stale_links_and_labels_are_evicted(state_path, monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(entity_resolution.time, "time", lambda: now[0])
+    columns, groups = snapshot([(1, "Exchange", {'domain': "exchange.com"}), (2, "Unknown", {'domain': "exchange.com"})])
+    EntityResolver(state_path, max_age=100).resolve(columns, groups, domain_verified=np.array([True, True]))
+
+    # まだ期限内なら、tomlが取れなかった回でも前回のクラスタで名前が付く
+    now[0] += 50
+    assert EntityResolver(state_path, max_age=100).resolve(columns, groups) == ["Exchange", "Exchange"]
+
+    # 2の相互リンクが期限を過ぎても確認できなければリンクを捨て、クラスタを作り直す
+    now[0] += 100
+    assert EntityResolver(state_path, max_age=100).resolve(
+        columns, groups, domain_verified=np.array([True, False])) == ["Exchange", "Unknown"]
+    with open(state_path, 'r', encoding='utf-8') as f:
+        saved = json.load(f)
+    assert list(saved['links']) == [f"account:{account_id(1).hex()}|domain:exchange.com"]
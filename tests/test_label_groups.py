@@ -0,0 +1,60 @@
+import os
+
+import pytest
+
+from label_groups import GroupingRule, LabelGrouper
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+LABELS = [
+    "Ripple", "Ripple (1)", "Coinbase 3", "bithomp", "Bithomp wallet", "~Someone (cold)", "Foo (bar) (baz)",
+    "MyGatehub", "gatehub cold", "Unknown", "", "~", "100% Cash", "under_score", "It's (quoted)",
+]
+
+def test_first_matching_rule_wins():
+    grouper = LabelGrouper([
+        GroupingRule('contains', 'hub', 'Hub'),
+        GroupingRule('prefix', 'Gate', 'Gate'),
+    ])
+    assert grouper("Gatehub") == "Hub"
+    assert grouper("Gate.io") == "Gate"
+    assert grouper("myhub") == "Hub"
+
+def test_prefix_rule_is_anchored_and_case_sensitive():
+    grouper = LabelGrouper([GroupingRule('prefix', 'Ripple', 'Ripple')])
+    assert grouper("Ripple Escrow") == "Ripple"
+    assert grouper("Not Ripple") == "Not Ripple"
+    assert grouper("ripple") == "ripple"
+
+def test_unmatched_labels_lose_tilde_and_trailing_parenthesis():
+    grouper = LabelGrouper([])
+    assert grouper("~Someone (cold)") == "Someone"
+    # 末尾の括弧1つだけを落とす
+    assert grouper("Foo (bar) (baz)") == "Foo (bar)"
+    assert grouper(None) is None
+
+def test_patterns_are_literal_in_python_and_sql():
+    rules = [GroupingRule('prefix', '100%', 'Percent'), GroupingRule('contains', 'a_b', 'Underscore')]
+    grouper = LabelGrouper(rules)
+    assert grouper("100% Cash") == "Percent"
+    assert grouper("1000 Cash") == "1000 Cash"
+    assert grouper("xa_by") == "Underscore"
+    assert grouper("xacby") == "xacby"
+    sql = grouper.to_sql()
+    assert "LIKE '100\\%%'" in sql
+    assert "LIKE '%a\\_b%'" in sql
+
+def test_function_sql_is_generated_from_the_rules():
+    with open(os.path.join(ROOT, "function.sql"), 'r', encoding='utf-8') as f:
+        function_sql = f.read().replace('\r\n', '\n')
+    assert LabelGrouper().to_sql() in function_sql
+
+@pytest.mark.parametrize("rules", [None, [GroupingRule('prefix', '100%', 'Percent'),
+                                          GroupingRule('contains', 'a_b', 'Underscore'),
+                                          GroupingRule('contains', "'s", 'Quote')]])
+def test_sql_group_label_matches_python(pg, rules):
+    grouper = LabelGrouper(rules)
+    pg.execute(grouper.to_sql())
+    labels = LABELS + [rule.pattern + " x" for rule in grouper.rules] + ["x " + rule.pattern for rule in grouper.rules]
+    for label in labels:
+        assert pg.execute("SELECT group_label(%s)", [label]).fetchone()[0] == grouper(label), label
@@ -0,0 +1,47 @@
+import asyncio
+import time
+
+import pytest
+
+pytest.importorskip("xrpl")
+
+from ledger_loader import LedgerRichListLoader
+
+class FakeResponse:
+    def __init__(self, result):
+        self.result = result
+
+    def is_successful(self):
+        return True
+
+class FakeClient:
+    """ledger_data with a fixed number of pages, recording when each request arrived"""
+
+    def __init__(self, pages: int):
+        self.pages = pages
+        self.times = []
+
+    async def request(self, request):
+        self.times.append(time.monotonic())
+        page = int(request.marker or 0)
+        result = {'ledger_index': 100, 'state': [{'page': page}]}
+        if page + 1 < self.pages:
+            result['marker'] = str(page + 1)
+        return FakeResponse(result)
+
+def test_requests_are_spaced_across_concurrent_walks():
+    loader = LedgerRichListLoader(requests_per_second=50)
+    loader.client = FakeClient(pages=4)
+
+    async def walk(entry_type):
+        return [page async for page in loader.iter_pages(100, entry_type)]
+
+    async def main():
+        # アカウントとエスクローの2つの走査で同じ間隔制限を共有する
+        return await asyncio.gather(walk("account"), walk("escrow"))
+
+    accounts, escrows = asyncio.run(main())
+    assert len(accounts) == len(escrows) == 4
+    gaps = [later - earlier for earlier, later in zip(loader.client.times, loader.client.times[1:])]
+    assert len(gaps) == 7
+    assert min(gaps) >= 0.02 * 0.9
@@ -0,0 +1,188 @@
+import asyncio
+import os
+import shutil
+
+import pytest
+
+from pipeline import RichListPipeline
+from snapshot_file import read_snapshot
+from snapshot_state import SnapshotChangeDetector, UploadProgressTracker
+from validator import ValidatedAccount
+
+SNAPSHOT_DATE = "2024-05-01T00:00:00+00:00"
+
+class FakeValidator:
+    """Reports every account as existing with 7 drops (1 in escrow)"""
+
+    def __init__(self):
+        self.checked = []
+        self.opened = False
+        self.closed = False
+
+    async def setup_client(self):
+        self.opened = True
+
+    async def cleanup_client(self):
+        self.closed = True
+
+    async def check_account(self, address: str) -> ValidatedAccount:
+        self.checked.append(address)
+        return ValidatedAccount(address, 7, 1, True)
+
+class FakeRestUploader:
+    def __init__(self, uploader):
+        self.uploader = uploader
+
+    async def upload(self, batches, batch_size=None, on_uploaded=None):
+        uploaded = 0
+        async for batch in batches:
+            if self.uploader.fail_uploads:
+                raise Exception("upload failed")
+            self.uploader.rows.extend(batch)
+            on_uploaded(batch)
+            uploaded += len(batch)
+        return uploaded
+
+class FakeCopyLoader:
+    def __init__(self):
+        self.rows = []
+
+    def load_snapshot(self, snapshot_path: str) -> int:
+        self.rows = read_snapshot(snapshot_path).to_pylist()
+        return len(self.rows)
+
+class FakeUploader:
+    """Records the RPCs the pipeline makes instead of calling Supabase"""
+
+    def __init__(self, copy_loader=None, fail_uploads=False):
+        self.copy_loader = copy_loader
+        self.fail_uploads = fail_uploads
+        self.rows = []
+        self.calls = []
+
+    def rest_uploader(self):
+        assert self.copy_loader is None, "REST upload used alongside COPY"
+        return FakeRestUploader(self)
+
+    def begin_upload(self, progress):
+        self.calls.append('begin')
+        return True
+
+    def complete_upload(self, progress):
+        self.calls.append('complete')
+        progress.complete()
+        return True
+
+    def run_post_ingest(self, snapshot_date):
+        self.calls.append('post_ingest')
+        return True
+
+    def run_maintenance(self, function, description):
+        self.calls.append(function)
+        return True
+
+    def carry_forward_summary(self, snapshot_date):
+        self.calls.append('carry_forward')
+        return True
+
+class FakePipeline(RichListPipeline):
+    """The real stages and queues, with the snapshot copied from source and fake network clients"""
+
+    def __init__(self, source: str, uploader: FakeUploader, validated: bool = False, **kwargs):
+        super().__init__(depth=10, **kwargs)
+        self.source = source
+        self.validated = validated
+        self.fake_uploader = uploader
+        self.validator = FakeValidator()
+
+    async def load(self):
+        shutil.copyfile(self.source, self.snapshot_path)
+        self.needs_validation = not self.validated
+
+    async def connect_uploader(self):
+        self.processor.uploader = self.fake_uploader
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    # 進み具合と前回の記録は作業ディレクトリの.xrpscan_cacheに書かれる
+    monkeypatch.chdir(tmp_path)
+    # 検証のバッチ間の待ち時間をなくす
+    sleep = asyncio.sleep
+    monkeypatch.setattr(asyncio, 'sleep', lambda delay, *args: sleep(0, *args))
+
+@pytest.fixture
+def source(make_snapshot):
+    return make_snapshot([50, 40, 30, 20, 10], snapshot_date=SNAPSHOT_DATE, name="source.arrow")
+
+def run(pipeline: FakePipeline):
+    # ステージ間の受け渡しが止まったら失敗させる
+    asyncio.run(asyncio.wait_for(pipeline.run(), timeout=10))
+
+POST_UPLOAD_CALLS = ['begin', 'complete', 'post_ingest', 'cleanup_old_rich_list_data', 'analyze_rich_list_tables']
+
+def test_validated_batches_flow_through_the_queues_to_the_uploader(source):
+    uploader = FakeUploader()
+    pipeline = FakePipeline(source, uploader, validate_batch_size=2, queue_size=1)
+    run(pipeline)
+
+    assert [row['rank'] for row in uploader.rows] == [1, 2, 3, 4, 5]
+    assert all((row['balance_drops'], row['escrow_drops'], row['exists']) == (7, 1, True) for row in uploader.rows)
+    assert len(pipeline.validator.checked) == 5
+    assert pipeline.validator.opened and pipeline.validator.closed
+    assert uploader.calls == POST_UPLOAD_CALLS
+    assert not os.path.exists(pipeline.snapshot_path)
+    assert SnapshotChangeDetector().previous.rows == 5
+
+def test_rerun_resumes_after_the_saved_high_water(source):
+    progress = UploadProgressTracker(source)
+    progress.mark_rows([{'rank': 1}, {'rank': 2}])
+    progress.save()
+
+    uploader = FakeUploader()
+    pipeline = FakePipeline(source, uploader, validate_batch_size=2)
+    run(pipeline)
+
+    assert [row['rank'] for row in uploader.rows] == [3, 4, 5]
+    addresses = read_snapshot(source).column('address').to_pylist()
+    assert pipeline.validator.checked == addresses[2:]
+    assert UploadProgressTracker(source).progress.completed
+
+@pytest.mark.parametrize('validated', [False, True])
+def test_copy_path_drains_the_queue_and_loads_the_validated_snapshot(source, validated):
+    copy_loader = FakeCopyLoader()
+    uploader = FakeUploader(copy_loader=copy_loader)
+    pipeline = FakePipeline(source, uploader, validated=validated, validate_batch_size=1, queue_size=1)
+    run(pipeline)
+
+    assert [row['rank'] for row in copy_loader.rows] == [1, 2, 3, 4, 5]
+    # 検証結果はCOPYの前にスナップショットへ書き戻されている
+    expected = [7] * 5 if not validated else [50, 40, 30, 20, 10]
+    assert [row['balance_drops'] for row in copy_loader.rows] == expected
+    assert len(pipeline.validator.checked) == (0 if validated else 5)
+    assert uploader.rows == []
+    assert uploader.calls == POST_UPLOAD_CALLS
+
+def test_unchanged_snapshot_is_carried_forward_without_uploading(source):
+    SnapshotChangeDetector().record_upload(source, 5)
+    uploader = FakeUploader()
+    pipeline = FakePipeline(source, uploader)
+    run(pipeline)
+
+    assert uploader.calls == ['carry_forward']
+    assert uploader.rows == []
+    assert not pipeline.validator.opened
+    assert not os.path.exists(pipeline.snapshot_path)
+
+def test_failing_stage_cancels_the_others(make_snapshot):
+    source = make_snapshot(list(range(40, 0, -1)), snapshot_date=SNAPSHOT_DATE, name="source.arrow")
+    uploader = FakeUploader(fail_uploads=True)
+    pipeline = FakePipeline(source, uploader, validate_batch_size=1, queue_size=1)
+    with pytest.raises(ExceptionGroup) as failure:
+        run(pipeline)
+
+    assert [str(e) for e in failure.value.exceptions] == ["upload failed"]
+    # 検証はキューが詰まったところでキャンセルされ、接続は閉じられる
+    assert len(pipeline.validator.checked) < 40
+    assert pipeline.validator.closed
+    assert uploader.calls == ['begin']
+    assert os.path.exists(pipeline.snapshot_path)
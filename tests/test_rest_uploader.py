@@ -0,0 +1,105 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from rest_uploader import AsyncRestUploader, UploadError
+
+def uploader(handler, **kwargs):
+    kwargs.setdefault('backoff', 0.0)
+    return AsyncRestUploader("https://db.example", "key", transport=httpx.MockTransport(handler), **kwargs)
+
+async def batches(count: int, chunk: int = 50):
+    for start in range(0, count, chunk):
+        yield [{'rank': rank} for rank in range(start + 1, min(count, start + chunk) + 1)]
+
+def run(rest, count: int, **kwargs):
+    accepted = []
+    uploaded = asyncio.run(rest.upload(batches(count), on_uploaded=accepted.extend, **kwargs))
+    return uploaded, sorted(row['rank'] for row in accepted)
+
+def test_adapt_grows_additively_and_halves_when_slow():
+    rest = AsyncRestUploader("https://db.example", "key", min_batch_size=100, max_batch_size=1000,
+                             target_latency=1.0, max_payload=10 ** 9)
+    for _ in range(3):
+        rest.adapt(0.5, 100, 100 * 50)
+    assert rest.batch_size == 400
+    rest.adapt(2.0, 400, 400 * 50)
+    assert rest.batch_size == 200
+    for _ in range(20):
+        rest.adapt(0.1, 100, 100 * 50)
+    assert rest.batch_size == 1000
+    for _ in range(20):
+        rest.adapt(5.0, 100, 100 * 50)
+    assert rest.batch_size == 100
+
+def test_batch_size_is_capped_by_payload_size():
+    rest = AsyncRestUploader("https://db.example", "key", min_batch_size=10, max_batch_size=10_000,
+                             max_payload=100_000)
+    assert rest.payload_cap() == 10_000
+    rest.batch_size = 500
+    rest.adapt(0.1, 100, 100 * 1000)
+    # 1行1000バイトなら、上限の8割（80,000バイト）に収まる80行まで
+    assert rest.payload_cap() == 80
+    assert rest.batch_size == 80
+
+def test_upserts_with_merge_duplicates():
+    seen = []
+
+    def handler(request):
+        seen.append(request)
+        return httpx.Response(201)
+
+    uploaded, accepted = run(uploader(handler, on_conflict="account_id,snapshot_date"), 120)
+    assert uploaded == 120 and accepted == list(range(1, 121))
+    assert seen[0].url.params['on_conflict'] == "account_id,snapshot_date"
+    assert "resolution=merge-duplicates" in seen[0].headers['Prefer']
+
+def test_payload_too_large_splits_batches_until_they_fit():
+    sizes = []
+
+    def handler(request):
+        rows = json.loads(request.content)
+        sizes.append(len(rows))
+        return httpx.Response(413 if len(rows) > 30 else 201)
+
+    rest = uploader(handler, min_batch_size=100, max_batch_size=400, concurrency=2)
+    uploaded, accepted = run(rest, 400, batch_size=200)
+    assert uploaded == 400
+    # 分割して送り直した行も、受け付けられた行も1回ずつ
+    assert accepted == list(range(1, 401))
+    assert sizes[0] == 200 and max(size for size in sizes if size <= 30) <= 30
+    assert rest.max_batch_size <= 30
+
+def test_transient_errors_are_retried_and_shrink_the_batch(capsys):
+    responses = iter([httpx.Response(503, text="busy"), httpx.Response(429, headers={'Retry-After': '0'})])
+
+    def handler(request):
+        return next(responses, httpx.Response(201))
+
+    rest = uploader(handler, min_batch_size=50, max_batch_size=400, concurrency=1)
+    uploaded, accepted = run(rest, 200, batch_size=200)
+    assert uploaded == 200 and accepted == list(range(1, 201))
+    assert rest.retries == 2
+    assert "HTTP 503: busy" in capsys.readouterr().out
+
+def test_permanent_errors_and_exhausted_retries_raise_upload_error():
+    with pytest.raises(UploadError, match="PostgREST returned 400"):
+        run(uploader(lambda request: httpx.Response(400, text="bad column")), 10)
+
+    attempts = []
+
+    def always_busy(request):
+        attempts.append(request)
+        return httpx.Response(503)
+
+    with pytest.raises(UploadError, match="failed after 3 attempts"):
+        run(uploader(always_busy, max_attempts=3, concurrency=1), 10)
+    assert len(attempts) == 3
+
+def test_retry_after_header_sets_the_delay():
+    rest = AsyncRestUploader("https://db.example", "key", backoff=1.0, max_backoff=4.0)
+    assert rest.backoff_delay(1, httpx.Response(429, headers={'Retry-After': '7'})) == 7.0
+    # ヘッダーがなければ full jitter（上限はmax_backoff）
+    assert all(0 <= rest.backoff_delay(10) <= 4.0 for _ in range(50))
@@ -0,0 +1,100 @@
+import hashlib
+
+import numpy as np
+
+from account_id import encode_account_id
+import pytest
+
+from rich_list_snapshot import (AccountColumnsBuilder, TopBalances, first_occurrences, format_xrp, join_well_known,
+                                rank_accounts, xrp_to_drops)
+
+def address(n: int, prefix: bytes = b'') -> str:
+    return encode_account_id(prefix + n.to_bytes(20 - len(prefix), 'big'))
+
+def hashed_address(n: int) -> str:
+    # 実際のAccountIDと同じく一様に分布する20バイト（64ビットキーは衝突しない）
+    return encode_account_id(hashlib.blake2b(n.to_bytes(8, 'big'), digest_size=20).digest())
+
+def build(rows):
+    builder = AccountColumnsBuilder()
+    for row in rows:
+        builder.append(**row)
+    return builder.build()
+
+def test_rank_accounts_orders_by_balance_and_keeps_ties_stable():
+    columns = build([
+        {'address': address(1), 'balance_drops': 5, 'name': 'a'},
+        {'address': address(2), 'balance_drops': 20, 'name': 'b'},
+        {'address': address(3), 'balance_drops': 5, 'name': 'c'},
+        {'address': address(4), 'balance_drops': 70, 'name': 'd'},
+    ])
+    ranked = rank_accounts(columns)
+    assert list(ranked.columns.name) == ['d', 'b', 'a', 'c']
+    assert ranked.total_drops == 100
+    assert np.allclose(ranked.percentage, [70, 20, 5, 5])
+
+def test_rank_accounts_with_zero_total():
+    ranked = rank_accounts(build([{'address': address(1), 'balance_drops': 0}]))
+    assert ranked.total_drops == 0
+    assert list(ranked.percentage) == [0.0]
+
+def test_first_occurrences_keeps_first_of_each_account_in_order():
+    columns = build([{'address': hashed_address(n), 'balance_drops': 1} for n in (7, 3, 7, 9, 3, 3)])
+    assert list(first_occurrences(columns.account_id)) == [0, 1, 3]
+
+def test_first_occurrences_with_colliding_keys():
+    # 先頭8バイトが同じ（64ビットキーが衝突する）別アカウントは残し、それぞれの重複だけ落とす
+    prefix = b'\xab' * 8
+    columns = build([{'address': address(n, prefix), 'balance_drops': 1} for n in (1, 2, 1, 3, 2, 2)])
+    assert list(first_occurrences(columns.account_id)) == [0, 1, 3]
+
+def test_join_well_known_copies_metadata_and_appends_missing_accounts():
+    # 小さい番号のAccountIDは先頭8バイトがすべて0なので、キー衝突時の引き直しも通る
+    rich_list = build([
+        {'address': address(1), 'balance_drops': 100},
+        {'address': address(2), 'balance_drops': 50},
+        {'address': address(1), 'balance_drops': 100},
+    ])
+    well_known = build([
+        {'address': address(2), 'balance_drops': 0, 'name': 'Old name'},
+        {'address': address(2), 'balance_drops': 0, 'name': 'Bitstamp', 'domain': 'bitstamp.net', 'verified': True},
+        {'address': address(3), 'balance_drops': 999, 'name': 'Dormant'},
+    ])
+    joined = join_well_known(rich_list, well_known)
+    assert [encode_account_id(bytes(a)) for a in joined.account_id] == [address(1), address(2), address(3)]
+    # 重複したwell-knownのエントリは最後のものを使う
+    assert list(joined.name) == ['Unknown', 'Bitstamp', 'Dormant']
+    assert list(joined.domain) == ['', 'bitstamp.net', '']
+    assert list(joined.verified) == [False, True, False]
+    # リッチリストにないアカウントは残高0で追加する
+    assert list(joined.balance) == [100, 50, 0]
+
+def test_top_balances_keeps_largest_across_compactions():
+    rng = np.random.default_rng(3)
+    balances = rng.permutation(1000).astype(np.int64) * 1000
+    top = TopBalances(depth=10, compact_every=64)
+    for start in range(0, 1000, 37):
+        chunk = range(start, min(start + 37, 1000))
+        top.extend([address(n + 1) for n in chunk], [int(balances[n]) for n in chunk])
+    columns = top.build(escrows={})
+    assert top.seen == 1000
+    assert list(columns.balance) == [1000 * n for n in range(999, 989, -1)]
+    assert [encode_account_id(bytes(a).ljust(20, b'\0')) for a in columns.account_id] == \
+        [address(int(np.flatnonzero(balances == b)[0]) + 1) for b in columns.balance]
+
+@pytest.mark.parametrize("amount, drops", [
+    ("1.234567", 1_234_567),
+    ("0.000001", 1),
+    ("100000000000", 100_000_000_000_000_000),
+    (0.1, 100_000),
+    # floatの2進誤差（0.3 = 0.29999...）で1 drop落とさない
+    (0.3, 300_000),
+])
+def test_xrp_to_drops_is_exact(amount, drops):
+    assert xrp_to_drops(amount) == drops
+
+def test_format_xrp_round_trips_drops():
+    for drops in (0, 1, 999_999, 1_000_000, 123_456_789_012_345, -2_500_000):
+        assert xrp_to_drops(format_xrp(drops)) == drops
+    assert format_xrp(1_234_567) == "1.234567"
+    assert format_xrp(-1) == "-0.000001"
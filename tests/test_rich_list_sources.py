@@ -0,0 +1,22 @@
+import pytest
+
+from rich_list_sources import SourceManager, default_sources
+
+def names(sources):
+    return [source.name for source in sources]
+
+def test_ledger_source_is_opt_in(monkeypatch):
+    monkeypatch.delenv("RICH_LIST_LEDGER_SOURCE", raising=False)
+    assert "xrpl_ledger" not in names(default_sources())
+    monkeypatch.setenv("RICH_LIST_LEDGER_SOURCE", "1")
+    assert "xrpl_ledger" in names(default_sources())
+
+def test_deep_rich_list_needs_the_ledger_source(monkeypatch, tmp_path):
+    monkeypatch.delenv("RICH_LIST_LEDGER_SOURCE", raising=False)
+    health_path = str(tmp_path / "health.json")
+    with pytest.raises(ValueError, match="RICH_LIST_LEDGER_SOURCE=1"):
+        SourceManager(default_sources(), depth=100_000, health_path=health_path)
+
+    monkeypatch.setenv("RICH_LIST_LEDGER_SOURCE", "1")
+    manager = SourceManager(default_sources(), depth=100_000, health_path=health_path)
+    assert names(manager.sources) == ["xrpl_ledger"]
@@ -0,0 +1,211 @@
+import numpy as np
+import pytest
+
+# seleniumとxrpl-pyはスクレイプ用の依存で、入っていない環境では飛ばす
+pytest.importorskip("selenium")
+pytest.importorskip("xrpl")
+
+from scraper import PageReady, XRPLRichListScraper, merge_pages, parse_rich_list_html
+
+@pytest.fixture
+def scraper():
+    # ブラウザを起動せずに解析だけ使う
+    return XRPLRichListScraper.__new__(XRPLRichListScraper)
+
+@pytest.mark.parametrize("text, drops", [
+    ("1,234.5 XRP", 1_234_500_000),
+    ("0.1 XRP", 100_000),
+    ("99,999,999,999.999999 XRP", 99_999_999_999_999_999),
+    ("12 XRP", 12_000_000),
+    ("", 0),
+    ("-", 0),
+    (".5", 500_000),
+    ("1e3", 1_000_000_000),
+])
+def test_parse_xrp_amounts_is_exact_to_the_drop(scraper, text, drops):
+    parsed = scraper.parse_xrp_amounts(np.array([text, "1 XRP"]))
+    assert parsed.dtype == np.int64
+    assert parsed.tolist() == [drops, 1_000_000]
+
+def test_parse_xrp_amounts_zeroes_unparseable_values(scraper, capsys):
+    assert scraper.parse_xrp_amounts(np.array(["n/a", "2.000001 XRP"])).tolist() == [0, 2_000_001]
+    assert "Error parsing XRP amount 'n/a'" in capsys.readouterr().out
+
+def test_parse_table_rows_returns_drops_and_skips_rows_without_rank(scraper):
+    rows = [
+        ["1", " rAddressOne ", "Ripple", "1,000,000.000001 XRP", "5,000 XRP", "1.5%"],
+        ["", "", "", "", "", ""],
+        ["2", "rAddressTwo", "", "0.3 XRP", "-", "0.0001%"],
+    ]
+    entries = scraper.parse_table_rows(rows, "2026-01-01T00:00:00+00:00")
+    assert [entry['rank'] for entry in entries] == [1, 2]
+    assert entries[0]['address'] == "rAddressOne"
+    assert entries[1]['label'] == "Unknown"
+    assert [entry['balance_drops'] for entry in entries] == [1_000_000_000_001, 300_000]
+    assert [entry['escrow_drops'] for entry in entries] == [5_000_000_000, 0]
+    assert entries[1]['percentage'] == pytest.approx(0.0001)
+
+HEADER_XPATH = XRPLRichListScraper.TABLE_HEADER_XPATH
+
+def page(rows: str, header: str = "Top 10,000 XRP balances") -> str:
+    return (f"<html><body><table><thead><tr><th>Rank</th><th>{header}</th></tr></thead>"
+            f"<tbody>{rows}</tbody></table></body></html>")
+
+ROW = ("<tr><td>{rank}</td><td><a href='/account/{address}'>{address}</a> <i>copy</i></td><td></td>"
+       "<td>{label}</td><td>{balance}</td><td>{escrow}</td><td>{percentage}</td></tr>")
+
+def test_parse_rich_list_html_reads_cell_texts():
+    html = page(
+        ROW.format(rank=1, address="rOne", label="Ripple  (Escrow)\n", balance="1,000.5 XRP", escrow="-",
+                   percentage="1.5%")
+        + "<tr><td colspan='7'>Loading more...</td></tr>"
+        + ROW.format(rank=2, address="rTwo", label="", balance="2 XRP", escrow="1 XRP", percentage="0.1%")
+    )
+    rows = parse_rich_list_html(html, HEADER_XPATH)
+    # 空白はまとめ、リンクのテキストだけをアドレスとし、セルが足りない行は飛ばす
+    assert rows == [
+        ["1", "rOne", "Ripple (Escrow)", "1,000.5 XRP", "-", "1.5%"],
+        ["2", "rTwo", "", "2 XRP", "1 XRP", "0.1%"],
+    ]
+
+def test_parse_rich_list_html_respects_limit_and_header_count():
+    rows = "".join(ROW.format(rank=rank, address=f"r{rank}", label="", balance="1 XRP", escrow="-",
+                              percentage="0%") for rank in range(1, 6))
+    assert len(parse_rich_list_html(page(rows, "Top 100 XRP balances"), HEADER_XPATH, limit=3)) == 3
+
+def test_parse_rich_list_html_only_reads_the_balances_table():
+    other = "<table><tbody>" + ROW.format(rank=99, address="rOther", label="", balance="9 XRP", escrow="-",
+                                          percentage="0%") + "</tbody></table>"
+    html = page(ROW.format(rank=1, address="rOne", label="", balance="1 XRP", escrow="-", percentage="0%"))
+    rows = parse_rich_list_html(html.replace("<body>", "<body>" + other), HEADER_XPATH)
+    assert [row[1] for row in rows] == ["rOne"]
+
+def test_parse_rich_list_html_without_table():
+    with pytest.raises(Exception, match="Rich list table not found"):
+        parse_rich_list_html("<html><body><p>Just a moment...</p></body></html>", HEADER_XPATH)
+
+def test_page_source_rows_parse_to_the_same_entries_as_script_rows(scraper):
+    html = page(ROW.format(rank=1, address="rOne", label="Bitstamp", balance="12,345.678901 XRP",
+                           escrow="5,000 XRP", percentage="0.0123%"))
+    entries = scraper.parse_table_rows(parse_rich_list_html(html, HEADER_XPATH), "now")
+    assert entries[0]['balance_drops'] == 12_345_678_901
+    assert entries[0]['escrow_drops'] == 5_000_000_000
+
+class FakeTable:
+    """Driver side of a table paged at `size` rows whose pagination shows `window` page links around the current page"""
+
+    def __init__(self, size: int, pages: int, window: int = 5, initial: int = 20, last_rows: int = None):
+        self.size, self.pages, self.window = size, pages, window
+        self.rows = initial
+        self.current = 1
+        self.resources = 0
+        self.last_rows = size if last_rows is None else last_rows
+        self.clicks = []
+
+    def switch_size(self):
+        self.rows = self.size if self.pages > 1 else self.last_rows
+
+    def visible_links(self):
+        start = max(1, self.current - self.window // 2)
+        return range(start, min(self.pages, start + self.window - 1) + 1)
+
+    def execute_script(self, script, *args):
+        if script == PageReady.NAVIGATE_SCRIPT:
+            target, current = args
+            visible = [page for page in self.visible_links() if current < page <= target]
+            heading = max(visible) if visible else current + 1
+            self.clicks.append(heading)
+            self.current = heading
+            self.rows = self.last_rows if heading == self.pages else self.size
+            return heading
+        first = str((self.current - 1) * self.size + 1)
+        return [self.rows, self.resources, first]
+
+def poll(ready, driver, times=200):
+    for _ in range(times):
+        rows = ready(driver)
+        if rows:
+            return rows
+    return None
+
+def test_page_ready_pages_forward_through_visible_links():
+    table = FakeTable(size=100, pages=12, window=5)
+    ready = PageReady(HEADER_XPATH, 100, page=11, initial=20, settle=0)
+    assert ready(table) is None
+    table.switch_size()
+    assert poll(ready, table) == 100
+    # 一度に見えるのは5ページ分だけなので、見えている中で一番先のリンクを順に押す
+    assert table.clicks == [5, 7, 9, 11]
+
+def test_page_ready_waits_for_page_size_before_navigating():
+    table = FakeTable(size=100, pages=3)
+    ready = PageReady(HEADER_XPATH, 100, page=2, initial=20, settle=0)
+    assert poll(ready, table, times=5) is None
+    assert table.clicks == []
+
+def test_only_the_last_page_may_finish_short_on_network_idle():
+    short = FakeTable(size=100, pages=1, initial=20, last_rows=40)
+    short.switch_size()
+    assert poll(PageReady(HEADER_XPATH, 100, page=1, initial=20, last=False, settle=0), short) is None
+    assert poll(PageReady(HEADER_XPATH, 100, page=1, initial=20, last=True, settle=0), short) == 40
+    # 表示件数を変える前の行数のままなら、最後のページでも完了にしない
+    unchanged = FakeTable(size=100, pages=1, initial=20, last_rows=20)
+    unchanged.switch_size()
+    assert poll(PageReady(HEADER_XPATH, 100, page=1, initial=20, last=True, settle=0), unchanged) is None
+
+def test_page_ready_raises_without_a_way_forward():
+    class NoPagination(FakeTable):
+        def execute_script(self, script, *args):
+            if script == PageReady.NAVIGATE_SCRIPT:
+                return None
+            return super().execute_script(script, *args)
+
+    table = NoPagination(size=100, pages=3)
+    table.switch_size()
+    with pytest.raises(Exception, match="No pagination link towards page 3"):
+        PageReady(HEADER_XPATH, 100, page=3, settle=0)(table)
+
+def rank_rows(ranks):
+    return [[str(rank), f"r{rank}", "", "1 XRP", "-", "0%"] for rank in ranks]
+
+def test_merge_pages_orders_by_rank_and_drops_duplicates(capsys):
+    pages = {2: rank_rows([4, 5, 6]), 1: rank_rows([1, 2, 3, 4]), 3: rank_rows(["", 7])}
+    merged = merge_pages(pages, limit=10)
+    assert [row[0] for row in merged] == ["1", "2", "3", "4", "5", "6", "7"]
+    assert "Dropped 1 duplicate rows" in capsys.readouterr().out
+
+def test_merge_pages_cuts_at_limit():
+    assert len(merge_pages({1: rank_rows(range(1, 101))}, limit=30)) == 30
+
+def test_merge_pages_raises_on_gaps_and_empty_pages():
+    with pytest.raises(Exception, match="2 ranks missing"):
+        merge_pages({1: rank_rows([1, 2]), 2: rank_rows([5, 6])}, limit=10)
+    with pytest.raises(Exception, match="no rows"):
+        merge_pages({1: []}, limit=10)
+
+def test_close_closes_every_tab_opened_on_a_pooled_browser():
+    class FakeDriver:
+        def __init__(self):
+            self.current = None
+            self.closed = []
+            self.quit_called = False
+            self.switch_to = self
+
+        def window(self, handle):
+            self.current = handle
+
+        def close(self):
+            self.closed.append(self.current)
+
+        def quit(self):
+            self.quit_called = True
+
+    scraper = XRPLRichListScraper.__new__(XRPLRichListScraper)
+    scraper.driver = FakeDriver()
+    scraper.pooled = True
+    scraper.tabs = ["tab-1", "tab-2", "tab-3"]
+    driver = scraper.driver
+    scraper.close()
+    scraper.close()
+    assert driver.closed == ["tab-1", "tab-2", "tab-3"]
+    assert driver.quit_called and scraper.driver is None
@@ -0,0 +1,42 @@
+import pyarrow as pa
+import pytest
+
+from snapshot_file import SnapshotUpdater, iter_snapshot_rows, read_snapshot, snapshot_row_count
+
+def test_round_trip_keeps_schema_and_values(make_snapshot):
+    path = make_snapshot([3_000_000, 2_000_000, 1_000_000], ["Ripple", "Unknown", "Bitstamp"])
+    table = read_snapshot(path)
+    assert table.schema.field('account_id').type == pa.binary(20)
+    assert table.column('balance_drops').to_pylist() == [3_000_000, 2_000_000, 1_000_000]
+    assert table.column('label').to_pylist() == ["Ripple", "Unknown", "Bitstamp"]
+    assert snapshot_row_count(path) == 3
+
+def test_iter_snapshot_rows_batches_and_selects_columns(make_snapshot):
+    path = make_snapshot([5, 4, 3, 2, 1])
+    batches = list(iter_snapshot_rows(path, 2, ['rank', 'balance_drops']))
+    assert [len(batch) for batch in batches] == [2, 2, 1]
+    assert batches[2] == [{'rank': 5, 'balance_drops': 1}]
+
+def test_updater_patches_fixed_width_columns_in_place(make_snapshot):
+    path = make_snapshot([10] * 12)
+    with SnapshotUpdater(path) as snapshot:
+        assert len(snapshot) == 12
+        # boolはビットマップなので、同じバイト内の隣の行を壊さないことも確認する
+        snapshot.update(9, balance_drops=1_500_000, exists=False)
+        snapshot.update(8, exists=False)
+        snapshot.update(8, exists=True)
+    table = read_snapshot(path)
+    assert table.column('balance_drops').to_pylist()[8:11] == [10, 1_500_000, 10]
+    assert table.column('exists').to_pylist() == [True] * 9 + [False] + [True] * 2
+
+def test_updater_rejects_string_columns(make_snapshot):
+    path = make_snapshot([1, 2])
+    with SnapshotUpdater(path) as snapshot:
+        with pytest.raises(ValueError, match="not fixed-width"):
+            snapshot.update(0, label="Changed")
+
+def test_write_replaces_existing_file_atomically(make_snapshot, tmp_path):
+    make_snapshot([1, 2, 3])
+    path = make_snapshot([7])
+    assert read_snapshot(path).num_rows == 1
+    assert not (tmp_path / "snapshot.arrow.temp").exists()
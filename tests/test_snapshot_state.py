@@ -0,0 +1,100 @@
+import json
+import time
+
+from snapshot_file import SnapshotUpdater
+from snapshot_state import SnapshotChangeDetector, UploadProgressTracker, upload_run_id
+
+def rows(*ranks):
+    return [{'rank': rank} for rank in ranks]
+
+def test_run_id_is_snapshot_date_and_content_hash(make_snapshot):
+    path = make_snapshot([3, 2, 1], snapshot_date="2024-05-01T12:00:00+00:00")
+    run_id = upload_run_id(path)
+    assert run_id.startswith("2024-05-01T12:00:00+00:00/")
+    # ハッシュは書き出し時のメタデータなので、検証で列を書き戻してもrun_idは変わらない
+    with SnapshotUpdater(path) as snapshot:
+        snapshot.update(0, exists=False)
+    assert upload_run_id(path) == run_id
+    changed = make_snapshot([3, 2, 5], snapshot_date="2024-05-01T12:00:00+00:00", name="changed.arrow")
+    assert upload_run_id(changed) != run_id
+
+def test_high_water_waits_for_gaps_below_it(make_snapshot, tmp_path):
+    progress = UploadProgressTracker(make_snapshot([1] * 10), path=str(tmp_path / "progress.json"))
+    # バッチは順不同で終わる
+    progress.mark_rows(rows(4, 5, 6))
+    assert progress.high_water == 0
+    progress.mark_rows(rows(1, 2))
+    assert progress.high_water == 2
+    progress.mark_rows(rows(3))
+    assert progress.high_water == 6
+    progress.mark_rows(rows(2, 9, 10))
+    assert progress.high_water == 6
+
+def test_saved_progress_resumes_the_same_run_only(make_snapshot, tmp_path):
+    progress_path = str(tmp_path / "progress.json")
+    snapshot = make_snapshot([1] * 5)
+    progress = UploadProgressTracker(snapshot, path=progress_path, save_interval=3600)
+    progress.mark_rows(rows(1, 2, 4))
+    progress.save()
+    # 保存するのは連続した範囲だけ（4は再送する）
+    assert json.loads((tmp_path / "progress.json").read_text(encoding='utf-8'))['high_water'] == 2
+
+    assert UploadProgressTracker(snapshot, path=progress_path).high_water == 2
+    other = make_snapshot([1] * 5, snapshot_date="2024-05-02T00:00:00+00:00", name="other.arrow")
+    fresh = UploadProgressTracker(other, path=progress_path)
+    assert fresh.high_water == 0
+    assert fresh.progress.total_rows == 5
+
+def test_progress_is_saved_at_most_once_per_interval(make_snapshot, tmp_path):
+    progress_path = tmp_path / "progress.json"
+    progress = UploadProgressTracker(make_snapshot([1] * 5), path=str(progress_path), save_interval=3600)
+    progress.mark_rows(rows(1))
+    assert json.loads(progress_path.read_text(encoding='utf-8'))['high_water'] == 1
+    progress.mark_rows(rows(2))
+    assert json.loads(progress_path.read_text(encoding='utf-8'))['high_water'] == 1
+
+def test_mark_all_complete_and_reset(make_snapshot, tmp_path):
+    progress_path = str(tmp_path / "progress.json")
+    snapshot = make_snapshot([1] * 5)
+    progress = UploadProgressTracker(snapshot, path=progress_path)
+    progress.mark_rows(rows(3))
+    progress.mark_all()
+    progress.complete()
+    saved = UploadProgressTracker(snapshot, path=progress_path).progress
+    assert (saved.high_water, saved.completed) == (5, True)
+
+    progress.reset()
+    saved = UploadProgressTracker(snapshot, path=progress_path).progress
+    assert (saved.high_water, saved.completed) == (0, False)
+    assert progress.confirmed == set()
+
+def test_unreadable_progress_file_starts_over(make_snapshot, tmp_path):
+    progress_path = tmp_path / "progress.json"
+    progress_path.write_text("{not json", encoding='utf-8')
+    assert UploadProgressTracker(make_snapshot([1, 2]), path=str(progress_path)).high_water == 0
+
+def test_change_detector_carries_forward_equal_snapshots(make_snapshot, tmp_path):
+    state_path = str(tmp_path / "last_upload.json")
+    first = make_snapshot([3, 2, 1], ["Ripple", "Bitstamp", "Ripple"], name="first.arrow")
+    detector = SnapshotChangeDetector(state_path)
+    assert not detector.is_unchanged(first)
+    detector.record_upload(first, 3)
+
+    same = make_snapshot([3, 2, 1], ["Ripple", "Bitstamp", "Ripple"], snapshot_date="2024-05-01T01:00:00+00:00",
+                         name="same.arrow")
+    detector = SnapshotChangeDetector(state_path)
+    assert detector.is_unchanged(same)
+    detector.record_carry_forward(same)
+    assert SnapshotChangeDetector(state_path).previous.snapshot_date == "2024-05-01T01:00:00+00:00"
+
+    changed = make_snapshot([3, 2, 5], ["Ripple", "Bitstamp", "Ripple"], name="changed.arrow")
+    assert not detector.is_unchanged(changed)
+    assert detector.changed_labels(changed) == ["Ripple"]
+
+def test_change_detector_uploads_after_max_carry_forward(make_snapshot, tmp_path):
+    state_path = str(tmp_path / "last_upload.json")
+    snapshot = make_snapshot([3, 2, 1])
+    SnapshotChangeDetector(state_path).record_upload(snapshot, 3)
+    detector = SnapshotChangeDetector(state_path, max_carry_forward=60)
+    detector.previous.uploaded_at = time.time() - 120
+    assert not detector.is_unchanged(snapshot)
@@ -0,0 +1,253 @@
+import hashlib
+import os
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from account_id import encode_account_id
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# スキーマはtable.sql → function.sqlの順に適用する（conftestのrich_list_db）。Postgresがなければ飛ばす
+NOW = datetime.now(timezone.utc).replace(microsecond=0)
+
+def account_id(index: int) -> bytes:
+    return hashlib.blake2b(index.to_bytes(8, 'big'), digest_size=20).digest()
+
+def ingest(db, snapshot_date, rows, grouped=True):
+    """Insert (label, balance_drops) rows as one snapshot; grouped=False leaves grouped_label to the trigger"""
+    for rank, (label, drops) in enumerate(rows, 1):
+        db.execute(
+            "INSERT INTO xrpl_rich_list (rank, account_id, label, grouped_label, balance_xrp, escrow_xrp,"
+            " balance_drops, escrow_drops, percentage, exists, domain, snapshot_date)"
+            " VALUES (%s, %s, %s, CASE WHEN %s THEN group_label(%s) END, %s, 0, %s, 0, 0, true, '', %s)",
+            [rank, account_id(rank), label, grouped, label, drops / 1_000_000, drops, snapshot_date])
+
+def summary(db, created_at):
+    return {row[0]: row[1:] for row in db.execute(
+        "SELECT grouped_label, count, total_balance, category, country FROM xrpl_rich_list_summary"
+        " WHERE created_at = %s", [created_at])}
+
+def test_function_sql_can_be_applied_again(rich_list_db):
+    with open(os.path.join(ROOT, "function.sql"), 'r', encoding='utf-8') as f:
+        rich_list_db.execute(f.read())
+
+def test_trigger_groups_labels_of_rows_ingested_without_grouped_label(rich_list_db):
+    ingest(rich_list_db, NOW, [("Ripple (1)", 5_000_000), ("~Someone (cold)", 1_000_000)], grouped=False)
+    labels = rich_list_db.execute("SELECT grouped_label FROM xrpl_rich_list ORDER BY rank").fetchall()
+    assert labels == [("Ripple",), ("Someone",)]
+
+def test_deprecated_address_column_is_filled_from_account_id(rich_list_db):
+    ingest(rich_list_db, NOW, [("Ripple", 5_000_000)])
+    rich_list_db.execute(
+        "INSERT INTO xrpl_rich_list (rank, account_id, address, label, balance_drops, escrow_drops, exists, snapshot_date)"
+        " VALUES (2, %s, 'rsent', 'Bitstamp', 1, 0, true, %s)", [account_id(2), NOW])
+    rows = rich_list_db.execute("SELECT r.address, v.address FROM xrpl_rich_list r"
+                                " JOIN xrpl_rich_list_with_address v USING (id) ORDER BY r.rank").fetchall()
+    assert rows == [(encode_account_id(account_id(1)),) * 2, ("rsent", "rsent")]
+
+def test_summary_rows_carry_category_and_country(rich_list_db):
+    rich_list_db.execute("INSERT INTO xrpl_rich_list_categories (grouped_label, category, country)"
+                         " VALUES ('Ripple', 'Major Contributor', 'US')")
+    ingest(rich_list_db, NOW, [("Ripple", 3_000_000), ("Ripple Escrow", 1_500_000), ("Someone", 1_000_000)])
+    rich_list_db.execute("SELECT insert_rich_list_summary(%s)", [NOW])
+    assert summary(rich_list_db, NOW) == {
+        "Ripple": (2, 4.5, "Major Contributor", "US"),
+        "Someone": (1, 1, None, None),
+    }
+
+def test_category_changes_reach_past_summary_rows(rich_list_db):
+    ingest(rich_list_db, NOW, [("Bitstamp", 1_000_000)])
+    rich_list_db.execute("SELECT insert_rich_list_summary(%s)", [NOW])
+    rich_list_db.execute("INSERT INTO xrpl_rich_list_categories (grouped_label, category, country)"
+                         " VALUES ('Bitstamp', 'Exchange', 'LU')")
+    assert summary(rich_list_db, NOW)["Bitstamp"][2:] == ("Exchange", "LU")
+    rich_list_db.execute("UPDATE xrpl_rich_list_categories SET country = 'GB' WHERE grouped_label = 'Bitstamp'")
+    assert summary(rich_list_db, NOW)["Bitstamp"][2:] == ("Exchange", "GB")
+    rich_list_db.execute("DELETE FROM xrpl_rich_list_categories WHERE grouped_label = 'Bitstamp'")
+    assert summary(rich_list_db, NOW)["Bitstamp"][2:] == (None, None)
+
+def record_upload(db, run_id, snapshot_date, started_hours_ago, completed):
+    db.execute("INSERT INTO xrpl_rich_list_uploads (run_id, snapshot_date, expected_rows, started_at, completed_at)"
+               " VALUES (%s, %s, 1, %s, CASE WHEN %s THEN %s END)",
+               [run_id, snapshot_date, NOW - timedelta(hours=started_hours_ago), completed, NOW])
+
+def test_complete_upload_requires_every_row(rich_list_db):
+    rich_list_db.execute("SELECT begin_rich_list_upload('run', %s, 2)", [NOW])
+    ingest(rich_list_db, NOW, [("Ripple", 1_000_000)])
+    assert rich_list_db.execute("SELECT complete_rich_list_upload('run')").fetchone()[0] is False
+    rich_list_db.execute("DELETE FROM xrpl_rich_list")
+    ingest(rich_list_db, NOW, [("Ripple", 1_000_000), ("Bitstamp", 1_000_000)])
+    # 同じrun_idで開始し直しても記録は1件のまま
+    rich_list_db.execute("SELECT begin_rich_list_upload('run', %s, 2)", [NOW])
+    assert rich_list_db.execute("SELECT complete_rich_list_upload('run')").fetchone()[0] is True
+
+def test_cleanup_removes_abandoned_uploads_and_old_records(rich_list_db):
+    abandoned = NOW - timedelta(hours=8)
+    in_flight = NOW - timedelta(minutes=10)
+    retried = NOW - timedelta(hours=9)
+    for snapshot_date in (abandoned, in_flight, retried):
+        ingest(rich_list_db, snapshot_date, [("Ripple", 1_000_000)])
+    record_upload(rich_list_db, "abandoned", abandoned, 8, completed=False)
+    record_upload(rich_list_db, "in-flight", in_flight, 0.2, completed=False)
+    # 同じ日時の別の実行が完了していれば、行はそちらのものなので残す
+    record_upload(rich_list_db, "retried-1", retried, 9, completed=False)
+    record_upload(rich_list_db, "retried-2", retried, 8.5, completed=True)
+    record_upload(rich_list_db, "old", NOW - timedelta(days=8), 8 * 24, completed=True)
+    rich_list_db.execute("SELECT cleanup_rich_list_uploads()")
+
+    dates = {row[0] for row in rich_list_db.execute("SELECT DISTINCT snapshot_date FROM xrpl_rich_list")}
+    assert dates == {in_flight, retried}
+    runs = {row[0] for row in rich_list_db.execute("SELECT run_id FROM xrpl_rich_list_uploads")}
+    assert runs == {"in-flight", "retried-1", "retried-2"}
+
+def test_cleanup_keeps_the_latest_completed_upload(rich_list_db):
+    record_upload(rich_list_db, "old", NOW - timedelta(days=9), 9 * 24, completed=True)
+    record_upload(rich_list_db, "latest", NOW - timedelta(days=8), 8 * 24, completed=True)
+    rich_list_db.execute("SELECT cleanup_rich_list_uploads()")
+    runs = [row[0] for row in rich_list_db.execute("SELECT run_id FROM xrpl_rich_list_uploads")]
+    assert runs == ["latest"]
+
+def post_ingest(db, snapshot_date):
+    return db.execute("SELECT run_post_ingest(%s)", [snapshot_date]).fetchone()[0]
+
+def changes(db, hours):
+    return dict(db.execute("SELECT grouped_label, balance_change FROM xrpl_rich_list_changes WHERE hours = %s",
+                           [hours]).fetchall())
+
+def test_post_ingest_builds_summary_and_changes(rich_list_db):
+    earlier = NOW - timedelta(hours=1)
+    ingest(rich_list_db, earlier, [("Ripple", 4_000_000), ("Bitstamp", 1_000_000)])
+    post_ingest(rich_list_db, earlier)
+    ingest(rich_list_db, NOW, [("Ripple", 5_000_000), ("Bitstamp", 1_000_000)])
+    timings = post_ingest(rich_list_db, NOW)
+
+    assert [step['step'] for step in timings] == [
+        'summary', 'periods', 'balance_changes', 'available_changes', 'category_changes', 'country_changes',
+        'statistics']
+    assert all(step['ms'] >= 0 for step in timings)
+    assert summary(rich_list_db, NOW) == {"Ripple": (1, 5, None, None), "Bitstamp": (1, 1, None, None)}
+    assert changes(rich_list_db, 1) == {"Ripple": 1, "Bitstamp": 0}
+
+def test_post_ingest_can_run_again_for_the_same_snapshot(rich_list_db):
+    ingest(rich_list_db, NOW, [("Ripple", 5_000_000)])
+    post_ingest(rich_list_db, NOW)
+    post_ingest(rich_list_db, NOW)
+    assert rich_list_db.execute("SELECT COUNT(*) FROM xrpl_rich_list_summary").fetchone()[0] == 1
+
+def test_post_ingest_runs_inside_one_transaction(rich_list_db):
+    ingest(rich_list_db, NOW, [("Ripple", 5_000_000), ("Bitstamp", 1_000_000)])
+    # 一時テーブルは呼び出しごとに作り直す
+    with rich_list_db.transaction():
+        post_ingest(rich_list_db, NOW)
+        post_ingest(rich_list_db, NOW)
+    temp_tables = rich_list_db.execute(
+        "SELECT to_regclass('pg_temp.post_ingest_periods'), to_regclass('pg_temp.post_ingest_rows'),"
+        " to_regclass('pg_temp.post_ingest_recent')").fetchone()
+    assert temp_tables == (None, None, None)
+
+def test_statistics_timeout_keeps_the_changes(rich_list_db):
+    earlier = NOW - timedelta(hours=1)
+    ingest(rich_list_db, earlier, [("Ripple", 4_000_000)])
+    post_ingest(rich_list_db, earlier)
+    ingest(rich_list_db, NOW, [("Ripple", 5_000_000)])
+    # statement_timeoutと同じエラーコードを時系列統計の途中で出す
+    rich_list_db.execute(
+        "CREATE FUNCTION cancel_statistics() RETURNS trigger LANGUAGE plpgsql AS $$"
+        " BEGIN RAISE EXCEPTION 'canceling statement due to statement timeout' USING ERRCODE = 'query_canceled'; END; $$")
+    rich_list_db.execute("CREATE TRIGGER cancel_statistics BEFORE INSERT ON xrpl_rich_list_available_hourly"
+                         " FOR EACH ROW EXECUTE FUNCTION cancel_statistics()")
+    timings = post_ingest(rich_list_db, NOW)
+
+    assert timings[-1]['step'] == 'statistics' and timings[-1]['timed_out'] is True
+    assert summary(rich_list_db, NOW) == {"Ripple": (1, 5, None, None)}
+    assert changes(rich_list_db, 1) == {"Ripple": 1}
+    # 統計の途中までの書き込みは巻き戻り、前回の時系列統計が残る
+    hourly = rich_list_db.execute("SELECT grouped_label, total_balance FROM xrpl_rich_list_available_hourly").fetchall()
+    assert hourly == [("Ripple", 4)]
+
+def test_cleanup_and_analyze_run_after_post_ingest(rich_list_db):
+    old = NOW - timedelta(days=3)
+    ingest(rich_list_db, old, [("Ripple", 4_000_000)])
+    ingest(rich_list_db, NOW, [("Ripple", 5_000_000), ("Bitstamp", 1_000_000)])
+    post_ingest(rich_list_db, NOW)
+    # 集計は古い行を消さない
+    assert rich_list_db.execute("SELECT COUNT(*) FROM xrpl_rich_list").fetchone()[0] == 3
+
+    rich_list_db.execute("SELECT cleanup_old_rich_list_data()")
+    rich_list_db.execute("SELECT analyze_rich_list_tables()")
+    dates = {row[0] for row in rich_list_db.execute("SELECT DISTINCT snapshot_date FROM xrpl_rich_list")}
+    assert dates == {NOW}
+    reltuples = rich_list_db.execute("SELECT reltuples FROM pg_class WHERE oid = 'xrpl_rich_list'::regclass").fetchone()
+    assert reltuples == (2,)
+
+def test_failed_post_ingest_leaves_nothing_behind(rich_list_db):
+    ingest(rich_list_db, NOW, [("Ripple", 5_000_000)])
+    rich_list_db.execute("ALTER TABLE xrpl_rich_list_country_changes RENAME TO country_changes_gone")
+    with pytest.raises(Exception, match="xrpl_rich_list_country_changes"):
+        post_ingest(rich_list_db, NOW)
+    assert rich_list_db.execute("SELECT COUNT(*) FROM xrpl_rich_list_summary").fetchone()[0] == 0
+    assert rich_list_db.execute("SELECT COUNT(*) FROM xrpl_rich_list_changes").fetchone()[0] == 0
+
+def test_carry_forward_copies_the_latest_summary(rich_list_db):
+    earlier = NOW - timedelta(hours=1)
+    ingest(rich_list_db, earlier, [("Ripple", 4_000_000), ("Bitstamp", 1_000_000)])
+    post_ingest(rich_list_db, earlier)
+    rich_list_db.execute("SELECT carry_forward_rich_list_summary(%s)", [NOW])
+    assert summary(rich_list_db, NOW) == summary(rich_list_db, earlier)
+    # 最新より前の日時では何もしない
+    rich_list_db.execute("SELECT carry_forward_rich_list_summary(%s)", [earlier - timedelta(hours=1)])
+    assert summary(rich_list_db, earlier - timedelta(hours=1)) == {}
+
+    # 既存のサマリーから変化量だけを作り直す（updater.pyの呼び方）
+    timings = post_ingest(rich_list_db, None)
+    assert [step['step'] for step in timings][0] == 'periods'
+    assert changes(rich_list_db, 1) == {"Ripple": 0, "Bitstamp": 0}
+
+def add_summary(db, created_at, labels=("Ripple", "Bitstamp")):
+    db.execute("INSERT INTO xrpl_rich_list_summary"
+               " (grouped_label, count, total_balance, total_escrow, total_xrp, created_at)"
+               " SELECT label, 1, 1, 0, 1, %s FROM unnest(%s::text[]) AS label", [created_at, list(labels)])
+
+def snapshot_times(db):
+    return [row[0] for row in db.execute("SELECT created_at FROM xrpl_rich_list_snapshot_times ORDER BY created_at")]
+
+def periods(db):
+    return dict(db.execute("SELECT hours, created_at FROM rich_list_change_periods()").fetchall())
+
+def test_snapshot_times_follow_summary_inserts_and_deletes(rich_list_db):
+    earlier = NOW - timedelta(hours=1)
+    add_summary(rich_list_db, earlier)
+    add_summary(rich_list_db, NOW)
+    assert snapshot_times(rich_list_db) == [earlier, NOW]
+    # 行が残っている間は時刻を消さない
+    rich_list_db.execute("DELETE FROM xrpl_rich_list_summary WHERE created_at = %s AND grouped_label = 'Ripple'",
+                         [earlier])
+    assert snapshot_times(rich_list_db) == [earlier, NOW]
+    rich_list_db.execute("DELETE FROM xrpl_rich_list_summary WHERE created_at = %s", [earlier])
+    assert snapshot_times(rich_list_db) == [NOW]
+
+def test_change_periods_pick_the_latest_snapshot_at_or_before_each_window(rich_list_db):
+    assert periods(rich_list_db) == {}
+    times = [NOW - timedelta(minutes=50), NOW - timedelta(hours=3, minutes=10), NOW - timedelta(hours=4),
+             NOW - timedelta(hours=25), NOW]
+    for created_at in times:
+        add_summary(rich_list_db, created_at)
+    assert periods(rich_list_db) == {
+        0: NOW,
+        1: NOW - timedelta(minutes=50),
+        3: NOW - timedelta(hours=3, minutes=10),
+        24: NOW - timedelta(hours=25),
+        168: None,
+        720: None,
+    }
+
+def test_one_hour_period_only_accepts_45_to_70_minutes(rich_list_db):
+    add_summary(rich_list_db, NOW - timedelta(minutes=80))
+    add_summary(rich_list_db, NOW - timedelta(minutes=30))
+    add_summary(rich_list_db, NOW)
+    assert periods(rich_list_db)[1] is None
+    add_summary(rich_list_db, NOW - timedelta(minutes=70))
+    assert periods(rich_list_db)[1] is None
+    add_summary(rich_list_db, NOW - timedelta(minutes=45))
+    assert periods(rich_list_db)[1] == NOW - timedelta(minutes=45)
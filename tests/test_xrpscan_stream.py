@@ -0,0 +1,51 @@
+import asyncio
+import json
+
+import pytest
+
+from xrpscan_stream import iter_json_array
+
+class ChunkedStream:
+    """Stand-in for aiohttp's StreamReader that hands out a body in fixed-size chunks"""
+
+    def __init__(self, body: bytes, size: int):
+        self.chunks = [body[i:i + size] for i in range(0, len(body), size)]
+
+    async def iter_chunked(self, chunk_size: int):
+        for chunk in self.chunks:
+            yield chunk
+
+def collect(body: bytes, size: int):
+    async def run():
+        return [item async for item in iter_json_array(ChunkedStream(body, size))]
+    return asyncio.run(run())
+
+ACCOUNTS = [
+    {"account": "rHb9CJAWyB4rj91VRWn96DkukG4bwdtyTh", "balance": 1234567.891234, "name": {"name": "Ripple"}},
+    {"account": "rEb8TK3gBgk5auZkwc6sHnwrGVJH8DuaLh", "balance": 98, "name": {"name": "ビットバンク"}},
+    {"account": "rLNaPoKeeBjZe2qs6x52yVPZpZ8td4dc6w", "balance": 0.000001, "name": None},
+]
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 64, 1 << 16])
+def test_elements_survive_any_chunk_boundary(size):
+    # 1バイトずつでは数値も多バイト文字（ビットバンク）もチャンクの途中で切れる
+    body = json.dumps(ACCOUNTS, ensure_ascii=False).encode('utf-8')
+    assert collect(body, size) == ACCOUNTS
+
+def test_number_split_at_chunk_end_is_not_truncated():
+    # "12" の時点では要素が終わったかわからないので、区切り文字まで待つ必要がある
+    assert collect(b'[12345, 6]', 3) == [12345, 6]
+
+def test_whitespace_and_empty_array():
+    assert collect(b'  \n[ ]\n', 1) == []
+    assert collect(b'[\r\n 1 ,\t2 ]', 2) == [1, 2]
+
+def test_html_body_is_rejected_before_decoding():
+    with pytest.raises(ValueError, match="Expected a JSON array"):
+        collect(b'<!DOCTYPE html><html>Just a moment...</html>', 8)
+
+def test_truncated_body_raises():
+    with pytest.raises(ValueError):
+        collect(b'[{"account": "r1"}, {"account": "r2"', 5)
+    with pytest.raises(ValueError, match="Unexpected end"):
+        collect(b'[1, 2', 5)
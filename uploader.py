@@ -1,11 +1,46 @@
+import asyncio
 import os
 import sys
 import time
-import csv
-from typing import List, Dict
+from typing import Dict, Optional
 
 from supabase import create_client
 
+from rest_uploader import AsyncRestUploader, snapshot_batches
+from snapshot_file import snapshot_row_count
+from account_id import account_id_hex
+from rich_list_snapshot import format_xrp
+from snapshot_state import SnapshotChangeDetector, UploadProgressTracker, snapshot_date_of
+
+# スナップショットから読む列（キーはaccount_id。addressは移行期間のあいだ非推奨のカラムとしても送る）
+UPLOAD_COLUMNS = ['rank', 'address', 'account_id', 'label', 'grouped_label', 'balance_drops', 'escrow_drops',
+                  'percentage', 'snapshot_date', 'exists', 'domain', 'domain_verified']
+
+def with_xrp_amounts(row: Dict) -> Dict:
+    """Add the display-only balance_xrp/escrow_xrp columns, formatted exactly from drops"""
+    return {
+        **row,
+        'balance_xrp': format_xrp(row['balance_drops']),
+        'escrow_xrp': format_xrp(row['escrow_drops'])
+    }
+
+def to_upload_row(row: Dict) -> Dict:
+    """Snapshot row -> xrpl_rich_list row (bytea AccountID, plus the deprecated classic address)"""
+    row = with_xrp_amounts(row)
+    row['account_id'] = account_id_hex(row['account_id'])
+    return row
+
+# xrpl_rich_listの一意キー（再送した行は重複させずに上書きする）
+UPSERT_KEY = "account_id,snapshot_date"
+
+# 失敗したら同じプロセスでやり直す（スナップショットと進み具合は手元に残るので、DBに入った順位の続きから送る）
+UPLOAD_ATTEMPTS = 3
+UPLOAD_RETRY_DELAY = 30
+
+def upload_batch_size_for(total: int, minimum: int = 100, maximum: int = 1000) -> int:
+    """Rows per insert request: 100 for the top 10k, larger chunks for deeper snapshots"""
+    return max(minimum, min(maximum, -(-total // 100)))
+
 class SupabaseUploader:
     def __init__(self):
         supabase_url = os.environ["SUPABASE_URL"]
@@ -19,13 +54,19 @@ class SupabaseUploader:
         )
         self._test_connection()
 
+        # 直接接続の接続文字列があれば行はCOPYで一括投入する（psycopgはその場合だけ読み込む）
+        self.copy_loader = None
+        if os.environ.get("SUPABASE_DB_URL"):
+            from copy_loader import CopyLoader
+            self.copy_loader = CopyLoader.from_env()
+
     def _test_connection(self):
         max_retries = 3
         retry_delay = 5
         
         for attempt in range(max_retries):
             try:
-                response = self.supabase.table('xrpl_rich_list').select('address').limit(1).execute()
+                response = self.supabase.table('xrpl_rich_list').select('account_id').limit(1).execute()
                 if hasattr(response, 'error') and response.error:
                     raise Exception(f"Supabase connection test failed: {response.error}")
                 print("Successfully connected to Supabase")
@@ -40,354 +81,170 @@ class SupabaseUploader:
                     print("All connection attempts failed")
                     raise
 
-    def upload_from_csv(self, csv_path: str) -> bool:
-        print(f"Starting upload from {csv_path}")
-        try:
-            batch_size = 100
-            current_batch = []
-            processed_count = 0
-            total_count = 0
+    def rest_uploader(self) -> AsyncRestUploader:
+        return AsyncRestUploader.from_env(on_conflict=UPSERT_KEY)
 
-            with open(csv_path, 'r', encoding='utf-8') as csvfile:
-                reader = csv.DictReader(csvfile)
-                
-                for row in reader:
-                    # exists を文字列の "True"/"False" から bool型に変換
-                    exists_value = str(row.get('exists', 'True')).lower() == 'true'
-                    
-                    current_batch.append({
-                        'rank': int(row['rank']),
-                        'address': row['address'],
-                        'label': row['label'],
-                        'balance_xrp': float(row['balance_xrp']),
-                        'escrow_xrp': float(row['escrow_xrp']),
-                        'percentage': float(row['percentage']),
-                        'snapshot_date': row['snapshot_date'],
-                        'exists': exists_value,
-                        'domain': row['domain']
-                    })
-                    
-                    if len(current_batch) >= batch_size:
-                        self._upload_batch(current_batch)
-                        processed_count += len(current_batch)
-                        print(f"Uploaded {processed_count} entries...")
-                        current_batch = []
-                    
-                    total_count += 1
-
-                # Upload remaining entries
-                if current_batch:
-                    self._upload_batch(current_batch)
-                    processed_count += len(current_batch)
+    def upload_from_snapshot(self, snapshot_path: str) -> bool:
+        print(f"Starting upload from {snapshot_path}")
+        try:
+            progress = UploadProgressTracker(snapshot_path)
+            if not self.begin_upload(progress):
+                return False
+
+            if self.copy_loader is not None:
+                started = time.perf_counter()
+                count = self.copy_loader.load_snapshot(snapshot_path)
+                progress.mark_all()
+                print(f"Successfully copied {count} entries to Supabase in {time.perf_counter() - started:.1f}s")
+                return self.complete_upload(progress)
+
+            if progress.high_water:
+                # 前回の失敗までに入った順位は送らない（その先はupsertなので重複してもよい）
+                print(f"Resuming upload {progress.run_id} after rank {progress.high_water}")
+            batch_size = upload_batch_size_for(snapshot_row_count(snapshot_path))
+            # スナップショットは型付きなので文字列からの変換は不要
+            batches = snapshot_batches(snapshot_path, UPLOAD_COLUMNS, to_upload_row, start=progress.high_water)
+            try:
+                processed_count = asyncio.run(
+                    self.rest_uploader().upload(batches, batch_size, on_uploaded=progress.mark_rows))
+            finally:
+                progress.save()
 
             print(f"Successfully uploaded {processed_count} entries to Supabase")
-            return True
+            return self.complete_upload(progress)
 
         except Exception as e:
             print(f"Error uploading to Supabase: {e}")
             return False
 
-    def _upload_batch(self, batch: List[Dict]) -> None:
-        max_retries = 3
-        current_retry = 0
-        
-        while current_retry < max_retries:
-            try:
-                response = self.supabase.table('xrpl_rich_list').insert(batch).execute()
-                if hasattr(response, 'error') and response.error:
-                    raise Exception(f"Supabase error: {response.error}")
-                break
-            except Exception as e:
-                current_retry += 1
-                print(f"Error uploading batch (attempt {current_retry}/{max_retries}): {e}")
-                if current_retry < max_retries:
-                    print("Retrying...")
-                    time.sleep(5)
-                else:
-                    raise Exception("Failed to upload batch after max retries")
-
-    def update_summary_table(self) -> bool:
+    def begin_upload(self, progress: UploadProgressTracker) -> bool:
         try:
-            # PostgreSQL関数を呼び出す
+            # 同じrun_idの再実行では何もしない
             response = self.supabase.rpc(
-                'update_rich_list_summary'
+                'begin_rich_list_upload',
+                {
+                    'p_run_id': progress.run_id,
+                    'p_snapshot_date': progress.progress.snapshot_date,
+                    'p_expected_rows': progress.progress.total_rows
+                }
             ).execute()
-            
-            if hasattr(response, 'error') and response.error:
-                raise Exception(f"Summary table update failed: {response.error}")
-                
-            print("Successfully updated summary table")
-            return True
-            
-        except Exception as e:
-            print(f"Error updating summary table: {e}")
-            return False
 
-    def update_balance_changes(self) -> bool:
-        try:
-            # PostgreSQL関数を呼び出す
-            response = self.supabase.rpc(
-                'update_balance_changes'
-            ).execute()
-            
             if hasattr(response, 'error') and response.error:
-                # タイムアウトエラーの場合は無視
-                if '57014' in str(response.error):
-                    print("Warning: Balance changes calculation timed out, but continuing...")
-                    return True
-                raise Exception(f"Balance changes update failed: {response.error}")
-            
-            print("Successfully updated balance changes")
-            return True
-            
-        except Exception as e:
-            # タイムアウトエラーの場合は無視
-            if '57014' in str(e):
-                print("Warning: Balance changes calculation timed out, but continuing...")
-                return True
-            print(f"Error updating balance changes: {e}")
-            return False
+                raise Exception(f"Upload registration failed: {response.error}")
 
-    def update_available_changes(self) -> bool:
-        try:
-            # PostgreSQL関数を呼び出す
-            response = self.supabase.rpc(
-                'update_available_changes'
-            ).execute()
-            
-            if hasattr(response, 'error') and response.error:
-                # タイムアウトエラーの場合は無視して続行
-                if '57014' in str(response.error):
-                    print("Warning: Available changes calculation timed out, but continuing...")
-                    return True
-                raise Exception(f"Available changes update failed: {response.error}")
-            
-            print("Successfully updated available changes")
             return True
-            
-        except Exception as e:
-            # タイムアウトエラーの場合は無視して続行
-            if '57014' in str(e):
-                print("Warning: Available changes calculation timed out, but continuing...")
-                return True
-            print(f"Error updating available changes: {e}")
-            return False
 
-    def update_category_changes(self) -> bool: #32
-        try:
-            # PostgreSQL関数を呼び出す
-            response = self.supabase.rpc(
-                'update_category_changes'
-            ).execute()
-            
-            if hasattr(response, 'error') and response.error:
-                raise Exception(f"Category changes update failed: {response.error}")
-            
-            print("Successfully updated category changes")
-            return True
-            
         except Exception as e:
-            print(f"Error updating category changes: {e}")
+            print(f"Error registering upload: {e}")
             return False
 
-    def update_country_changes(self) -> bool:
+    def complete_upload(self, progress: UploadProgressTracker) -> bool:
+        """Mark the snapshot complete once every row is in xrpl_rich_list (otherwise it is resent next run)"""
         try:
-            # PostgreSQL関数を呼び出す
             response = self.supabase.rpc(
-                'update_country_changes'
+                'complete_rich_list_upload',
+                {'p_run_id': progress.run_id}
             ).execute()
-            
-            if hasattr(response, 'error') and response.error:
-                raise Exception(f"Country changes update failed: {response.error}")
-            
-            print("Successfully updated country changes")
-            return True
-            
-        except Exception as e:
-            print(f"Error updating country changes: {e}")
-            return False
 
-    def cleanup_old_data(self) -> bool:
-        try:
-            # PostgreSQL関数を呼び出す
-            response = self.supabase.rpc(
-                'cleanup_old_rich_list_data'
-            ).execute()
-            
             if hasattr(response, 'error') and response.error:
-                raise Exception(f"Data cleanup failed: {response.error}")
+                raise Exception(f"Upload completion failed: {response.error}")
 
-            print("Successfully cleaned up old data")
-            return True
-            
-        except Exception as e:
-            print(f"Error cleaning up old data: {e}")
-            return False
-    
-    def cleanup_old_statistics(self) -> bool:
-        try:
-            # PostgreSQL関数を呼び出す
-            response = self.supabase.rpc(
-                'delete_old_statistics'
-            ).execute()
-            
-            if hasattr(response, 'error') and response.error:
-                raise Exception(f"Data cleanup failed: {response.error}")
+            if not response.data:
+                # 手元の記録と食い違っているので、次回は全行をupsertで送り直す
+                print(f"Upload {progress.run_id} is missing rows in the database")
+                progress.reset()
+                return False
 
-            print("Successfully cleaned up old statistics")
-            return True
-            
-        except Exception as e:
-            print(f"Error cleaning up old statistics: {e}")
-            return False
-            
-    def update_category_statistics(self) -> bool: #228
-        try:
-            # PostgreSQL関数を呼び出す
-            response = self.supabase.rpc(
-                'update_category_statistics'
-            ).execute()
-            
-            if hasattr(response, 'error') and response.error:
-                raise Exception(f"Category statistics update failed: {response.error}")
-            
-            print("Successfully updated category statistics")
+            progress.complete()
+            print(f"Upload {progress.run_id} marked complete")
             return True
-            
+
         except Exception as e:
-            print(f"Error updating category statistics: {e}")
+            print(f"Error completing upload: {e}")
             return False
 
-    def update_country_statistics(self) -> bool: #299
+    def run_post_ingest(self, snapshot_date: Optional[str]) -> bool:
         try:
-            # PostgreSQL関数を呼び出す
+            # サマリー・変化量・統計をサーバー側の1トランザクションで実行する
             response = self.supabase.rpc(
-                'update_country_statistics'
+                'run_post_ingest',
+                {'p_snapshot_ts': snapshot_date}
             ).execute()
-            
+
             if hasattr(response, 'error') and response.error:
-                raise Exception(f"Country statistics update failed: {response.error}")
-            
-            print("Successfully updated country statistics")
+                raise Exception(f"Post-ingest failed: {response.error}")
+
+            timings = response.data or []
+            total = sum(step['ms'] for step in timings)
+            print(f"Post-ingest steps finished in {total / 1000:.2f}s: "
+                  + ", ".join(f"{step['step']} {step['ms']:.0f}ms" for step in timings))
+            if any(step.get('timed_out') for step in timings):
+                print("Warning: Statistics calculation timed out, but continuing...")
             return True
-            
+
         except Exception as e:
-            print(f"Error updating country statistics: {e}")
+            print(f"Error running post-ingest steps: {e}")
             return False
 
-    def update_available_statistics(self) -> bool:
+    def run_maintenance(self, function: str, description: str) -> bool:
+        """Cleanup/ANALYZE after the post-ingest commit; a statement timeout only delays them to the next run"""
         try:
-            # PostgreSQL関数を呼び出す
-            response = self.supabase.rpc(
-                'update_available_statistics'
-            ).execute()
-            
+            response = self.supabase.rpc(function).execute()
+
             if hasattr(response, 'error') and response.error:
-                # タイムアウトエラーの場合は無視して続行
-                if '57014' in str(response.error):
-                    print("Warning: Available statistics calculation timed out, but continuing...")
-                    return True
-                raise Exception(f"Available statistics update failed: {response.error}")
-            
-            print("Successfully updated available statistics")
+                raise Exception(f"{description} failed: {response.error}")
+
+            print(f"Successfully finished {description.lower()}")
             return True
-            
+
         except Exception as e:
             # タイムアウトエラーの場合は無視して続行
             if '57014' in str(e):
-                print("Warning: Available statistics calculation timed out, but continuing...")
+                print(f"Warning: {description} timed out, but continuing...")
                 return True
-            print(f"Error updating available statistics: {e}")
+            print(f"Error running {description.lower()}: {e}")
             return False
 
-    def analyze_rich_list_tables(self) -> bool:
+    def carry_forward_summary(self, snapshot_date: str) -> bool:
         try:
-            # PostgreSQL関数を呼び出す
+            # 内容が前回と同じ場合は最新のサマリーを新しい日時で複製するだけにする
             response = self.supabase.rpc(
-                'analyze_rich_list_tables'
+                'carry_forward_rich_list_summary',
+                {'p_created_at': snapshot_date}
             ).execute()
             
             if hasattr(response, 'error') and response.error:
-                # タイムアウトエラーの場合は無視して続行
-                if '57014' in str(response.error):
-                    print("Warning: Analyze timed out, but continuing...")
-                    return True
-                raise Exception(f"Analyze failed: {response.error}")
-            
-            print("Successfully analyze")
+                raise Exception(f"Summary carry forward failed: {response.error}")
+                
+            print("Successfully carried summary forward")
             return True
             
         except Exception as e:
-            # タイムアウトエラーの場合は無視して続行
-            if '57014' in str(e):
-                print("Warning: Analyze timed out, but continuing...")
-                return True
-            print(f"Error analyze: {e}")
+            print(f"Error carrying summary forward: {e}")
             return False
 
 
 class RichListUploadProcessor:
     def __init__(self):
         self.uploader = None
+        self.change_detector = SnapshotChangeDetector()
 
-    def process(self):
-        temp_csv_path = "rich_list_temp.csv"
-        
+    def process(self, snapshot_path: str = "rich_list_temp.arrow"):
         try:
             print("Starting Supabase upload...")
             self.uploader = SupabaseUploader()
-            if not self.uploader.upload_from_csv(temp_csv_path):
-                raise Exception("Upload to Supabase failed")
-
-            print("Updating summary table...")
-            if not self.uploader.update_summary_table():
-                raise Exception("Summary table update failed")
-            
-            print("Calculating balance changes...")
-            if not self.uploader.update_balance_changes():
-                raise Exception("Balance changes calculation failed")
-
-            print("Calculating available changes...")
-            if not self.uploader.update_available_changes():
-                raise Exception("Available changes calculation failed")
-
-            print("Calculating category changes...")
-            if not self.uploader.update_category_changes():
-                raise Exception("Category changes calculation failed")
+            if self.change_detector.is_unchanged(snapshot_path):
+                self.carry_forward(snapshot_path)
+                self.remove_snapshot(snapshot_path)
+                print("Process completed successfully")
+                return
 
-            print("Calculating country changes...")
-            if not self.uploader.update_country_changes():
-                raise Exception("Country changes calculation failed")
-            
-            print("Cleaning up old statistics...")
-            if not self.uploader.cleanup_old_statistics():
-                raise Exception("Statistics cleanup failed")
-    
-            print("Calculating category statistics...")
-            if not self.uploader.update_category_statistics():
-                raise Exception("Country statistics calculation failed")
-
-            print("Calculating country statistics...")
-            if not self.uploader.update_country_statistics():
-                raise Exception("Country statistics calculation failed")
-
-            print("Calculating available statistics...")
-            if not self.uploader.update_available_statistics():
-                raise Exception("Country statistics calculation failed")
-            
-            print("Cleaning up old data...")
-            if not self.uploader.cleanup_old_data():
-                raise Exception("Data cleanup failed")
+            if not self.uploader.upload_from_snapshot(snapshot_path):
+                raise Exception("Upload to Supabase failed")
 
-            print("Analyze data...")
-            if not self.uploader.analyze_rich_list_tables():
-                raise Exception("Data analyze failed")
-
-            try:
-                os.remove(temp_csv_path)
-                print("Temporary CSV file cleaned up")
-            except Exception as e:
-                print(f"Warning: Could not delete temporary CSV file: {e}")
+            self.run_post_upload(snapshot_date_of(snapshot_path))
+            self.record_upload(snapshot_path)
+            self.remove_snapshot(snapshot_path)
 
             print("Process completed successfully")
             
@@ -395,14 +252,55 @@ class RichListUploadProcessor:
             print(f"Error during processing: {e}")
             raise
 
+    def run_post_upload(self, snapshot_date: str):
+        """Summary/changes/statistics for the uploaded snapshot, committed together so dashboards never see half of them"""
+        print("Running post-ingest steps...")
+        if not self.uploader.run_post_ingest(snapshot_date):
+            raise Exception("Post-ingest steps failed")
+
+        # 古いデータの削除とANALYZEは集計のトランザクションの外で行う
+        print("Cleaning up old data...")
+        if not self.uploader.run_maintenance('cleanup_old_rich_list_data', "Data cleanup"):
+            raise Exception("Data cleanup failed")
+
+        print("Analyze data...")
+        if not self.uploader.run_maintenance('analyze_rich_list_tables', "Analyze"):
+            raise Exception("Data analyze failed")
+
+    def carry_forward(self, snapshot_path: str):
+        """Same content as the last upload: bump the summary timestamp instead of inserting rows"""
+        print("Snapshot unchanged since last upload, carrying it forward...")
+        if not self.uploader.carry_forward_summary(snapshot_date_of(snapshot_path)):
+            raise Exception("Summary carry forward failed")
+        self.change_detector.record_carry_forward(snapshot_path)
+
+    def record_upload(self, snapshot_path: str):
+        changed = self.change_detector.changed_labels(snapshot_path)
+        if self.change_detector.previous is not None:
+            print(f"{len(changed)} grouped labels changed since last upload: {', '.join(changed[:20])}")
+        self.change_detector.record_upload(snapshot_path, snapshot_row_count(snapshot_path))
+
+    def remove_snapshot(self, snapshot_path: str):
+        try:
+            os.remove(snapshot_path)
+            print("Temporary snapshot file cleaned up")
+        except Exception as e:
+            print(f"Warning: Could not delete temporary snapshot file: {e}")
+
 
 def main():
     processor = RichListUploadProcessor()
-    try:
-        processor.process()
-    except Exception as e:
-        print(f"Fatal error: {e}")
-        sys.exit(1)
+    for attempt in range(1, UPLOAD_ATTEMPTS + 1):
+        try:
+            processor.process()
+            return
+        except Exception as e:
+            print(f"Upload attempt {attempt}/{UPLOAD_ATTEMPTS} failed: {e}")
+            if attempt < UPLOAD_ATTEMPTS:
+                print(f"Retrying in {UPLOAD_RETRY_DELAY} seconds...")
+                time.sleep(UPLOAD_RETRY_DELAY)
+    print("Fatal error: all upload attempts failed")
+    sys.exit(1)
 
 if __name__ == "__main__":
     main()
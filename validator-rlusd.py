@@ -1,17 +1,17 @@
 import asyncio
-import csv
 from typing import Optional, Tuple
 from dataclasses import dataclass
-import os
 
 from xrpl.asyncio.clients import AsyncJsonRpcClient
 from xrpl.models import AccountInfo, AccountObjects, AccountLines
 
+from snapshot_file import SnapshotUpdater
+
 @dataclass
 class ValidatedAccount:
     address: str
-    balance_xrp: float
-    escrow_xrp: float
+    balance_drops: int
+    escrow_drops: int
     balance_rlusd: float
     exists: bool
 
@@ -32,8 +32,8 @@ class XRPLBalanceValidator:
             await self.client._client.close()
         self.client = None
 
-    async def get_escrow_info(self, address: str) -> Optional[float]:
-        """Get escrow balance for an account"""
+    async def get_escrow_info(self, address: str) -> Optional[int]:
+        """Get escrow balance for an account (drops)"""
         for attempt in range(self.max_retries + 1):
             try:
                 response = await self.client.request(AccountObjects(
@@ -49,7 +49,7 @@ class XRPLBalanceValidator:
                     
                     escrows = response_dict['result']['account_objects']
                     return sum(
-                        float(escrow['Amount']) / 1000000 
+                        int(escrow['Amount'])
                         for escrow in escrows 
                         if isinstance(escrow, dict) and 'Amount' in escrow
                     )
@@ -118,14 +118,14 @@ class XRPLBalanceValidator:
                     'account_data' in response_dict['result'] and 
                     'Balance' in response_dict['result']['account_data']):
                     
-                    current_balance = float(response_dict['result']['account_data']['Balance']) / 1000000
+                    current_balance = int(response_dict['result']['account_data']['Balance'])
                     escrow_balance = await self.get_escrow_info(address) or 0
                     rlusd_balance = await self.get_rlusd_balance(address)
                     
                     return ValidatedAccount(
                         address=address,
-                        balance_xrp=current_balance,
-                        escrow_xrp=escrow_balance,
+                        balance_drops=current_balance,
+                        escrow_drops=escrow_balance,
                         balance_rlusd=rlusd_balance,
                         exists=True
                     )
@@ -136,8 +136,8 @@ class XRPLBalanceValidator:
                 
                 return ValidatedAccount(
                     address=address,
-                    balance_xrp=0,
-                    escrow_xrp=0,
+                    balance_drops=0,
+                    escrow_drops=0,
                     balance_rlusd=0,
                     exists=False
                 )
@@ -149,60 +149,53 @@ class XRPLBalanceValidator:
                 print(f"Error checking account {address}: {e}")
                 raise
 
-    async def validate_balances(self, csv_path: str, batch_size: int = 16):
-        """Validate balances for all accounts in the CSV"""
+    async def validate_balances(self, snapshot_path: str, batch_size: int = 16):
+        """Validate balances for all accounts in the snapshot"""
         print("Starting balance validation...")
-        temp_path = f"{csv_path}.temp"
         
         try:
             await self.setup_client()
             
-            # Read CSV
-            with open(csv_path, 'r', encoding='utf-8') as csvfile:
-                reader = csv.DictReader(csvfile)
-                entries = list(reader)
-
-            total = len(entries)
-            processed = 0
-            verified_count = 0
-            
-            # Prepare output CSV
-            with open(temp_path, 'w', newline='', encoding='utf-8') as tempfile:
-                fieldnames = ['rank', 'address', 'label', 'balance_xrp', 'escrow_xrp', 
-                            'percentage', 'balance_rlusd', 'domain', 'twitter', 'verified', 'snapshot_date',
-                            'exists']
-                writer = csv.DictWriter(tempfile, fieldnames=fieldnames)
-                writer.writeheader()
+            # スナップショットをmmapで開き、残高列をその場で書き換える
+            with SnapshotUpdater(snapshot_path) as snapshot:
+                addresses = snapshot.column('address').to_pylist()
+
+                total = len(addresses)
+                processed = 0
+                verified_count = 0
 
                 # Process in batches
                 for i in range(0, total, batch_size):
-                    batch = entries[i:i + batch_size]
+                    batch = addresses[i:i + batch_size]
                     tasks = []
                     
-                    for entry in batch:
-                        tasks.append(self.check_account(entry['address']))
+                    for address in batch:
+                        tasks.append(self.check_account(address))
                     
                     results = await asyncio.gather(*tasks, return_exceptions=True)
                     
-                    for entry, result in zip(batch, results):
+                    for index, (address, result) in enumerate(zip(batch, results), i):
                         if isinstance(result, Exception):
-                            print(f"Error processing {entry['address']}: {result}")
-                            writer.writerow(entry)  # Keep original data
-                            continue
+                            print(f"Error processing {address}: {result}")
+                            continue  # Keep original data
                             
                         if result.exists:
-                            entry['balance_xrp'] = result.balance_xrp
-                            entry['escrow_xrp'] = result.escrow_xrp
-                            entry['balance_rlusd'] = result.balance_rlusd
-                            entry['exists'] = True
+                            snapshot.update(
+                                index,
+                                balance_drops=result.balance_drops,
+                                escrow_drops=result.escrow_drops,
+                                balance_rlusd=result.balance_rlusd,
+                                exists=True
+                            )
                             verified_count += 1
                         else:
-                            entry['balance_xrp'] = 0
-                            entry['escrow_xrp'] = 0
-                            entry['balance_rlusd'] = 0
-                            entry['exists'] = False
-                        
-                        writer.writerow(entry)
+                            snapshot.update(
+                                index,
+                                balance_drops=0,
+                                escrow_drops=0,
+                                balance_rlusd=0,
+                                exists=False
+                            )
                     
                     processed += len(batch)
                     if processed % 100 == 0:
@@ -212,23 +205,19 @@ class XRPLBalanceValidator:
                     if i + batch_size < total:
                         await asyncio.sleep(1)  # Rate limiting
 
-            # Replace original file with validated data
-            os.replace(temp_path, csv_path)
             print(f"\nBalance validation completed:")
             print(f"Total processed: {total}")
             print(f"Successfully verified: {verified_count}")
             
         except Exception as e:
             print(f"Error during balance validation: {e}")
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
             raise
         finally:
             await self.cleanup_client()
 
 async def main():
     validator = XRPLBalanceValidator()
-    await validator.validate_balances("rlusd_rich_list_temp.csv")
+    await validator.validate_balances("rlusd_rich_list_temp.arrow")
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
@@ -1,20 +1,32 @@
 import asyncio
-import csv
-from typing import Optional, Tuple
+from typing import Dict, Optional, Tuple
 from dataclasses import dataclass
-import os
 
 #from xrpl.asyncio.clients import AsyncJsonRpcClient
 from xrpl.asyncio.clients import AsyncWebsocketClient
 from xrpl.models import AccountInfo, AccountObjects
 
+from snapshot_file import SnapshotUpdater
+from snapshot_state import SnapshotChangeDetector
+
+def batch_size_for(total: int, minimum: int = 16, maximum: int = 256) -> int:
+    """Accounts checked concurrently per batch: 16 for the top 10k, growing with the row count"""
+    # 上位10,000件で16件/バッチ（約625バッチ）になる比率で、ノードの負荷を考えて上限を設ける
+    return max(minimum, min(maximum, -(-total // 625)))
+
 @dataclass
 class ValidatedAccount:
     address: str
-    balance_xrp: float
-    escrow_xrp: float
+    balance_drops: int
+    escrow_drops: int
     exists: bool
 
+    def snapshot_values(self) -> Dict:
+        """Column values to write back into the snapshot row"""
+        if not self.exists:
+            return {'balance_drops': 0, 'escrow_drops': 0, 'exists': False}
+        return {'balance_drops': self.balance_drops, 'escrow_drops': self.escrow_drops, 'exists': True}
+
 class XRPLBalanceValidator:
     def __init__(self, node_url="wss://s1.ripple.com", max_retries=2, retry_delay=1):
         self.node_url = node_url
@@ -41,8 +53,8 @@ class XRPLBalanceValidator:
     #        await self.client._client.close()
     #    self.client = None
 
-    async def get_escrow_info(self, address: str) -> Optional[float]:
-        """Get escrow balance for an account"""
+    async def get_escrow_info(self, address: str) -> Optional[int]:
+        """Get escrow balance for an account (drops)"""
         for attempt in range(self.max_retries + 1):
             try:
                 response = await self.client.request(AccountObjects(
@@ -58,7 +70,7 @@ class XRPLBalanceValidator:
                     
                     escrows = response_dict['result']['account_objects']
                     return sum(
-                        float(escrow['Amount']) / 1000000 
+                        int(escrow['Amount'])
                         for escrow in escrows 
                         if isinstance(escrow, dict) and 'Amount' in escrow
                     )
@@ -92,13 +104,13 @@ class XRPLBalanceValidator:
                     'account_data' in response_dict['result'] and 
                     'Balance' in response_dict['result']['account_data']):
                     
-                    current_balance = float(response_dict['result']['account_data']['Balance']) / 1000000
+                    current_balance = int(response_dict['result']['account_data']['Balance'])
                     escrow_balance = await self.get_escrow_info(address) or 0
                     
                     return ValidatedAccount(
                         address=address,
-                        balance_xrp=current_balance,
-                        escrow_xrp=escrow_balance,
+                        balance_drops=current_balance,
+                        escrow_drops=escrow_balance,
                         exists=True
                     )
                 
@@ -108,8 +120,8 @@ class XRPLBalanceValidator:
                 
                 return ValidatedAccount(
                     address=address,
-                    balance_xrp=0,
-                    escrow_xrp=0,
+                    balance_drops=0,
+                    escrow_drops=0,
                     exists=False
                 )
                     
@@ -120,58 +132,41 @@ class XRPLBalanceValidator:
                 print(f"Error checking account {address}: {e}")
                 raise
 
-    async def validate_balances(self, csv_path: str, batch_size: int = 16):
-        """Validate balances for all accounts in the CSV"""
+    async def validate_balances(self, snapshot_path: str, batch_size: Optional[int] = None):
+        """Validate balances for all accounts in the snapshot"""
         print("Starting balance validation...")
-        temp_path = f"{csv_path}.temp"
         
         try:
             await self.setup_client()
             
-            # Read CSV
-            with open(csv_path, 'r', encoding='utf-8') as csvfile:
-                reader = csv.DictReader(csvfile)
-                entries = list(reader)
-
-            total = len(entries)
-            processed = 0
-            verified_count = 0
-            
-            # Prepare output CSV
-            with open(temp_path, 'w', newline='', encoding='utf-8') as tempfile:
-                fieldnames = ['rank', 'address', 'label', 'balance_xrp', 'escrow_xrp', 
-                            'percentage', 'domain', 'twitter', 'verified', 'snapshot_date',
-                            'exists']
-                writer = csv.DictWriter(tempfile, fieldnames=fieldnames)
-                writer.writeheader()
+            # スナップショットをmmapで開き、残高列をその場で書き換える
+            with SnapshotUpdater(snapshot_path) as snapshot:
+                addresses = snapshot.column('address').to_pylist()
+
+                total = len(addresses)
+                batch_size = batch_size or batch_size_for(total)
+                print(f"Validating {total} accounts, {batch_size} at a time")
+                processed = 0
+                verified_count = 0
 
                 # Process in batches
                 for i in range(0, total, batch_size):
-                    batch = entries[i:i + batch_size]
+                    batch = addresses[i:i + batch_size]
                     tasks = []
                     
-                    for entry in batch:
-                        tasks.append(self.check_account(entry['address']))
+                    for address in batch:
+                        tasks.append(self.check_account(address))
                     
                     results = await asyncio.gather(*tasks, return_exceptions=True)
                     
-                    for entry, result in zip(batch, results):
+                    for index, (address, result) in enumerate(zip(batch, results), i):
                         if isinstance(result, Exception):
-                            print(f"Error processing {entry['address']}: {result}")
-                            writer.writerow(entry)  # Keep original data
-                            continue
+                            print(f"Error processing {address}: {result}")
+                            continue  # Keep original data
                             
+                        snapshot.update(index, **result.snapshot_values())
                         if result.exists:
-                            entry['balance_xrp'] = result.balance_xrp
-                            entry['escrow_xrp'] = result.escrow_xrp
-                            entry['exists'] = True
                             verified_count += 1
-                        else:
-                            entry['balance_xrp'] = 0
-                            entry['escrow_xrp'] = 0
-                            entry['exists'] = False
-                        
-                        writer.writerow(entry)
                     
                     processed += len(batch)
                     if processed % 100 == 0:
@@ -181,23 +176,24 @@ class XRPLBalanceValidator:
                     if i + batch_size < total:
                         await asyncio.sleep(1)  # Rate limiting
 
-            # Replace original file with validated data
-            os.replace(temp_path, csv_path)
             print(f"\nBalance validation completed:")
             print(f"Total processed: {total}")
             print(f"Successfully verified: {verified_count}")
             
         except Exception as e:
             print(f"Error during balance validation: {e}")
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
             raise
         finally:
             await self.cleanup_client()
 
 async def main():
+    snapshot_path = "rich_list_temp.arrow"
+    # 前回アップロードと同じ内容ならアップロード側で持ち越すので検証も不要
+    if SnapshotChangeDetector().is_unchanged(snapshot_path):
+        print("Snapshot unchanged since last upload, skipping validation")
+        return
     validator = XRPLBalanceValidator()
-    await validator.validate_balances("rich_list_temp.csv")
+    await validator.validate_balances(snapshot_path)
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,177 @@
+import asyncio
+import json
+import os
+import re
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+
+@dataclass
+class CachedResponse:
+    status: int
+    data: Any = None
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+
+@dataclass
+class CacheEntry:
+    data: Any
+    etag: Optional[str]
+    last_modified: Optional[str]
+    fetched_at: float
+
+    @property
+    def age(self) -> float:
+        return time.time() - self.fetched_at
+
+def looks_like_html(raw: bytes) -> bool:
+    """Detect HTML pages (WAF/Cloudflare/error pages) served instead of JSON"""
+    head = raw[:2048].lstrip().lower()
+    return (head.startswith(b"<!doctype html") or head.startswith(b"<html")
+            or b"cf-ray" in head or b"attention required" in head)
+
+def sniff_html(text: str) -> Optional[str]:
+    """HTMLっぽい原因をざっくり推測"""
+    t = text.lower()
+    if "cf-ray" in t or "cloudflare" in t or "attention required" in t:
+        return "Cloudflareブロック/チャレンジの可能性"
+    if "<html" in t or "<!doctype html" in t:
+        # XRPSCANの通常HTMLか、エラーページか、CDNブロックか
+        if "xrpscan" in t:
+            return "XRPSCANのHTMLページを返している（APIではなくWeb側/リダイレクトの可能性）"
+        return "HTMLページを返している（WAF/エラーページ/リダイレクト先の可能性）"
+    return None
+
+class XRPScanResponseError(Exception):
+    """XRPScan answered, but not with the JSON we asked for"""
+
+    def __init__(self, message: str, status: Optional[int] = None,
+                 content_type: str = "", preview: str = ""):
+        super().__init__(message)
+        self.status = status
+        self.content_type = content_type
+        self.preview = preview
+
+    @classmethod
+    async def from_response(cls, response) -> 'XRPScanResponseError':
+        preview = (await response.content.read(2048)).decode("utf-8", errors="replace")
+        return cls(
+            f"API request failed with status: {response.status}",
+            status=response.status,
+            content_type=response.headers.get('Content-Type', ''),
+            preview=preview
+        )
+
+class XRPScanCache:
+    """On-disk cache for XRPScan API responses with ETag/If-Modified-Since revalidation"""
+
+    def __init__(self, cache_dir: str = ".xrpscan_cache", ttl: int = 6 * 3600,
+                 stale_while_revalidate: int = 24 * 3600):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.stale_while_revalidate = stale_while_revalidate
+        self._revalidations: Set[asyncio.Task] = set()
+
+    def _paths(self, key: str):
+        name = re.sub(r'[^A-Za-z0-9_.-]', '_', key.strip('/'))
+        return (os.path.join(self.cache_dir, f"{name}.json"),
+                os.path.join(self.cache_dir, f"{name}.meta.json"))
+
+    def _write_atomic(self, path: str, payload: Any):
+        temp_path = f"{path}.temp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(payload, f)
+        os.replace(temp_path, path)
+
+    def load(self, key: str) -> Optional[CacheEntry]:
+        body_path, meta_path = self._paths(key)
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            with open(body_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return CacheEntry(
+            data=data,
+            etag=meta.get('etag'),
+            last_modified=meta.get('last_modified'),
+            fetched_at=float(meta.get('fetched_at', 0))
+        )
+
+    def store(self, key: str, response: CachedResponse):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        body_path, meta_path = self._paths(key)
+        # 本文を先に書き、メタデータの置き換えで確定させる
+        self._write_atomic(body_path, response.data)
+        self._write_atomic(meta_path, {
+            'etag': response.etag,
+            'last_modified': response.last_modified,
+            'fetched_at': time.time()
+        })
+
+    def touch(self, key: str, entry: CacheEntry):
+        """Mark an entry as revalidated after a 304 response"""
+        _, meta_path = self._paths(key)
+        entry.fetched_at = time.time()
+        self._write_atomic(meta_path, {
+            'etag': entry.etag,
+            'last_modified': entry.last_modified,
+            'fetched_at': entry.fetched_at
+        })
+
+    def conditional_headers(self, entry: Optional[CacheEntry]) -> Dict[str, str]:
+        headers = {}
+        if entry is None:
+            return headers
+        if entry.etag:
+            headers['If-None-Match'] = entry.etag
+        if entry.last_modified:
+            headers['If-Modified-Since'] = entry.last_modified
+        return headers
+
+    async def _revalidate(self, key: str, entry: Optional[CacheEntry],
+                          fetch: Callable[[Dict[str, str]], Awaitable[CachedResponse]]) -> Any:
+        response = await fetch(self.conditional_headers(entry))
+        if response.status == 304 and entry is not None:
+            self.touch(key, entry)
+            return entry.data
+        if response.status != 200:
+            raise Exception(f"Unexpected status while revalidating {key}: {response.status}")
+        self.store(key, response)
+        return response.data
+
+    async def _revalidate_in_background(self, key: str, entry: CacheEntry, fetch):
+        try:
+            await self._revalidate(key, entry, fetch)
+        except Exception as e:
+            print(f"Background revalidation of {key} failed: {e}")
+
+    async def get(self, key: str,
+                  fetch: Callable[[Dict[str, str]], Awaitable[CachedResponse]]) -> Any:
+        """Return cached data for key, revalidating with fetch(headers) when needed"""
+        entry = self.load(key)
+
+        if entry is not None and entry.age < self.ttl:
+            return entry.data
+
+        if entry is not None and entry.age < self.ttl + self.stale_while_revalidate:
+            print(f"Serving stale {key} (age {entry.age:.0f}s), revalidating in background")
+            task = asyncio.create_task(self._revalidate_in_background(key, entry, fetch))
+            self._revalidations.add(task)
+            task.add_done_callback(self._revalidations.discard)
+            return entry.data
+
+        try:
+            return await self._revalidate(key, entry, fetch)
+        except Exception as e:
+            if entry is None:
+                raise
+            # XRPScanがHTMLやエラーを返した場合は最後に成功したデータを使う
+            print(f"Using last-known-good {key} from cache (age {entry.age:.0f}s): {e}")
+            return entry.data
+
+    async def wait_for_revalidations(self):
+        """Wait for pending background revalidations before the session closes"""
+        if self._revalidations:
+            await asyncio.gather(*list(self._revalidations), return_exceptions=True)
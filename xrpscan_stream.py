@@ -0,0 +1,70 @@
+import codecs
+import json
+from typing import Any, AsyncIterator
+
+_WHITESPACE = ' \t\r\n'
+_DELIMITERS = _WHITESPACE + ',]'
+
+async def iter_json_array(stream, chunk_size: int = 64 * 1024) -> AsyncIterator[Any]:
+    """Yield the elements of a top-level JSON array while the body is still downloading
+
+    stream is an aiohttp StreamReader (response.content). Only the element
+    currently being decoded is buffered, so memory does not grow with the
+    size of the array.
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder('utf-8')()
+    buffer = ''
+    pos = 0
+    started = False
+    finished = False
+    eof = False
+
+    chunks = stream.iter_chunked(chunk_size)
+    while not finished:
+        try:
+            chunk = await chunks.__anext__()
+        except StopAsyncIteration:
+            chunk = b''
+            eof = True
+
+        buffer = buffer[pos:] + utf8.decode(chunk, final=eof)
+        pos = 0
+
+        while True:
+            while pos < len(buffer) and buffer[pos] in _WHITESPACE:
+                pos += 1
+            if pos >= len(buffer):
+                break
+
+            if not started:
+                # HTML（WAF/エラーページ）などは最初の1文字で弾く
+                if buffer[pos] != '[':
+                    raise ValueError(f"Expected a JSON array, got {buffer[pos:pos + 40]!r}")
+                started = True
+                pos += 1
+                continue
+
+            if buffer[pos] == ',':
+                pos += 1
+                continue
+            if buffer[pos] == ']':
+                finished = True
+                break
+
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                break  # 要素の途中なので次のチャンクを待つ
+
+            # 数値などはチャンク境界で途切れている可能性があるため、区切り文字まで確認する
+            if not eof and (end >= len(buffer) or buffer[end] not in _DELIMITERS):
+                break
+
+            pos = end
+            yield item
+
+        if eof and not finished:
+            raise ValueError("Unexpected end of JSON array")